@@ -1,6 +1,7 @@
 import json
 import os
 import sys
+
 from dotenv import load_dotenv
 
 import chainlit as cl
@@ -10,6 +11,7 @@ from worksheets.agent import Agent
 from worksheets.annotation_utils import get_agent_action_schemas, get_context_schema
 from worksheets.chat_chainlit import generate_next_turn_cl
 from worksheets.modules import CurrentDialogueTurn
+from worksheets.session_store import SessionStore
 
 load_dotenv()
 
@@ -63,29 +65,39 @@ def convert_to_json(dialogue: list[CurrentDialogueTurn]):
 
 
 
-@cl.on_chat_start
-async def initialize():
-    cl.user_session.set(
-        "bot",
-        Agent(
-            botname="VRChatBot",
-            description="You an assistant at VRChat and help users with all their queries related to finding events and adding them to their calendar. You can search for events, ask me anything about the event and add the interested one to calendar",
-            prompt_dir=prompt_dir,
-            starting_prompt="""Hello! I'm your VRChat Guide. I can help you with:
+# The agent is loaded once, when the app starts, and not in the handler of the first
+# chat where it would block the event loop. The worksheets, apis and compiled code are
+# shared by all the chats, each chat only has its own GenieSession.
+bot = Agent(
+    botname="VRChatBot",
+    description="You an assistant at VRChat and help users with all their queries related to finding events and adding them to their calendar. You can search for events, ask me anything about the event and add the interested one to calendar",
+    prompt_dir=prompt_dir,
+    starting_prompt="""Hello! I'm your VRChat Guide. I can help you with:
 - Create / Update your VRChat profile with your preferences
 - Explore / Learn about upcoming VRChat events and add them to your calendar
 - Asking me any question related to the details of the VRChat events I purposed
 
 How can I help you today?""",
-            args={},
-            api=[update_profile, add_event],
-            knowledge_base=suql_knowledge,
-            knowledge_parser=suql_parser,
-        ).load_from_gsheet(
-            gsheet_id="1aLyf6kkOpKYTrnvI92kHdLVip1ENCEW5aTuoSZWy2fU",
-        ),
-    )
+    args={},
+    api=[update_profile, add_event],
+    knowledge_base=suql_knowledge,
+    knowledge_parser=suql_parser,
+).load_from_gsheet(
+    gsheet_id="1aLyf6kkOpKYTrnvI92kHdLVip1ENCEW5aTuoSZWy2fU",
+)
+
 
+# The sessions of the chats, the idle ones are saved to disk when the sessions in
+# memory are over GENIE_SESSION_MEMORY_BYTES
+session_store = SessionStore(
+    bot,
+    os.path.join(current_dir, "sessions.db"),
+    max_bytes=int(os.getenv("GENIE_SESSION_MEMORY_BYTES", 64 * 1024 * 1024)),
+)
+
+
+@cl.on_chat_start
+async def initialize():
     if not os.path.exists(os.path.join(current_dir, "user_conversation")):
         os.mkdir(os.path.join(current_dir, "user_conversation"))
     user_id = cl.user_session.get("id")
@@ -94,19 +106,18 @@ How can I help you today?""",
         os.mkdir(os.path.join(current_dir, "user_conversation", user_id))
     await cl.Message(
         f"Here is your user id: **{user_id}**\n"
-        + cl.user_session.get("bot").starting_prompt
+        + bot.starting_prompt
         + f"\n\nPlease be a difficult user who asks several questions, here are some examples: {unhappy_paths}"
     ).send()
 
 
 @cl.on_message
 async def get_user_message(message):
-    bot = cl.user_session.get("bot")
-    await generate_next_turn_cl(message.content, bot)
-
-    cl.user_session.set("bot", bot)
+    with session_store.activate(cl.user_session.get("id")):
+        await generate_next_turn_cl(message.content, bot)
 
-    response = bot.dlg_history[-1].system_response
+        response = bot.dlg_history[-1].system_response
+    logger.info(f"Session store: {session_store.stats()}")
     await cl.Message(response).send()
 
 
@@ -128,8 +139,8 @@ def on_chat_end():
             )
         )
 
-    bot = cl.user_session.get("bot")
-    if len(bot.dlg_history):
+    session = session_store.get(user_id)
+    if len(session.dlg_history):
         with open(
             os.path.join(
                 current_dir,
@@ -139,8 +150,9 @@ def on_chat_end():
             ),
             "w",
         ) as f:
-            json.dump(convert_to_json(bot.dlg_history), f)
+            json.dump(convert_to_json(session.dlg_history), f)
     else:
         os.rmdir(os.path.join(current_dir, "user_conversation", user_id))
+    session_store.discard(user_id)
 
     logger.info(f"Chat ended for user {user_id}")
@@ -0,0 +1,193 @@
+"""Equivalence check and micro-benchmark for the admission rules of AgentActs.
+
+The previous AgentActs grouped all the actions by class name on every call to
+`should_add` and `can_have_other_acts`, and compared every ReportAgentAct and
+ProposeAgentAct pairwise. This script replays random sequences of agent acts
+(with repeated, unhashable and mixed queries, messages and params) through both
+implementations, checks that they admit exactly the same acts and agree on
+`can_have_other_acts` after every step, and then times a turn with many reports.
+
+Usage:
+    python scripts/benchmark_agent_acts.py [--sequences 2000] [--reports 200] [--seed 0]
+"""
+
+import argparse
+import random
+import time
+
+from loguru import logger
+
+from worksheets.environment import (
+    Action,
+    AgentActs,
+    AskAgentAct,
+    AskForConfirmationAgentAct,
+    GenieField,
+    GenieResult,
+    GenieRuntime,
+    GenieValue,
+    ProposeAgentAct,
+    ReportAgentAct,
+    get_genie_fields_from_ws,
+    same_worksheet,
+)
+from worksheets.from_spreadsheet import create_class
+
+
+class LegacyAgentActs:
+    """The rules of AgentActs before the actions were indexed."""
+
+    def __init__(self):
+        self.actions = []
+
+    def add(self, action):
+        if self.should_add(action):
+            self.actions.append(action)
+
+    def should_add(self, incoming_action):
+        acts_to_action = {}
+        for action in self.actions:
+            acts_to_action.setdefault(action.__class__.__name__, []).append(action)
+
+        if incoming_action.__class__.__name__ == "ReportAgentAct":
+            for action in acts_to_action.get("ReportAgentAct", []):
+                if (
+                    action.query == incoming_action.query
+                    and action.message == incoming_action.message
+                ):
+                    return False
+            return True
+        elif incoming_action.__class__.__name__ == "ProposeAgentAct":
+            if (
+                "AskAgentAct" in acts_to_action
+                or "AskForConfirmationAgentAct" in acts_to_action
+            ):
+                return False
+            for action in acts_to_action.get("ProposeAgentAct", []):
+                if action.params == incoming_action.params and same_worksheet(
+                    action.ws, incoming_action.ws
+                ):
+                    return False
+            return True
+        elif incoming_action.__class__.__name__ in (
+            "AskAgentAct",
+            "AskForConfirmationAgentAct",
+        ):
+            return self.can_have_other_acts()
+
+    def can_have_other_acts(self):
+        names = {action.__class__.__name__ for action in self.actions}
+        return not (
+            "ProposeAgentAct" in names
+            or "AskAgentAct" in names
+            or "AskForConfirmationAgentAct" in names
+        )
+
+
+def build_worksheets():
+    bot = GenieRuntime(name="benchmark", prompt_dir=None, api=[])
+    worksheets = []
+    for name in ["Restaurant", "Booking"]:
+        fields = [
+            {
+                "slottype": str,
+                "name": field_name,
+                "description": "",
+                "predicate": "",
+                "actions": Action(""),
+            }
+            for field_name in ["name", "time"]
+        ]
+        _, ws = create_class(name, fields, "worksheet", "", Action(""), "", [])
+        bot.add_worksheet(ws)
+        worksheets.append(ws)
+    return worksheets
+
+
+def random_value(rng):
+    return rng.choice(
+        [
+            None,
+            "a",
+            "b",
+            1,
+            GenieValue("a"),
+            ["a"],
+            {"x": "a"},
+            {"x": ["a"]},
+        ]
+    )
+
+
+def random_act(rng, worksheets):
+    kind = rng.choice(["report", "report", "report", "propose", "ask", "confirm"])
+    if kind == "report":
+        query = rng.choice(
+            [
+                None,
+                "q1",
+                "q2",
+                GenieField("str", "query", value=rng.choice(["q1", "q2"])),
+            ]
+        )
+        message = rng.choice(
+            [random_value(rng), GenieResult(rng.choice([["r"], "r"]), None, "answer")]
+        )
+        return ReportAgentAct(query, message)
+
+    ws_class = rng.choice(worksheets)
+    ws = ws_class(name=rng.choice(["a", "b"]), time=rng.choice([None, "7"]))
+    if kind == "propose":
+        params = rng.choice([{"name": "a"}, {"name": random_value(rng)}, {}, None])
+        return ProposeAgentAct(ws, params)
+    field = get_genie_fields_from_ws(ws)[0]
+    if kind == "ask":
+        return AskAgentAct(ws, field)
+    return AskForConfirmationAgentAct(ws, field)
+
+
+def check_equivalence(sequences, rng, worksheets):
+    for _ in range(sequences):
+        legacy = LegacyAgentActs()
+        acts = AgentActs({})
+        for _ in range(rng.randint(1, 12)):
+            act = random_act(rng, worksheets)
+            assert bool(legacy.should_add(act)) == bool(acts.should_add(act)), act
+            legacy.add(act)
+            acts.add(act)
+            assert legacy.actions == acts.actions
+            assert legacy.can_have_other_acts() == acts.can_have_other_acts()
+
+
+def time_reports(acts, num_reports):
+    start = time.perf_counter()
+    for i in range(num_reports):
+        acts.add(ReportAgentAct(f"query {i % (num_reports // 2)}", f"message {i}"))
+        acts.can_have_other_acts()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sequences", type=int, default=2000)
+    parser.add_argument("--reports", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    logger.remove()
+    rng = random.Random(args.seed)
+    worksheets = build_worksheets()
+
+    check_equivalence(args.sequences, rng, worksheets)
+    print(f"{args.sequences} random sequences: same acts admitted")
+
+    legacy_time = time_reports(LegacyAgentActs(), args.reports)
+    indexed_time = time_reports(AgentActs({}), args.reports)
+    print(f"{args.reports} reports")
+    print(f"{'':<10}{'ms':>10}")
+    print(f"{'legacy':<10}{legacy_time * 1000:>10.3f}")
+    print(f"{'indexed':<10}{indexed_time * 1000:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
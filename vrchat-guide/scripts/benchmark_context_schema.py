@@ -0,0 +1,250 @@
+"""Equivalence check and micro-benchmark for the cached state schema of a context.
+
+Replays a long session where every turn adds an answer whose results are appended
+to a list variable, and modifies a few worksheets (string values, values that are
+results of answers, confirmations). After every turn, the state schema rendered by
+get_context_schema must be the same as the previous rendering, which rendered every
+variable and scanned all the list variables for every result. The time per turn is
+reported for both.
+
+Usage:
+    python scripts/benchmark_context_schema.py [--turns 200] [--results 5] [--seed 0]
+"""
+
+import argparse
+import random
+import time
+
+from loguru import logger
+
+from worksheets.annotation_utils import context_schema_cache, get_context_schema
+from worksheets.environment import (
+    Action,
+    Answer,
+    GenieResult,
+    GenieRuntime,
+    GenieType,
+    GenieWorksheet,
+    find_list_variable,
+    get_genie_fields_from_ws,
+    get_variable_name,
+)
+from worksheets.from_spreadsheet import create_class
+
+
+def legacy_schema_without_type(ws, context):
+    parameters = []
+    for field in get_genie_fields_from_ws(ws):
+        if field.value is None:
+            continue
+        if isinstance(field.value, str):
+            if field.value == "":
+                continue
+            if field.confirmed:
+                parameters.append(f"{field.name} = confirmed({repr(field.value)})")
+            else:
+                parameters.append(f"{field.name} = {repr(field.value)}")
+        elif isinstance(field._value, GenieResult):
+            if isinstance(field.value, list):
+                parent_var_name = None
+                indices = []
+                result_strings = []
+                for val in field.value:
+                    if isinstance(val, GenieType):
+                        var_name, idx = find_list_variable(val, context)
+                        if var_name is None and idx is None:
+                            result_strings.append(val)
+                        else:
+                            parent_var_name = var_name
+                            indices.append(idx)
+                    else:
+                        result_strings.append(val)
+                if parent_var_name:
+                    indices_str = [f"{parent_var_name}[{idx}]" for idx in indices]
+                    result_strings = "[" + ", ".join(indices_str) + "]"
+            if len(result_strings):
+                parameters.append(f"{field.name} = {str(result_strings)}")
+            else:
+                parameters.append(f"{field.name} = {repr(field.value)}")
+        elif isinstance(field.value, GenieType):
+            var_name, idx = find_list_variable(field.value, context)
+            if var_name is None and idx is None:
+                if field.confirmed:
+                    parameters.append(f"{field.name} = confirmed({repr(field.value)})")
+                else:
+                    parameters.append(f"{field.name} = {repr(field.value)}")
+            else:
+                if field.confirmed:
+                    parameters.append(f"{field.name} = confirmed({var_name}[{idx}])")
+                else:
+                    parameters.append(f"{field.name} = {var_name}[{idx}]")
+        else:
+            var_name = get_variable_name(field.value, context)
+            if isinstance(var_name, str):
+                if field.confirmed:
+                    parameters.append(f"{field.name} = confirmed({repr(var_name)})")
+                else:
+                    parameters.append(f"{field.name} = {var_name}")
+            else:
+                val = field.schema_without_type(no_none=True)
+                if val:
+                    parameters.append(val)
+    return f"{ws.__class__.__name__}({', '.join([str(param) for param in parameters])})"
+
+
+def legacy_handle_genie_type(key, value, context, response_generator):
+    schema = ""
+    if isinstance(value, GenieType) or key.startswith("__"):
+        return
+    if isinstance(value, Answer):
+        if value.query.value is not None and response_generator:
+            schema += f"{key} = answer({value.nl_query!r}, sql={value.query.value!r})\n"
+        else:
+            schema += f"{key} = answer({value.nl_query!r})\n"
+        if value.result:
+            res = value.result.value if hasattr(value.result, "value") else value.result
+            if isinstance(res, list):
+                parent_var_name = None
+                indices = []
+                result_strings = []
+                for val in res:
+                    if isinstance(val, GenieType):
+                        var_name, idx = find_list_variable(val, context)
+                        if var_name is None and idx is None:
+                            result_strings.append(val)
+                        else:
+                            parent_var_name = var_name
+                            indices.append(idx)
+                    else:
+                        result_strings.append(val)
+                if parent_var_name:
+                    indices_str = [f"{parent_var_name}[{idx}]" for idx in indices]
+                    result_strings = "[" + ", ".join(indices_str) + "]"
+            else:
+                result_strings = (
+                    legacy_schema_without_type(res, context)
+                    if isinstance(res, GenieWorksheet)
+                    else res
+                )
+            schema += key + ".result = " + str(result_strings) + "\n"
+        else:
+            schema += key + ".result = None\n"
+    elif isinstance(value, GenieWorksheet):
+        if value.__class__.__name__ == "MoreFieldInfo":
+            return
+        schema += f"{key} = {legacy_schema_without_type(value, context)}\n"
+        if hasattr(value, "result") and value.result:
+            schema += key + ".result = " + str(value.result.value) + "\n"
+    return schema
+
+
+def legacy_get_context_schema(context, response_generator=False):
+    schema = ""
+    for key, value in context.context.items():
+        if isinstance(value, list):
+            if all(isinstance(val, GenieType) for val in value):
+                schema += key + " = " + str(value) + "\n"
+        else:
+            new_schema = legacy_handle_genie_type(
+                key, value, context, response_generator
+            )
+            if new_schema:
+                schema += new_schema
+    return schema.replace("\\", "")
+
+
+def build_runtime():
+    bot = GenieRuntime(name="benchmark", prompt_dir=None, api=[])
+
+    def fields(*specs):
+        return [
+            {"slottype": slottype, "name": name, "actions": Action("")}
+            for name, slottype in specs
+        ]
+
+    _, event = create_class(
+        "Event",
+        fields(("event_name", str), ("location", str)),
+        "type",
+        "",
+        Action(""),
+        "",
+        [],
+    )
+    _, booking = create_class(
+        "Booking",
+        fields(("username", str), ("event", event), ("notes", str)),
+        "worksheet",
+        "",
+        Action(""),
+        "",
+        [],
+    )
+    bot.add_worksheet(event)
+    bot.add_worksheet(booking)
+    return bot, event, booking
+
+
+def run_session(turns, num_results, seed, get_schema):
+    rng = random.Random(seed)
+    bot, event, booking = build_runtime()
+    context = bot.context
+    schemas = []
+    elapsed = 0.0
+    for turn in range(turns):
+        answer = Answer(f"SELECT * FROM events LIMIT {turn}", {}, [], f"events {turn}")
+        results = [
+            event(event_name=f"event {turn}.{i}", location=rng.choice(["a", "b"]))
+            for i in range(num_results)
+        ]
+        for result in results:
+            context.set("event", result)
+        answer.result = GenieResult(results, answer, f"answer_{turn}")
+        context.set(f"answer_{turn}", answer)
+
+        if turn % 10 == 0:
+            context.set(f"booking_{turn}", booking(username=f"user {turn}"))
+        bookings = [key for key in context.context if key.startswith("booking_")]
+        for key in rng.sample(bookings, min(2, len(bookings))):
+            ws = context.context[key]
+            choice = rng.randrange(3)
+            if choice == 0:
+                ws.notes = f"notes {turn}"
+            elif choice == 1:
+                ws.event = rng.choice(results)
+            else:
+                ws.event = GenieResult(results, answer, f"answer_{turn}")
+            if rng.random() < 0.3:
+                ws.username.confirmed = True
+
+        start = time.perf_counter()
+        schemas.append((get_schema(context), get_schema(context, True)))
+        elapsed += time.perf_counter() - start
+    return schemas, elapsed, context
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--results", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    logger.remove()
+    legacy, legacy_time, _ = run_session(
+        args.turns, args.results, args.seed, legacy_get_context_schema
+    )
+    cached, cached_time, context = run_session(
+        args.turns, args.results, args.seed, get_context_schema
+    )
+    assert legacy == cached
+
+    print(f"{args.turns} turns x {args.results} results: same state schema")
+    print(f"{'':<10}{'ms/turn':>10}")
+    print(f"{'rendered':<10}{legacy_time * 1000 / args.turns:>10.3f}")
+    print(f"{'cached':<10}{cached_time * 1000 / args.turns:>10.3f}")
+    print(context_schema_cache(context).stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Micro-benchmark for reading the fields of worksheets.
+
+Compares the previous implementation of `get_genie_fields_from_ws`, which scanned
+`_ordered_attributes` with getattr and isinstance on every call, with the field names
+precomputed by GenieREPR. A "turn" runs the field scans the agent policy does over
+every worksheet in the context.
+
+Usage:
+    python scripts/benchmark_field_access.py [--worksheets 20] [--fields 12] [--turns 200]
+"""
+
+import argparse
+import cProfile
+import pstats
+import time
+
+from loguru import logger
+
+import worksheets.environment as environment
+from worksheets.environment import (
+    Action,
+    GenieRuntime,
+    GenieWorksheet,
+    any_open_empty_ws,
+    collect_all_parents,
+    same_worksheet,
+)
+from worksheets.from_spreadsheet import create_class
+
+
+def legacy_get_genie_fields_from_ws(obj):
+    fields = []
+    for attr in obj._ordered_attributes:
+        if not attr.startswith("_"):
+            field = getattr(obj, attr)
+            if isinstance(field, environment.GenieField):
+                fields.append(field)
+    return fields
+
+
+def build_bot(num_worksheets, num_fields):
+    bot = GenieRuntime(name="benchmark", prompt_dir=None, api=[])
+    for i in range(num_worksheets):
+        fields = [
+            {
+                "slottype": str,
+                "name": f"ws{i}_field{j}",
+                "description": "",
+                "predicate": "",
+                "actions": Action(""),
+                "optional": j % 2 == 0,
+            }
+            for j in range(num_fields)
+        ]
+        _, ws = create_class(f"Ws{i}", fields, "worksheet", "", Action(""), "", [])
+        bot.add_worksheet(ws)
+        bot.context.set(f"ws_{i}", ws(**{f"ws{i}_field0": "value"}))
+    return bot
+
+
+def run_turn(bot):
+    worksheets = [
+        v for v in bot.context.context.values() if isinstance(v, GenieWorksheet)
+    ]
+    for ws in worksheets:
+        ws.is_complete(bot, bot.context)
+        ws.schema_without_type(bot.context)
+        same_worksheet(ws, ws)
+    collect_all_parents(bot.context)
+    any_open_empty_ws(bot.context, bot.context)
+
+
+def measure(bot, turns):
+    profiler = cProfile.Profile()
+    profiler.enable()
+    run_turn(bot)
+    profiler.disable()
+    calls = pstats.Stats(profiler).total_calls
+
+    start = time.perf_counter()
+    for _ in range(turns):
+        run_turn(bot)
+    elapsed = (time.perf_counter() - start) / turns
+    return calls, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--worksheets", type=int, default=20)
+    parser.add_argument("--fields", type=int, default=12)
+    parser.add_argument("--turns", type=int, default=200)
+    args = parser.parse_args()
+
+    logger.remove()
+    bot = build_bot(args.worksheets, args.fields)
+
+    current = environment.get_genie_fields_from_ws
+    environment.get_genie_fields_from_ws = legacy_get_genie_fields_from_ws
+    legacy_calls, legacy_time = measure(bot, args.turns)
+    environment.get_genie_fields_from_ws = current
+    calls, elapsed = measure(bot, args.turns)
+
+    print(f"{args.worksheets} worksheets x {args.fields} fields")
+    print(f"{'':<12}{'calls/turn':>12}{'ms/turn':>12}")
+    print(f"{'legacy':<12}{legacy_calls:>12}{legacy_time * 1000:>12.3f}")
+    print(f"{'precomputed':<12}{calls:>12}{elapsed * 1000:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Benchmark of llm_generate with the offline LLM backends.
+
+Calls llm_generate with the semantic parser prompt of an agent:
+
+- standin: against a StandInServer with a lognormal latency,
+- record: the same calls, recorded to a fixture file,
+- replay: replayed from the fixture without latency (only the overhead of the
+  runtime is left) and with the recorded latency.
+
+For every backend the time per call is split between the model latency and the
+overhead of llm_generate.
+
+Usage:
+    python scripts/benchmark_llm_backend.py [--agent yelpbot] [--calls 50] [--latency lognormal:-3,0.5]
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from loguru import logger
+
+from worksheets.llm.backend import StandInServer, configure_llm_backend
+from worksheets.llm.basic import llm_generate, prompt_templates
+
+agents_dir = os.path.join(
+    os.path.dirname(__file__), "..", "src", "worksheets", "agents"
+)
+
+
+async def run_calls(prompt_dir, prompt_inputs, llm_params):
+    outputs = []
+    start = time.perf_counter()
+    for inputs in prompt_inputs:
+        outputs.append(
+            await llm_generate(
+                "semantic_parser_stateful.prompt",
+                inputs,
+                prompt_dir=prompt_dir,
+                model_name="gpt-4o",
+                temperature=0.0,
+                **llm_params,
+            )
+        )
+    return outputs, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--agent", default="yelpbot")
+    parser.add_argument("--calls", type=int, default=50)
+    parser.add_argument("--latency", default="lognormal:-3,0.5")
+    args = parser.parse_args()
+
+    logger.remove()
+    prompt_dir = os.path.join(agents_dir, args.agent, "prompts")
+    variables = prompt_templates.get(
+        os.path.join(prompt_dir, "semantic_parser_stateful.prompt")
+    ).input_variables
+    prompt_inputs = [
+        {variable: f"{variable} of the turn {i}" for variable in variables}
+        for i in range(args.calls)
+    ]
+
+    server = StandInServer(
+        latency=args.latency, default_output="```\nanswer('stand-in')\n```"
+    ).start()
+    rows = []
+
+    configure_llm_backend("standin", url=server.url)
+    outputs, seconds = asyncio.run(run_calls(prompt_dir, prompt_inputs, {}))
+    rows.append(("standin", seconds, server.stats()["model_seconds"]))
+
+    with tempfile.TemporaryDirectory() as fixture_dir:
+        fixture = os.path.join(fixture_dir, "fixture.jsonl")
+        # The recorded model is the stand-in server
+        backend = configure_llm_backend("record", fixture=fixture)
+        recorded, seconds = asyncio.run(
+            run_calls(
+                prompt_dir,
+                prompt_inputs,
+                {"base_url": server.url, "api_key": "standin"},
+            )
+        )
+        rows.append(("record", seconds, backend.stats()["model_seconds"]))
+
+        for latency in ["0", "recorded"]:
+            backend = configure_llm_backend("replay", fixture=fixture, latency=latency)
+            replayed, seconds = asyncio.run(run_calls(prompt_dir, prompt_inputs, {}))
+            assert replayed == recorded == outputs
+            rows.append(
+                (f"replay {latency}", seconds, backend.stats()["model_seconds"])
+            )
+
+    configure_llm_backend(None)
+    server.stop()
+
+    print(f"{args.calls} calls of {args.agent}, latency {args.latency}: same outputs")
+    print(f"{'':<16}{'ms/call':>10}{'model':>10}{'overhead':>10}")
+    for name, seconds, model_seconds in rows:
+        total = seconds * 1000 / args.calls
+        model = model_seconds * 1000 / args.calls
+        print(f"{name:<16}{total:>10.3f}{model:>10.3f}{total - model:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""Micro-benchmark for the chat models reused by llm_generate.
+
+Starts a local server answering the OpenAI chat completions API with a fixed reply,
+and calls llm_generate with a new chat model for every call as before, and with the
+chat models of `llm_clients`. The server counts the connections it accepts, since
+reusing the chat model reuses its keep-alive connections.
+
+Usage:
+    python scripts/benchmark_llm_clients.py [--calls 200]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from langchain.prompts import (
+    ChatPromptTemplate,
+    HumanMessagePromptTemplate,
+    SystemMessagePromptTemplate,
+)
+from langchain.schema import StrOutputParser
+from langchain_community.callbacks.manager import get_openai_callback
+from langchain_openai import ChatOpenAI
+from loguru import logger
+
+from worksheets.llm.basic import llm_clients, llm_generate, load_prompt
+
+PROMPT = """<|startofinstruction|>
+You are a semantic parser.
+<|endofinstruction|>
+
+<|startofinput|>
+User: {{ user_utterance }}
+<|endofinput|>
+"""
+
+COMPLETION = {
+    "id": "chatcmpl-stub",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "gpt-4o",
+    "choices": [
+        {
+            "index": 0,
+            "message": {"role": "assistant", "content": "```\nanswer('stub')\n```"},
+            "finish_reason": "stop",
+        }
+    ],
+    "usage": {"prompt_tokens": 20, "completion_tokens": 5, "total_tokens": 25},
+}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    connections = 0
+
+    def setup(self):
+        super().setup()
+        StubHandler.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        body = json.dumps(COMPLETION).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+async def legacy_llm_generate(
+    prompt_path,
+    prompt_inputs,
+    prompt_dir=None,
+    example_path=None,
+    model_name="azure/gpt-4o",
+    stream=False,
+    **llm_params,
+):
+    llm = ChatOpenAI(
+        model=model_name,
+        streaming=stream,
+        **llm_params,
+    )
+
+    system_prompt, prompt = load_prompt(os.path.join(prompt_dir, prompt_path))
+    messages = [
+        SystemMessagePromptTemplate.from_template(
+            system_prompt, template_format="jinja2"
+        )
+    ]
+    messages.append(
+        HumanMessagePromptTemplate.from_template(prompt, template_format="jinja2")
+    )
+    prompt_template = ChatPromptTemplate.from_messages(messages)
+
+    filled_prompt = await prompt_template.ainvoke(prompt_inputs)
+    filled_prompt_str = ""
+    for message in filled_prompt.messages:
+        filled_prompt_str += message.content + "\n"
+    logger.info(f"Prompt===========:\n{filled_prompt_str}")
+
+    chain = prompt_template | llm | StrOutputParser()
+
+    with get_openai_callback() as cb:
+        parsed_output = await chain.ainvoke(prompt_inputs)
+        logger.info(
+            f"Total token usage: prompt tokens: {cb.prompt_tokens}, completion tokens: {cb.completion_tokens}"
+        )
+        logger.info(f"Total cost: {cb.total_cost:.6f}")
+
+    logger.info(f"Output: {parsed_output}")
+    return parsed_output
+
+
+async def run_calls(generate, calls, prompt_dir, base_url):
+    StubHandler.connections = 0
+    start = time.perf_counter()
+    for i in range(calls):
+        output = await generate(
+            "stub.prompt",
+            {"user_utterance": f"utterance {i}"},
+            prompt_dir=prompt_dir,
+            model_name="gpt-4o",
+            base_url=base_url,
+            api_key="stub",
+            temperature=0.0,
+        )
+    return output, time.perf_counter() - start, StubHandler.connections
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=200)
+    args = parser.parse_args()
+
+    logger.remove()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+    with tempfile.TemporaryDirectory() as prompt_dir:
+        with open(os.path.join(prompt_dir, "stub.prompt"), "w") as f:
+            f.write(PROMPT)
+
+        async def run():
+            return [
+                await run_calls(generate, args.calls, prompt_dir, base_url)
+                for generate in [legacy_llm_generate, llm_generate]
+            ]
+
+        (legacy, legacy_time, legacy_conns), (pooled, pooled_time, pooled_conns) = (
+            asyncio.run(run())
+        )
+    server.shutdown()
+    assert legacy == pooled
+
+    print(f"{args.calls} calls to a local stub server: same output")
+    print(f"{'':<10}{'ms/call':>10}{'connections':>13}")
+    print(f"{'new':<10}{legacy_time * 1000 / args.calls:>10.3f}{legacy_conns:>13}")
+    print(f"{'pooled':<10}{pooled_time * 1000 / args.calls:>10.3f}{pooled_conns:>13}")
+    print(f"clients: {llm_clients.stats()}")
+
+
+if __name__ == "__main__":
+    main()
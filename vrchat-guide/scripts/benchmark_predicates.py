@@ -0,0 +1,104 @@
+"""Micro-benchmark for the cached predicate values of the runtime.
+
+Builds a runtime with many worksheets whose fields have predicates, then edits one
+field per turn and checks the availability and completeness of every worksheet,
+once with the PredicateCache and once clearing it before every turn (the previous
+behavior, every predicate evaluated again). Both runs must agree.
+
+Usage:
+    python scripts/benchmark_predicates.py [--worksheets 50] [--fields 10] [--turns 200]
+"""
+
+import argparse
+import random
+import time
+
+from loguru import logger
+
+from worksheets.environment import Action, GenieContext, GenieRuntime
+from worksheets.from_spreadsheet import create_class
+
+
+def build_runtime(num_worksheets, num_fields):
+    bot = GenieRuntime(name="benchmark", prompt_dir=None, api=[])
+    for i in range(num_worksheets):
+        fields = [
+            {
+                "slottype": str,
+                "name": f"field_{i}_{j}",
+                "description": "",
+                "predicate": f"field_{i}_{j - 1} == 'yes'" if j else "",
+                "actions": Action(""),
+            }
+            for j in range(num_fields)
+        ]
+        _, ws = create_class(
+            f"Worksheet{i}",
+            fields,
+            "worksheet",
+            f"field_{i - 1}_0 != None" if i else "",
+            Action(""),
+            "",
+            [],
+        )
+        bot.add_worksheet(ws)
+
+    for i, ws in enumerate(bot.genie_worksheets):
+        bot.context.set(f"worksheet_{i}", ws())
+    return bot
+
+
+def run_turns(bot, edits, clear):
+    results = []
+    start = time.perf_counter()
+    for var_name, field_name, value in edits:
+        if clear:
+            bot.predicate_cache.clear()
+        setattr(bot.context.context[var_name], field_name, value)
+        available = [ws.__name__ for ws in bot.get_available_worksheets(GenieContext())]
+        complete = [
+            bot.context.context[f"worksheet_{i}"].is_complete(bot, bot.context)
+            for i in range(len(bot.genie_worksheets))
+        ]
+        results.append((available, complete))
+    return results, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--worksheets", type=int, default=50)
+    parser.add_argument("--fields", type=int, default=10)
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    logger.remove()
+    rng = random.Random(args.seed)
+    edits = [
+        (
+            f"worksheet_{i}",
+            f"field_{i}_{rng.randrange(args.fields)}",
+            rng.choice(["yes", "no", None]),
+        )
+        for i in (rng.randrange(args.worksheets) for _ in range(args.turns))
+    ]
+
+    uncached, uncached_time = run_turns(
+        build_runtime(args.worksheets, args.fields), edits, clear=True
+    )
+    bot = build_runtime(args.worksheets, args.fields)
+    cached, cached_time = run_turns(bot, edits, clear=False)
+    assert cached == uncached
+
+    print(
+        f"{args.worksheets} worksheets x {args.fields} fields, {args.turns} turns: "
+        "same availability and completeness"
+    )
+    print(f"{'':<10}{'ms/turn':>10}")
+    print(f"{'uncached':<10}{uncached_time * 1000 / args.turns:>10.3f}")
+    print(f"{'cached':<10}{cached_time * 1000 / args.turns:>10.3f}")
+    print(bot.predicate_cache.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Micro-benchmark for the compiled prompts of llm_generate.
+
+Formats the prompts of an agent as before (the prompt file is read and split, and
+the ChatPromptTemplate is built and formatted, compiling its jinja2 templates), and
+with `prompt_templates`, which compiles every prompt once. Then edits a prompt to
+check that the edit is seen without restarting.
+
+Usage:
+    python scripts/benchmark_prompt_templates.py [--agent yelpbot] [--calls 200]
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from langchain.prompts import (
+    ChatPromptTemplate,
+    HumanMessagePromptTemplate,
+    SystemMessagePromptTemplate,
+)
+from langchain.schema import HumanMessage, SystemMessage
+from loguru import logger
+
+from worksheets.llm.basic import get_examples, load_prompt, prompt_templates
+
+agents_dir = os.path.join(
+    os.path.dirname(__file__), "..", "src", "worksheets", "agents"
+)
+
+
+def legacy_messages(prompt_dir, prompt_path, prompt_inputs, example_path=None):
+    system_prompt, prompt = load_prompt(os.path.join(prompt_dir, prompt_path))
+    if example_path:
+        examples = get_examples(os.path.join(prompt_dir, example_path, prompt_path))
+    else:
+        examples = []
+
+    messages = [
+        SystemMessagePromptTemplate.from_template(
+            system_prompt, template_format="jinja2"
+        )
+    ]
+    for example in examples:
+        messages.append(HumanMessage(content=example[0]))
+        messages.append(SystemMessage(content=example[1]))
+    messages.append(
+        HumanMessagePromptTemplate.from_template(prompt, template_format="jinja2")
+    )
+    return ChatPromptTemplate.from_messages(messages).format_messages(**prompt_inputs)
+
+
+def compiled_messages(prompt_dir, prompt_path, prompt_inputs):
+    prompt = prompt_templates.get(os.path.join(prompt_dir, prompt_path))
+    return prompt.format_messages(prompt_inputs)
+
+
+def prompt_inputs_of(prompt_dir, prompt_path):
+    variables = prompt_templates.get(
+        os.path.join(prompt_dir, prompt_path)
+    ).input_variables
+    return {variable: f"<{variable}> " * 50 for variable in variables}
+
+
+def run(prompts, calls, format_messages):
+    start = time.perf_counter()
+    for _ in range(calls):
+        results = [
+            format_messages(prompt_dir, prompt_path, inputs)
+            for prompt_dir, prompt_path, inputs in prompts
+        ]
+    return results, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--agent", default="yelpbot")
+    parser.add_argument("--calls", type=int, default=200)
+    args = parser.parse_args()
+
+    logger.remove()
+    with tempfile.TemporaryDirectory() as prompt_dir:
+        shutil.copytree(
+            os.path.join(agents_dir, args.agent, "prompts"),
+            prompt_dir,
+            dirs_exist_ok=True,
+        )
+        prompts = [
+            (prompt_dir, prompt_path, prompt_inputs_of(prompt_dir, prompt_path))
+            for prompt_path in sorted(os.listdir(prompt_dir))
+            if prompt_path.endswith(".prompt")
+        ]
+
+        legacy, legacy_time = run(prompts, args.calls, legacy_messages)
+        compiled, compiled_time = run(prompts, args.calls, compiled_messages)
+        assert [[m.content for m in messages] for messages in legacy] == [
+            [m.content for m in messages] for messages in compiled
+        ]
+
+        # The prompt is compiled again when its file is edited
+        _, prompt_path, inputs = prompts[0]
+        path = os.path.join(prompt_dir, prompt_path)
+        with open(path) as f:
+            text = f.read()
+        with open(path, "w") as f:
+            f.write(text.replace("<|endofinput|>", "Edited\n<|endofinput|>"))
+        os.utime(path, ns=(time.time_ns(), time.time_ns() + 1_000_000_000))
+        edited = compiled_messages(prompt_dir, prompt_path, inputs)
+        assert edited[-1].content.endswith("Edited")
+        assert legacy_messages(prompt_dir, prompt_path, inputs) == edited
+
+    print(f"{len(prompts)} prompts of {args.agent}, {args.calls} times: same messages")
+    print(f"{'':<10}{'ms/prompt':>10}")
+    for name, seconds in [("legacy", legacy_time), ("compiled", compiled_time)]:
+        print(f"{name:<10}{seconds * 1000 / args.calls / len(prompts):>10.3f}")
+    print(f"prompts: {prompt_templates.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Micro-benchmark for the rewriting of the user targets.
+
+Takes the user targets of the semantic parser examples of the course_enroll and
+yelpbot agents and rewrites them like semantic_parsing does (the answers are replaced
+in the text, rewrite_code_to_extract_funcs parses the code and extracts the function
+calls), then compiles every line like the agent policy does when it executes them.
+The SUQL parser is replaced by a fixed query.
+
+Both paths give the same code:
+
+- legacy: the rewriter formats a dump of every node it visits for its debug logs,
+  and prints the rewritten code, as it did before.
+- current: the debug dumps are only formatted when debug logs are enabled, and
+  the code is not printed.
+
+Usage:
+    python scripts/benchmark_rewriter.py [--repeat 200]
+"""
+
+import argparse
+import contextlib
+import os
+import re
+import time
+
+from loguru import logger
+
+from worksheets.environment import CompiledCode
+from worksheets.modules.rewriter import rewrite_code_to_extract_funcs
+from worksheets.modules.semantic_parser import extract_answer
+
+agents_dir = os.path.join(
+    os.path.dirname(__file__), "..", "src", "worksheets", "agents"
+)
+
+AGENTS = {
+    "course_enroll": (
+        ["Main", "CoursesToTake", "Course", "Answer", "MoreFieldInfo"],
+        ["courses", "ratings", "offerings"],
+    ),
+    "yelpbot": (
+        ["UserInfo", "BookRestaurant", "Answer", "MoreFieldInfo"],
+        ["Restaurants"],
+    ),
+}
+
+
+def load_user_targets(agent):
+    path = os.path.join(agents_dir, agent, "prompts", "semantic_parser_stateful.prompt")
+    with open(path) as f:
+        prompt = f.read().replace("{{ date_tmr }}", "2024-05-02")
+    return [
+        target.strip()
+        for target in re.findall(r"User Target:\n```\n(.*?)```", prompt, re.S)
+    ]
+
+
+def parse_suql(answer_query):
+    suql_query = f"SELECT * FROM Restaurants WHERE answer(reviews, {answer_query!r}) = 'Yes' LIMIT 1;"
+    return suql_query, {}, ["Restaurants"]
+
+
+def rewrite(user_target, valid_worksheets, valid_dbs):
+    answer_queries, pattern_type = extract_answer(user_target)
+    for answer_query in answer_queries:
+        suql_query, unfilled_params, tables = parse_suql(answer_query[1:-1])
+        if pattern_type == "func":
+            answer_str = f"Answer({repr(suql_query)}, {unfilled_params}, {tables}, {repr(answer_query[1:-1])})"
+            user_target = user_target.replace(f"answer({answer_query})", answer_str)
+        else:
+            answer_var = re.search(r"answer_(\d+)", user_target).group(0)
+            answer_str = f"{answer_var}.update(query={repr(suql_query)}, unfilled_params={unfilled_params}, tables={tables}, query_str={repr(answer_query[1:-1])})"
+            user_target = user_target.replace(
+                f"{answer_var}.query = {answer_query}", answer_str
+            )
+    sp_code = user_target.strip()
+    code = rewrite_code_to_extract_funcs(sp_code, valid_worksheets, valid_dbs, {})
+    # The agent policy executes the code line by line
+    statements = [CompiledCode(line) for line in code.split("\n") if line != ""]
+    return sp_code, code, statements
+
+
+def legacy_rewrite(user_target, valid_worksheets, valid_dbs):
+    result = rewrite(user_target, valid_worksheets, valid_dbs)
+    print(result[1])
+    return result
+
+
+def run(targets, repeat, rewrite):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        results = [rewrite(target, *schema) for target, schema in targets]
+    return results, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    logger.remove()
+    targets = [
+        (target, schema)
+        for agent, schema in AGENTS.items()
+        for target in load_user_targets(agent)
+    ]
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        # The debug logs are formatted, and dropped by the sink
+        handler = logger.add(lambda message: None, level="DEBUG")
+        legacy, legacy_time = run(targets, args.repeat, legacy_rewrite)
+        logger.remove(handler)
+    current, current_time = run(targets, args.repeat, rewrite)
+    for (sp_code, code, statements), (new_sp_code, new_code, new_statements) in zip(
+        legacy, current
+    ):
+        assert sp_code == new_sp_code
+        assert code == new_code
+        assert [s.code for s in statements] == [s.code for s in new_statements]
+
+    print(f"{len(targets)} user targets, {args.repeat} times: same code")
+    print(f"{'':<12}{'ms/target':>10}")
+    for name, seconds in [("legacy", legacy_time), ("current", current_time)]:
+        print(f"{name:<12}{seconds * 1000 / args.repeat / len(targets):>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Micro-benchmark for the semantic parser schema rendered once per runtime.
+
+Builds a runtime with many worksheets and databases (with Enum and List fields),
+renders the worksheets and databases given to the semantic parser on every turn as
+before, and compares them with `GenieRuntime.semantic_parser_schema`. It also
+reports the size of this static part of the prompt, which is the prefix that can be
+cached by the LLM provider.
+
+Usage:
+    python scripts/benchmark_semantic_parser_schema.py [--worksheets 50] [--fields 10] [--turns 200]
+"""
+
+import argparse
+import time
+from enum import Enum
+from typing import List
+
+from loguru import logger
+
+from worksheets.environment import Action, GenieRuntime, get_genie_fields_from_ws
+from worksheets.from_spreadsheet import create_class
+
+
+def build_runtime(num_worksheets, num_fields):
+    bot = GenieRuntime(name="benchmark", prompt_dir=None, api=[])
+    _, person = create_class(
+        "Person",
+        [{"slottype": str, "name": "username", "actions": Action("")}],
+        "type",
+        "",
+        Action(""),
+        "",
+        [],
+    )
+    bot.add_worksheet(person)
+    for i in range(num_worksheets):
+        fields = []
+        for j in range(num_fields):
+            if j % 3 == 1:
+                slottype = Enum(f"field_{i}_{j}", ["vr", "desktop", "mobile"])
+            elif j % 3 == 2:
+                slottype = List[person]
+            else:
+                slottype = str
+            fields.append(
+                {
+                    "slottype": slottype,
+                    "name": f"field_{i}_{j}",
+                    "description": "",
+                    "actions": Action(""),
+                }
+            )
+        kind = "db" if i % 5 == 4 else "worksheet"
+        _, ws = create_class(f"Worksheet{i}", fields, kind, "", Action(""), "", [])
+        if kind == "db":
+            bot.add_db_model(ws)
+        else:
+            bot.add_worksheet(ws)
+    return bot
+
+
+def legacy_schema(cls):
+    parameters = [field.schema(value=False) for field in get_genie_fields_from_ws(cls)]
+    return f"{cls.__name__}({', '.join([repr(param) for param in parameters])})"
+
+
+def legacy_prompt_inputs(bot):
+    worksheets = "\n".join(legacy_schema(ws) for ws in bot.genie_worksheets)
+    dbs = "\n".join(legacy_schema(db) for db in bot.genie_db_models)
+    return worksheets, dbs
+
+
+def cached_prompt_inputs(bot):
+    schema = bot.semantic_parser_schema()
+    return schema.worksheets, schema.dbs
+
+
+def run_turns(bot, turns, prompt_inputs):
+    start = time.perf_counter()
+    for _ in range(turns):
+        result = prompt_inputs(bot)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--worksheets", type=int, default=50)
+    parser.add_argument("--fields", type=int, default=10)
+    parser.add_argument("--turns", type=int, default=200)
+    args = parser.parse_args()
+
+    logger.remove()
+    bot = build_runtime(args.worksheets, args.fields)
+    legacy, legacy_time = run_turns(bot, args.turns, legacy_prompt_inputs)
+    cached, cached_time = run_turns(bot, args.turns, cached_prompt_inputs)
+    assert legacy == cached
+
+    print(
+        f"{args.worksheets} worksheets x {args.fields} fields, {args.turns} turns: "
+        "same schema"
+    )
+    print(f"{'':<10}{'ms/turn':>10}")
+    print(f"{'rendered':<10}{legacy_time * 1000 / args.turns:>10.3f}")
+    print(f"{'cached':<10}{cached_time * 1000 / args.turns:>10.3f}")
+    print(f"static prompt part: {bot.semantic_parser_schema().stats()}")
+
+
+if __name__ == "__main__":
+    main()
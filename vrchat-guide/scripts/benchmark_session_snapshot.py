@@ -0,0 +1,133 @@
+"""Size and latency of session snapshots (worksheets.serialization).
+
+Runs a long dialogue through the agent policy, then saves the session with
+dump_session and restores it with load_session into a new runtime built from the
+same spec. Checks that the restored context and dialogue history match the
+original ones, and compares the snapshot with the JSON export of the dialogue
+(interface_utils.convert_to_json, which cannot be restored).
+
+Usage:
+    python scripts/benchmark_session_snapshot.py [--turns 200] [--repeat 20]
+"""
+
+import argparse
+import json
+import time
+
+from loguru import logger
+
+from worksheets.annotation_utils import get_agent_action_schemas, get_context_schema
+from worksheets.environment import Action, GenieContext, GenieRuntime
+from worksheets.from_spreadsheet import create_class
+from worksheets.modules.agent_policy import run_agent_policy
+from worksheets.modules.dialogue import CurrentDialogueTurn
+from worksheets.serialization import dump_session, load_session, snapshot_codec
+
+
+def build_runtime():
+    bot = GenieRuntime(name="benchmark", prompt_dir=None, api=[])
+    specs = {
+        "Profile": ["username", "experience_level", "device_mode"],
+        "Event": ["event_name", "location", "attendees"],
+    }
+    for name, field_names in specs.items():
+        fields = [
+            {
+                "slottype": str,
+                "name": field_name,
+                "description": "",
+                "predicate": "",
+                "actions": Action(""),
+            }
+            for field_name in field_names
+        ]
+        _, ws = create_class(name, fields, "worksheet", "", Action(""), "", [])
+        bot.add_worksheet(ws)
+    return bot
+
+
+def user_target(turn):
+    if turn % 10 == 0:
+        return f'event_{turn} = Event(event_name="party {turn}")'
+    return [
+        f'profile.username = "user {turn}"',
+        f'profile.experience_level = "level {turn % 3}"',
+        f'event_{turn - turn % 10}.location = "world {turn}"',
+        f'profile.device_mode = "vr"',
+        f'event_{turn - turn % 10}.attendees = "{turn} people"',
+    ][turn % 5]
+
+
+def run_dialogue(bot, turns):
+    bot.execute('profile = Profile(username="user")', bot.context)
+    for turn in range(turns):
+        current_dlg_turn = CurrentDialogueTurn(user_target=user_target(turn))
+        current_dlg_turn.context = GenieContext()
+        current_dlg_turn.global_context = GenieContext()
+        bot.context.reset_agent_acts()
+        run_agent_policy(current_dlg_turn, bot)
+        bot.dlg_history.append(current_dlg_turn)
+
+
+def describe(bot):
+    return (
+        get_context_schema(bot.context),
+        [
+            (
+                turn.user_target,
+                get_context_schema(turn.context),
+                get_context_schema(turn.global_context),
+                get_agent_action_schemas(turn.system_action),
+            )
+            for turn in bot.dlg_history
+        ],
+        bot.order_of_actions,
+    )
+
+
+def export_json(dlg_history):
+    return json.dumps(
+        [
+            {
+                "user_target": turn.user_target,
+                "turn_context": get_context_schema(turn.context),
+                "global_context": get_context_schema(turn.global_context),
+                "system_action": get_agent_action_schemas(turn.system_action),
+            }
+            for turn in dlg_history
+        ]
+    ).encode()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    logger.remove()
+    bot = build_runtime()
+    run_dialogue(bot, args.turns)
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        snapshot = dump_session(bot)
+    dump_time = (time.perf_counter() - start) / args.repeat
+
+    restored_bot = build_runtime()
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        session = load_session(restored_bot, snapshot)
+    load_time = (time.perf_counter() - start) / args.repeat
+
+    with restored_bot.activate(session):
+        assert describe(restored_bot) == describe(bot)
+
+    print(f"{args.turns} turns, codec: {snapshot_codec(snapshot)}")
+    print(f"snapshot: {len(snapshot)} bytes")
+    print(f"json export (not restorable): {len(export_json(bot.dlg_history))} bytes")
+    print(f"dump: {dump_time * 1000:.2f} ms, load: {load_time * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
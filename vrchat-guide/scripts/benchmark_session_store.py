@@ -0,0 +1,117 @@
+"""Metrics of the SessionStore for many interleaved conversations.
+
+Runs the same dialogue in many sessions of one runtime, handling the messages of
+the sessions in a random interleaving, once with the sessions kept in memory and
+once through a SessionStore whose budget only fits a few of them. Checks that every
+conversation ends in the same state and prints the metrics of the store.
+
+Usage:
+    python scripts/benchmark_session_store.py [--sessions 100] [--turns 20] [--max-bytes 2000000]
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from loguru import logger
+
+from worksheets.annotation_utils import get_context_schema
+from worksheets.environment import Action, GenieContext, GenieRuntime
+from worksheets.from_spreadsheet import create_class
+from worksheets.modules.agent_policy import run_agent_policy
+from worksheets.modules.dialogue import CurrentDialogueTurn
+from worksheets.session_store import SessionStore
+
+
+def build_runtime():
+    bot = GenieRuntime(name="benchmark", prompt_dir=None, api=[])
+    fields = [
+        {
+            "slottype": str,
+            "name": field_name,
+            "description": "",
+            "predicate": "",
+            "actions": Action(""),
+        }
+        for field_name in ["event_name", "location", "attendees"]
+    ]
+    _, ws = create_class("Event", fields, "worksheet", "", Action(""), "", [])
+    bot.add_worksheet(ws)
+    return bot
+
+
+def handle_message(bot, turn):
+    field_name = ["event_name", "location", "attendees"][turn % 3]
+    if turn == 0:
+        user_target = 'event = Event(event_name="party")'
+    else:
+        user_target = f'event.{field_name} = "{field_name} {turn}"'
+    current_dlg_turn = CurrentDialogueTurn(user_target=user_target)
+    current_dlg_turn.context = GenieContext()
+    current_dlg_turn.global_context = GenieContext()
+    bot.context.reset_agent_acts()
+    run_agent_policy(current_dlg_turn, bot)
+    bot.dlg_history.append(current_dlg_turn)
+
+
+def describe(bot):
+    return get_context_schema(bot.context), [
+        get_context_schema(turn.global_context) for turn in bot.dlg_history
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--max-bytes", type=int, default=2000000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    logger.remove()
+    rng = random.Random(args.seed)
+    messages = [
+        session_id for session_id in range(args.sessions) for _ in range(args.turns)
+    ]
+    rng.shuffle(messages)
+
+    bot = build_runtime()
+    sessions = {session_id: bot.new_session() for session_id in range(args.sessions)}
+    turns = dict.fromkeys(sessions, 0)
+    start = time.perf_counter()
+    for session_id in messages:
+        with bot.activate(sessions[session_id]):
+            handle_message(bot, turns[session_id])
+        turns[session_id] += 1
+    in_memory_time = time.perf_counter() - start
+    expected = {}
+    for session_id, session in sessions.items():
+        with bot.activate(session):
+            expected[session_id] = describe(bot)
+
+    bot = build_runtime()
+    path = os.path.join(tempfile.mkdtemp(), "sessions.db")
+    store = SessionStore(bot, path, max_bytes=args.max_bytes)
+    turns = dict.fromkeys(sessions, 0)
+    start = time.perf_counter()
+    for session_id in messages:
+        with store.activate(str(session_id)):
+            handle_message(bot, turns[session_id])
+        turns[session_id] += 1
+    store_time = time.perf_counter() - start
+    for session_id in sessions:
+        with store.activate(str(session_id)):
+            assert describe(bot) == expected[session_id]
+
+    print(f"{args.sessions} sessions x {args.turns} turns: same state with the store")
+    print(f"in memory: {in_memory_time * 1000 / len(messages):.2f} ms/message")
+    print(f"store: {store_time * 1000 / len(messages):.2f} ms/message")
+    for key, value in store.stats().items():
+        print(f"{key}: {value:.2f}" if isinstance(value, float) else f"{key}: {value}")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
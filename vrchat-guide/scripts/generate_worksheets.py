@@ -0,0 +1,34 @@
+"""Generate the Python module with the worksheets of a sheet (see worksheets.codegen).
+
+The generated module is loaded with `Agent.load_from_module` instead of building the
+worksheets from the sheet on every start.
+
+Usage:
+    python scripts/generate_worksheets.py <sheet id or export.csv> <path.py> [--range A1:AD1007] [--refresh]
+"""
+
+import argparse
+import time
+
+from worksheets.codegen import write_module
+from worksheets.from_spreadsheet import gsheet_range_default, gsheet_to_genie
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("sheet_id")
+    parser.add_argument("path")
+    parser.add_argument("--range", default=gsheet_range_default)
+    parser.add_argument("--refresh", action="store_true")
+    args = parser.parse_args()
+
+    write_module(args.sheet_id, args.path, args.range, refresh=args.refresh)
+    print(f"worksheets written to {args.path}")
+
+    start = time.perf_counter()
+    gsheet_to_genie(args.sheet_id, args.range)
+    print(f"gsheet_to_genie: {(time.perf_counter() - start) * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
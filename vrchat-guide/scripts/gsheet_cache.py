@@ -0,0 +1,52 @@
+"""Manage the local cache of the Google Sheets that define the agents.
+
+Bots load their sheets from the cache (see worksheets.gsheet_utils.load_gsheet), so
+a sheet only has to be fetched again after it was edited.
+
+Usage:
+    python scripts/gsheet_cache.py refresh <sheet id> [--range A1:AD1007]
+    python scripts/gsheet_cache.py show <sheet id> [--range A1:AD1007]
+    python scripts/gsheet_cache.py export <sheet id> <path.csv|path.json> [--range A1:AD1007]
+"""
+
+import argparse
+import csv
+import json
+
+from worksheets.from_spreadsheet import gsheet_range_default
+from worksheets.gsheet_utils import GSheetCache, load_gsheet
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["refresh", "show", "export"])
+    parser.add_argument("sheet_id")
+    parser.add_argument("path", nargs="?", help="The export path, for export")
+    parser.add_argument("--range", default=gsheet_range_default)
+    parser.add_argument("--revision", default=None)
+    args = parser.parse_args()
+
+    cache = GSheetCache()
+    if args.command == "refresh":
+        rows = load_gsheet(args.sheet_id, args.range, refresh=True, cache=cache)
+        print(f"{len(rows or [])} rows")
+        print(f"revision: {cache.latest_revision(args.sheet_id, args.range)}")
+    elif args.command == "show":
+        print(f"cache: {cache.cache_dir}")
+        print(f"revision: {cache.latest_revision(args.sheet_id, args.range)}")
+    else:
+        if args.path is None:
+            parser.error("export needs a path")
+        rows = load_gsheet(
+            args.sheet_id, args.range, revision=args.revision, cache=cache
+        )
+        with open(args.path, "w", newline="") as f:
+            if args.path.endswith(".json"):
+                json.dump(rows, f, indent=1)
+            else:
+                csv.writer(f).writerows(rows)
+        print(f"{len(rows)} rows written to {args.path}")
+
+
+if __name__ == "__main__":
+    main()
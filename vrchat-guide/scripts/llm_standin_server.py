@@ -0,0 +1,44 @@
+"""Run a local OpenAI-compatible server standing in for the LLM.
+
+The calls recorded in the fixture file (see worksheets.llm.backend) get their
+recorded output, the other calls get the default output, after a simulated latency.
+Point llm_generate at it with `WORKSHEETS_LLM_BACKEND=standin
+WORKSHEETS_LLM_STANDIN_URL=http://127.0.0.1:8001/v1`, and the chainlite chains by
+using the same url as their api base.
+
+Usage:
+    python scripts/llm_standin_server.py [--fixture turns.jsonl] [--latency lognormal:-1,0.4] [--port 8001]
+"""
+
+import argparse
+
+from worksheets.llm.backend import StandInServer
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fixture", default=None)
+    parser.add_argument("--latency", default="0")
+    parser.add_argument("--default-output", default="")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = StandInServer(
+        fixture=args.fixture,
+        latency=args.latency,
+        default_output=args.default_output,
+        host=args.host,
+        port=args.port,
+        seed=args.seed,
+    )
+    print(f"Serving on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(server.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,10 @@
+import importlib
+from types import ModuleType
+
 from pydantic import BaseModel
 
+from worksheets.codegen import load_gsheet_module
 from worksheets.environment import GenieRuntime
-from worksheets.from_spreadsheet import gsheet_to_genie
 from worksheets.knowledge import BaseSUQLParser, SUQLKnowledgeBase
 
 
@@ -32,19 +35,45 @@ class Agent(BaseModel):
     # semantic parser for knowledge queries
     knowledge_parser: BaseSUQLParser
 
-    def load_from_gsheet(self, gsheet_id: str):
+    def load_from_gsheet(self, gsheet_id: str, refresh: bool = False):
         """Load the agent configuration from the google sheet.
 
+        The rows of the sheet, and the worksheets compiled from them, are cached
+        locally (see codegen.load_gsheet_module).
+
         Args:
-            gsheet_id (str): The ID of the Google Sheet.
+            gsheet_id (str): The ID of the Google Sheet, or the path of its CSV/JSON export.
+            refresh (bool): Fetch the sheet again instead of using the cached rows.
 
         Returns:
             GenieRuntime: An instance of GenieRuntime configured with the loaded data.
         """
 
         # Load Genie worksheets, databases, and types from the Google Sheet
-        genie_worsheets, genie_dbs, genie_types = gsheet_to_genie(gsheet_id)
+        return self.load_from_module(load_gsheet_module(gsheet_id, refresh=refresh))
 
+    def load_from_module(self, module: str | ModuleType):
+        """Load the agent configuration from a module generated by worksheets.codegen.
+
+        Args:
+            module (str | ModuleType): The module, or its import path.
+
+        Returns:
+            GenieRuntime: An instance of GenieRuntime configured with the loaded data.
+        """
+        if isinstance(module, str):
+            module = importlib.import_module(module)
+        return self.load_from_worksheets(module.worksheets, module.dbs, module.types)
+
+    def load_from_worksheets(
+        self, genie_worsheets: list, genie_dbs: list, genie_types: list
+    ):
+        """Create the GenieRuntime of the agent with the given worksheets, databases
+        and types.
+
+        Returns:
+            GenieRuntime: An instance of GenieRuntime configured with the loaded data.
+        """
         # Create a SUQL runner if knowledge_base is provided. Suql runner is used by the
         # GenieRuntime to run queries against the knowledge base.
         if self.knowledge_base:
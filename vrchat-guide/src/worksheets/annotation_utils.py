@@ -1,12 +1,22 @@
 import json
 import re
+from weakref import WeakKeyDictionary
 
 from loguru import logger
 
-from worksheets.environment import Answer, GenieType, GenieWorksheet, find_list_variable
+from worksheets.environment import (
+    Answer,
+    ContextLookups,
+    GenieContext,
+    GenieType,
+    GenieWorksheet,
+    state_version,
+)
 
 
-def handle_genie_type(key, value, context, response_generator):
+def handle_genie_type(key, value, context, response_generator, lookups=None):
+    if lookups is None:
+        lookups = ContextLookups(context)
     schema = ""
     if isinstance(value, GenieType):
         return
@@ -37,7 +47,7 @@ def handle_genie_type(key, value, context, response_generator):
                 result_strings = []
                 for val in res:
                     if isinstance(val, GenieType):
-                        var_name, idx = find_list_variable(val, context)
+                        var_name, idx = lookups.find_list_variable(val)
                         if var_name is None and idx is None:
                             result_strings.append(val)
                         else:
@@ -63,7 +73,7 @@ def handle_genie_type(key, value, context, response_generator):
 
             else:
                 result_strings = (
-                    res.schema_without_type(context)
+                    res.schema_without_type(context, lookups)
                     if isinstance(res, GenieWorksheet)
                     else res
                 )
@@ -73,7 +83,7 @@ def handle_genie_type(key, value, context, response_generator):
     elif isinstance(value, GenieWorksheet):
         if value.__class__.__name__ == "MoreFieldInfo":
             return
-        schema += key + " = " + str(value.schema_without_type(context)) + "\n"
+        schema += key + " = " + str(value.schema_without_type(context, lookups)) + "\n"
         if hasattr(value, "result"):
             if value.result:
                 schema += key + ".result = " + str(value.result.value) + "\n"
@@ -81,24 +91,101 @@ def handle_genie_type(key, value, context, response_generator):
     return schema
 
 
-def get_context_schema(context, response_generator=False):
-    schema = ""
-
-    for key, value in context.context.items():
-        if isinstance(value, list):
-            bad_list = False
-            for val in value:
-                if not isinstance(val, GenieType):
-                    bad_list = True
-                    break
-
-            if not bad_list:
-                schema += key + " = " + str(value) + "\n"
-        else:
-            new_schema = handle_genie_type(key, value, context, response_generator)
+class ContextSchemaCache:
+    """The schema of the variables of a context, rendered again only when they change.
+
+    The schema of a worksheet or a list of worksheets is kept until it is modified
+    (see state_version), or until the list variables it refers to (e.g. for the
+    results of an answer) change. It is not kept if it depends on the values of
+    other worksheets (see ContextLookups).
+    """
+
+    def __init__(self):
+        self.lookups = None
+        # (variable, response_generator) -> (value, version, list variables found, schema)
+        self._fragments = {}
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, context: GenieContext, response_generator: bool) -> str:
+        if self.lookups is None:
+            self.lookups = ContextLookups(context)
+        lookups = self.lookups
+        lookups.update()
+
+        # The fragments of the answers rendered for the other kind of prompt
+        fragments = {
+            fragment_key: entry
+            for fragment_key, entry in self._fragments.items()
+            if fragment_key[1] != response_generator
+            and fragment_key[0] in context.context
+        }
+        schema = ""
+        for key, value in context.context.items():
+            if isinstance(value, list):
+                if not all(isinstance(val, GenieType) for val in value):
+                    continue
+                version = (state_version(value), tuple(map(id, value)))
+            elif isinstance(value, GenieWorksheet):
+                version = state_version(value)
+            else:
+                continue
+
+            # Only the schema of an answer depends on response_generator
+            fragment_key = (key, isinstance(value, Answer) and response_generator)
+            entry = self._fragments.get(fragment_key)
+            if (
+                entry is not None
+                and entry[0] is value
+                and entry[1] == version
+                and all(lookups.position(val) == found for val, found in entry[2])
+            ):
+                self.hits += 1
+                new_schema = entry[3]
+            else:
+                self.misses += 1
+                lookups.reset()
+                if isinstance(value, list):
+                    new_schema = key + " = " + str(value) + "\n"
+                else:
+                    new_schema = handle_genie_type(
+                        key, value, context, response_generator, lookups
+                    )
+                if lookups.compared_values:
+                    entry = None
+                else:
+                    entry = (value, version, lookups.found, new_schema)
+            if entry is not None:
+                fragments[fragment_key] = entry
             if new_schema:
                 schema += new_schema
 
+        self._fragments = fragments
+        return schema
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "fragments": len(self._fragments),
+        }
+
+
+# GenieContext -> ContextSchemaCache
+_context_schema_caches = WeakKeyDictionary()
+
+
+def context_schema_cache(context: GenieContext) -> ContextSchemaCache:
+    cache = _context_schema_caches.get(context)
+    if cache is None:
+        cache = _context_schema_caches[context] = ContextSchemaCache()
+    return cache
+
+
+def get_context_schema(context, response_generator=False):
+    schema = context_schema_cache(context).render(context, response_generator)
     return schema.replace("\\", "")
 
 
@@ -132,17 +219,12 @@ def prepare_semantic_parser_input(bot, dlg_history, current_dlg_turn):
         bot, dlg_history, current_dlg_turn
     )
 
-    available_worksheets = [
-        ws.get_semantic_parser_schema() for ws in bot.genie_worksheets
-    ]
-    available_worksheets_text = "\n".join(available_worksheets)
-
-    available_dbs = [db.get_semantic_parser_schema() for db in bot.genie_db_models]
-    available_dbs_text = "\n".join(available_dbs)
+    # The worksheets and databases are rendered once per runtime
+    schema = bot.semantic_parser_schema()
     return (
         state_schema,
         agent_acts,
         agent_utterance,
-        available_worksheets_text,
-        available_dbs_text,
+        schema.worksheets,
+        schema.dbs,
     )
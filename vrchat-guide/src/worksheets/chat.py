@@ -1,5 +1,5 @@
 from worksheets.environment import GenieContext
-from worksheets.modules.agent_policy import run_agent_policy
+from worksheets.modules.agent_policy import arun_agent_policy
 from worksheets.modules.dialogue import CurrentDialogueTurn
 from worksheets.modules.response_generator import generate_response
 from worksheets.modules.semantic_parser import semantic_parsing
@@ -25,7 +25,7 @@ async def generate_next_turn(user_utterance: str, bot):
 
     # run the agent policy if user_target is not None
     if current_dlg_turn.user_target is not None:
-        run_agent_policy(current_dlg_turn, bot)
+        await arun_agent_policy(current_dlg_turn, bot)
 
     # generate a response based on the agent policy
     await generate_response(current_dlg_turn, bot.dlg_history, bot)
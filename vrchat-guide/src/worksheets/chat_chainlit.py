@@ -2,7 +2,7 @@ import chainlit as cl
 
 from worksheets.annotation_utils import get_agent_action_schemas, get_context_schema
 from worksheets.environment import GenieContext
-from worksheets.modules.agent_policy import run_agent_policy
+from worksheets.modules.agent_policy import arun_agent_policy
 from worksheets.modules.dialogue import CurrentDialogueTurn
 from worksheets.modules.response_generator import generate_response
 from worksheets.modules.semantic_parser import semantic_parsing
@@ -39,7 +39,7 @@ async def generate_next_turn_cl(user_utterance: str, bot):
         language="python",
         show_input=True,
     ) as step:
-        await cl.make_async(run_agent_policy)(current_dlg_turn, bot)
+        await arun_agent_policy(current_dlg_turn, bot)
         step.input = current_dlg_turn.user_target
         step.output = get_agent_action_schemas(
             current_dlg_turn.system_action, bot.context
@@ -0,0 +1,346 @@
+"""Generate a Python module with the worksheets of a sheet.
+
+`gsheet_to_genie` builds the worksheet classes with `type()` every time an agent is
+loaded. `generate_module` writes the same classes as static definitions, so loading
+an agent becomes an import and the generated file can be reviewed and diffed when
+the sheet changes:
+
+    from worksheets.codegen import write_module
+    write_module("<sheet id or export.csv>", "agents/mybot/spec.py")
+
+    from agents.mybot.spec import worksheets, dbs, types
+
+`Agent.load_from_gsheet` does this on its own: the module compiled from a revision of
+the sheet is kept in the GSheetCache (see load_gsheet_module), so that a start with a
+cached sheet neither calls Google nor parses its rows.
+"""
+
+from __future__ import annotations
+
+import ast
+import datetime
+import importlib.util
+import os
+import py_compile
+import re
+from types import ModuleType
+from enum import Enum
+from typing import get_args, get_origin
+
+from loguru import logger
+
+from worksheets.environment import (
+    GenieDB,
+    GenieField,
+    GenieType,
+    GenieWorksheet,
+    get_genie_fields_from_ws,
+)
+from worksheets.from_spreadsheet import (
+    gsheet_range_default,
+    gsheet_to_genie,
+    rows_to_genie,
+)
+from worksheets.gsheet_utils import GSheetCache, load_gsheet, rows_revision
+
+# The version of the generated modules, change it when the code they are generated
+# with changes so that the modules compiled in the GSheetCache are generated again
+SPEC_VERSION = 1
+
+# Arguments of GenieField, in the order they are written
+FIELD_ARGUMENTS = [
+    "slottype",
+    "name",
+    "question",
+    "description",
+    "predicate",
+    "ask",
+    "optional",
+    "actions",
+    "requires_confirmation",
+    "internal",
+    "primary_key",
+    "validation",
+]
+
+BUILTIN_TYPES = {
+    str: "str",
+    int: "int",
+    float: "float",
+    bool: "bool",
+    datetime.date: "datetime.date",
+    datetime.time: "datetime.time",
+}
+
+
+def check_code(code: str, where: str):
+    """Check that a predicate or an action is valid Python, once the api signs
+    (`@api(...)`, `>action(...)`) are removed. The code is still accepted since it is
+    only compiled when it is used."""
+    if not isinstance(code, str) or not code.strip():
+        return
+    try:
+        ast.parse(re.sub(r"[@>](\w+)\(", r"\1(", code).strip())
+    except SyntaxError as e:
+        logger.warning(f"Invalid code in {where}: {code!r} ({e.msg})")
+
+
+class ModuleWriter:
+    """Write the source of the classes returned by gsheet_to_genie."""
+
+    def __init__(self, classes: list[type]):
+        self.classes = classes
+        # classes and enums -> their name in the module
+        self.names = {cls: cls.__name__ for cls in classes}
+        self.defined = set()
+        # statements run once all the classes are defined (forward references)
+        self.fixups = []
+        self.lines = []
+
+    def type_source(self, slottype) -> str | None:
+        """The source of a slottype, None if it refers to a class not defined yet."""
+        if isinstance(slottype, str):
+            return repr(slottype)
+        if get_origin(slottype) is list:
+            item = self.type_source(get_args(slottype)[0])
+            return None if item is None else f"List[{item}]"
+        if slottype in BUILTIN_TYPES:
+            return BUILTIN_TYPES[slottype]
+        if slottype in self.names:
+            return self.names[slottype] if slottype in self.defined else None
+        raise ValueError(f"Cannot generate the type {slottype!r}")
+
+    def write_enums(self):
+        for cls in self.classes:
+            for field in get_genie_fields_from_ws(cls):
+                slottype = field.slottype
+                if isinstance(slottype, type) and issubclass(slottype, Enum):
+                    name = f"{cls.__name__}_{field.name}"
+                    members = [member.name for member in slottype]
+                    self.lines.append(
+                        f"{name} = Enum({slottype.__name__!r}, {members!r})"
+                    )
+                    self.names[slottype] = name
+                    self.defined.add(slottype)
+        self.lines.append("")
+
+    def write_class(self, cls: type):
+        for base in [GenieType, GenieDB, GenieWorksheet]:
+            if issubclass(cls, base):
+                break
+        if not cls.__name__.isidentifier():
+            raise ValueError(f"{cls.__name__} is not a valid class name")
+
+        self.lines.append("")
+        self.lines.append(f"class {cls.__name__}({base.__name__}):")
+        for attr in cls._ordered_attributes:
+            value = cls.__dict__[attr]
+            if isinstance(value, GenieField):
+                self.lines.extend(self.field_source(cls, value))
+            elif attr == "outputs":
+                outputs = [self.type_source(output) for output in value]
+                if None in outputs:
+                    self.lines.append("    outputs = []")
+                    self.fixups.append(
+                        f"{cls.__name__}.outputs.extend([{', '.join(self.names[o] for o in value)}])"
+                    )
+                else:
+                    self.lines.append(f"    outputs = [{', '.join(outputs)}]")
+            elif attr == "actions":
+                check_code(value.action, f"{cls.__name__} actions")
+                self.lines.append(f"    actions = Action({value.action!r})")
+            else:
+                if attr == "predicate":
+                    check_code(value, f"{cls.__name__} predicate")
+                self.lines.append(f"    {attr} = {value!r}")
+        self.lines.append("")
+        self.defined.add(cls)
+
+    def field_source(self, cls: type, field: GenieField) -> list[str]:
+        if not field.name.isidentifier():
+            raise ValueError(f"{cls.__name__}.{field.name} is not a valid field name")
+        check_code(field.predicate, f"{cls.__name__}.{field.name} predicate")
+
+        slottype = self.type_source(field.slottype)
+        if slottype is None:
+            # the class is defined later in the module
+            slottype = repr(None)
+            self.fixups.append(
+                f"{cls.__name__}.{field.name}.slottype = "
+                f"{self.type_source_when_defined(field.slottype)}"
+            )
+
+        lines = [f"    {field.name} = GenieField("]
+        for argument in FIELD_ARGUMENTS:
+            value = getattr(field.spec, argument)
+            if argument == "slottype":
+                source = slottype
+            elif argument == "actions":
+                if value is None:
+                    continue
+                check_code(value.action, f"{cls.__name__}.{field.name} actions")
+                source = f"Action({value.action!r})"
+            else:
+                source = repr(value)
+            lines.append(f"        {argument}={source},")
+        if field.value is not None:
+            lines.append(f"        value={field.value!r},")
+        lines.append("    )")
+        return lines
+
+    def type_source_when_defined(self, slottype) -> str:
+        if get_origin(slottype) is list:
+            return f"List[{self.type_source_when_defined(get_args(slottype)[0])}]"
+        return self.names[slottype]
+
+
+def generate_module(
+    gsheet_id: str, gsheet_range: str = gsheet_range_default, refresh: bool = False
+) -> str:
+    """Generate the source of a module defining the worksheets of a sheet.
+
+    The module defines the classes returned by gsheet_to_genie, and the lists
+    `worksheets`, `dbs` and `types` in the same order.
+
+    Args:
+        gsheet_id (str): The ID of the Google Sheet, or the path of its CSV/JSON export.
+        gsheet_range (str): The range of cells to retrieve.
+        refresh (bool): Fetch the sheet again instead of using the cached rows.
+
+    Returns:
+        str: The source of the module.
+    """
+    genie_worksheets, genie_dbs, genie_types = gsheet_to_genie(
+        gsheet_id, gsheet_range, refresh=refresh
+    )
+    return module_source(
+        genie_worksheets, genie_dbs, genie_types, f"{gsheet_id} ({gsheet_range})"
+    )
+
+
+def module_source(
+    genie_worksheets: list, genie_dbs: list, genie_types: list, origin: str
+) -> str:
+    """Generate the source of a module defining the given worksheets, databases and
+    types (see generate_module).
+
+    Args:
+        origin (str): Where the worksheets come from, for the docstring of the module.
+
+    Returns:
+        str: The source of the module.
+    """
+    # the types are usually referred to by the worksheets, so they are defined first
+    classes = genie_types + genie_dbs + genie_worksheets
+
+    writer = ModuleWriter(classes)
+    writer.lines.extend(
+        [
+            f'"""Worksheets generated by worksheets.codegen from {origin}.',
+            "",
+            "Do not edit, generate the module again when the sheet changes.",
+            '"""',
+            "",
+            "import datetime",
+            "from enum import Enum",
+            "from typing import List",
+            "",
+            "from worksheets.environment import (",
+            "    Action,",
+            "    GenieDB,",
+            "    GenieField,",
+            "    GenieType,",
+            "    GenieWorksheet,",
+            ")",
+            "",
+        ]
+    )
+    writer.write_enums()
+    for cls in classes:
+        writer.write_class(cls)
+
+    lines = writer.lines
+    if writer.fixups:
+        lines.append("")
+        lines.append("# references to the classes defined after the ones using them")
+        lines.extend(writer.fixups)
+        lines.append("")
+
+    def names_list(classes):
+        return "[" + ", ".join(cls.__name__ for cls in classes) + "]"
+
+    lines.extend(
+        [
+            "",
+            f"worksheets = {names_list(genie_worksheets)}",
+            f"dbs = {names_list(genie_dbs)}",
+            f"types = {names_list(genie_types)}",
+        ]
+    )
+    return "\n".join(lines) + "\n"
+
+
+def write_module(
+    gsheet_id: str,
+    path: str,
+    gsheet_range: str = gsheet_range_default,
+    refresh: bool = False,
+):
+    """Generate the module of a sheet (see generate_module) and byte-compile it.
+
+    Args:
+        gsheet_id (str): The ID of the Google Sheet, or the path of its CSV/JSON export.
+        path (str): The path of the module to write.
+        gsheet_range (str): The range of cells to retrieve.
+        refresh (bool): Fetch the sheet again instead of using the cached rows.
+    """
+    source = generate_module(gsheet_id, gsheet_range, refresh)
+    with open(path, "w") as f:
+        f.write(source)
+    py_compile.compile(path, doraise=True)
+
+
+def import_module_file(path: str, name: str) -> ModuleType:
+    """Import a module from its path, as a new module object on every call, so that
+    every runtime gets its own classes."""
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_gsheet_module(
+    gsheet_id: str,
+    gsheet_range: str = gsheet_range_default,
+    refresh: bool = False,
+    cache: GSheetCache | None = None,
+) -> ModuleType:
+    """Get the module of the worksheets of a sheet, compiled from its cached rows.
+
+    The module is generated (see module_source) once per revision of the sheet and
+    kept in the GSheetCache, next to the rows. Later loads of the same revision
+    import it (from its byte-compiled file) instead of building the classes from
+    the rows.
+
+    Args:
+        gsheet_id (str): The ID of the Google Sheet, or the path of its CSV/JSON export.
+        gsheet_range (str): The range of cells to retrieve.
+        refresh (bool): Fetch the sheet again instead of using the cached rows.
+        cache (GSheetCache, optional): The cache, GSHEET_CACHE_DIR by default.
+
+    Returns:
+        ModuleType: The module, with the lists `worksheets`, `dbs` and `types`.
+    """
+    if cache is None:
+        cache = GSheetCache()
+    rows = load_gsheet(gsheet_id, gsheet_range, refresh=refresh, cache=cache)
+    revision = rows_revision(rows)
+    path = cache.spec_path(revision, SPEC_VERSION)
+    name = f"worksheets_spec_{revision[:16]}"
+
+    if not os.path.exists(path):
+        source = module_source(
+            *rows_to_genie(rows), f"{gsheet_id} ({gsheet_range}), revision {revision}"
+        )
+        cache.write(path, source.encode())
+    return import_module_file(path, name)
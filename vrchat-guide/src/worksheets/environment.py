@@ -1,18 +1,28 @@
 from __future__ import annotations
 
 import ast
+import asyncio
+import builtins
 import inspect
+import io
+import keyword
 import re
+import time
 import tokenize
+import weakref
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
 from copy import deepcopy
+from dataclasses import dataclass, replace
 from enum import Enum
-from functools import partial
+from functools import lru_cache, partial
+from itertools import count
+from operator import attrgetter
 from typing import Any, Callable
 
 from bs4 import BeautifulSoup
 from loguru import logger
-from pygments.lexers.python import PythonLexer
-from pygments.token import Token
 
 from worksheets.llm import llm_generate
 from worksheets.utils import (
@@ -20,12 +30,173 @@ from worksheets.utils import (
     camel_to_snake,
     deep_compare_lists,
     generate_var_name,
+    num_tokens_from_string,
+    run_sync,
 )
 
+# Every modification of a GenieField or GenieWorksheet is stamped with the next
+# value of this counter (see state_version)
+_state_versions = count(1)
+
+# worksheet -> weak references to the fields and worksheets holding it as a value
+_holders = weakref.WeakKeyDictionary()
+
+
+def stamp_modification(obj, version: int | None = None):
+    """Stamp a modification of a GenieField or GenieWorksheet.
+
+    The stamp is also given to the objects holding it: the worksheet of a field, and
+    the fields and worksheets having the worksheet in their value (see hold_values).
+    So the version of an object covers everything reachable from it.
+
+    Args:
+        obj (GenieField | GenieWorksheet): The modified object.
+        version (int | None): The stamp, the next value of the counter by default.
+    """
+    if version is None:
+        version = next(_state_versions)
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        if isinstance(obj, GenieField):
+            if getattr(obj, "_version", 0) >= version:
+                continue
+            obj._version = version
+            if isinstance(obj.parent, GenieWorksheet):
+                stack.append(obj.parent)
+        else:
+            if obj.__dict__.get("_version", 0) >= version:
+                continue
+            object.__setattr__(obj, "_version", version)
+            for ref in _holders.get(obj, ()):
+                holder = ref()
+                if holder is not None:
+                    stack.append(holder)
+
+
+def hold_values(holder, value):
+    """Register a GenieField or GenieWorksheet as holding the worksheets in its value,
+    directly or in a GenieValue, a list, a tuple or a dict, so that their
+    modifications are stamped on it too.
+
+    Args:
+        holder (GenieField | GenieWorksheet): The object the value is assigned to.
+        value (Any): The value.
+    """
+    if isinstance(value, GenieValue):
+        value = value.value
+    if isinstance(value, dict):
+        items = value.values()
+    elif isinstance(value, (list, tuple)):
+        items = value
+    else:
+        items = (value,)
+
+    for item in items:
+        if isinstance(item, GenieValue):
+            item = item.value
+        if isinstance(item, GenieWorksheet) and item is not holder:
+            refs = _holders.setdefault(item, [])
+            if not any(ref() is holder for ref in refs):
+                refs[:] = [ref for ref in refs if ref() is not None]
+                refs.append(weakref.ref(holder))
+
+
+class TrackedValue:
+    """A list or dict value of GenieFields. Modifying it in place is a modification
+    of the fields holding it, as if a new value was assigned.
+
+    Plain lists and dicts assigned to a field are copied into a TrackedList or a
+    TrackedDict (see GenieField.track_value). Copies of a tracked value are plain
+    lists and dicts.
+    """
+
+    __slots__ = ()
+
+    def add_owner(self, field: GenieField):
+        if not any(ref() is field for ref in self._owners):
+            self._owners.append(weakref.ref(field))
+
+    def _modified(self):
+        version = next(_state_versions)
+        self._version = version
+        for ref in self._owners:
+            field = ref()
+            if field is not None:
+                # the value may hold new worksheets
+                hold_values(field, self)
+                stamp_modification(field, version)
+
+
+def _tracked(method):
+    def modify(self, *args, **kwargs):
+        result = method(self, *args, **kwargs)
+        self._modified()
+        return result
+
+    modify.__name__ = method.__name__
+    modify.__doc__ = method.__doc__
+    return modify
+
+
+class TrackedList(TrackedValue, list):
+    __slots__ = ("_owners", "_version")
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self._owners = []
+        self._version = 0
+
+    def __reduce_ex__(self, protocol):
+        return list, (list(self),)
+
+
+class TrackedDict(TrackedValue, dict):
+    __slots__ = ("_owners", "_version")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._owners = []
+        self._version = 0
+
+    def __reduce_ex__(self, protocol):
+        return dict, (dict(self),)
+
+
+for _name in [
+    "append",
+    "extend",
+    "insert",
+    "remove",
+    "pop",
+    "clear",
+    "sort",
+    "reverse",
+    "__setitem__",
+    "__delitem__",
+    "__iadd__",
+    "__imul__",
+]:
+    setattr(TrackedList, _name, _tracked(getattr(list, _name)))
+
+for _name in [
+    "pop",
+    "popitem",
+    "clear",
+    "setdefault",
+    "update",
+    "__setitem__",
+    "__delitem__",
+    "__ior__",
+]:
+    setattr(TrackedDict, _name, _tracked(getattr(dict, _name)))
+
 
 class GenieValue:
     """A class to represent a value in Genie. This could be a string, int, float, etc."""
 
+    __slots__ = ("value", "confirmed")
+
     def __init__(self, value):
         self.value = value
         self.confirmed = False
@@ -55,6 +226,8 @@ class GenieResult(GenieValue):
     """A class to represent the Result from executions.
     These could be results of Answer or any Action that has been performed."""
 
+    __slots__ = ("parent", "parent_var_name")
+
     def __init__(self, value, parent, parent_var_name):
         super().__init__(value)
         self.parent = parent
@@ -64,6 +237,23 @@ class GenieResult(GenieValue):
         return self.value[item]
 
 
+def field_names_from_attributes(ordered_attributes, attributes) -> tuple[str, ...]:
+    """Get the names of the GenieFields from the ordered attributes of a worksheet.
+
+    Args:
+        ordered_attributes (list[str]): The attribute names in the order they are defined.
+        attributes (dict): The attributes of the worksheet class or instance.
+
+    Returns:
+        tuple[str, ...]: The field names in order.
+    """
+    return tuple(
+        attr
+        for attr in ordered_attributes
+        if not attr.startswith("_") and isinstance(attributes.get(attr), GenieField)
+    )
+
+
 class GenieREPR(type):
     """A metaclass to customize the string representation of classes that use this metaclass."""
 
@@ -71,24 +261,42 @@ class GenieREPR(type):
         new_class = super().__new__(cls, name, bases, dct)
         # Store the ordered attributes, these are used for asking questions in the order they are defined
         new_class._ordered_attributes = [k for k in dct if not k.startswith("__")]
+        # The names of the GenieFields among them, used by get_genie_fields_from_ws
+        new_class._field_names = field_names_from_attributes(
+            new_class._ordered_attributes, dct
+        )
         return new_class
 
     def __repr__(cls):
-        parameters = []
-        for field in get_genie_fields_from_ws(cls):
-            parameters.append(field.schema(value=False))
-
-        return f"{cls.__name__}({', '.join([param for param in parameters])})"
+        return cls._schema()[0]
 
     def get_semantic_parser_schema(cls):
-        parameters = []
-        for field in get_genie_fields_from_ws(cls):
-            parameters.append(field.schema(value=False))
+        return cls._schema()[1]
 
-        return f"{cls.__name__}({', '.join([repr(param) for param in parameters])})"
+    def _schema(cls) -> tuple[str, str]:
+        """The repr and the semantic parser schema of the class.
+
+        They are rendered once and kept until a field of the class is replaced or
+        modified, which replaces its (immutable) spec."""
+        fields = get_genie_fields_from_ws(cls)
+        cached = cls.__dict__.get("_schema_cache")
+        if (
+            cached is not None
+            and len(cached[0]) == len(fields)
+            and all(spec is field.spec for spec, field in zip(cached[0], fields))
+        ):
+            return cached[1]
+
+        parameters = [field.schema(value=False) for field in fields]
+        schema = (
+            f"{cls.__name__}({', '.join(parameters)})",
+            f"{cls.__name__}({', '.join([repr(param) for param in parameters])})",
+        )
+        cls._schema_cache = (tuple(field.spec for field in fields), schema)
+        return schema
 
 
-def validation_check(name, value, validation):
+async def validation_check(name, value, validation):
     """Helper function to validate a value against a set of criteria.
 
     Args:
@@ -104,7 +312,7 @@ def validation_check(name, value, validation):
         val = str(value.value)
     else:
         val = str(value)
-    response = llm_generate(
+    response = await llm_generate(
         prompt_path,
         {
             "value": val,
@@ -123,7 +331,302 @@ def validation_check(name, value, validation):
     return False, reason.text if reason else None
 
 
+def literal_value(node: ast.expr):
+    """Get the value of a literal in the code, also when wrapped in GenieValue(...) or
+    confirm(...). Raises ValueError if the value is not a literal."""
+    if (
+        isinstance(node, ast.Call)
+        and isinstance(node.func, ast.Name)
+        and node.func.id in ("GenieValue", "confirm")
+        and len(node.args) == 1
+        and not node.keywords
+    ):
+        node = node.args[0]
+    return ast.literal_eval(node)
+
+
+class FieldValidator:
+    """Validates the values of the fields with a validation rule and memoizes the verdicts.
+
+    The verdicts are kept in a bounded LRU keyed by (field name, normalized value, rule).
+    `prevalidate` validates all the values assigned by a user target concurrently
+    before it is executed, so GenieField.init_value finds the verdicts in the cache.
+    The values that still need the LLM when the agent policy runs (see
+    arun_agent_policy) are validated on the event loop of the turn, the policy
+    waiting for them in its worker thread.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._verdicts = OrderedDict()
+
+    @staticmethod
+    def key(name: str, value, validation: str) -> tuple:
+        if isinstance(value, GenieValue):
+            value = value.value
+        return (name, " ".join(str(value).split()), validation)
+
+    def _get(self, key):
+        verdict = self._verdicts.get(key)
+        if verdict is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._verdicts.move_to_end(key)
+        return verdict
+
+    def _store(self, key, verdict):
+        self._verdicts[key] = verdict
+        self._verdicts.move_to_end(key)
+        while len(self._verdicts) > self.maxsize:
+            self._verdicts.popitem(last=False)
+
+    def check(self, name: str, value, validation: str) -> tuple[bool, str | None]:
+        """Validate a value, calls the LLM only if there is no verdict for it yet.
+
+        Args:
+            name (str): The name of the field being validated.
+            value (Any): The value to validate.
+            validation (str): The validation criteria.
+
+        Returns:
+            tuple: A tuple containing a boolean indicating validity and an optional reason.
+        """
+        key = self.key(name, value, validation)
+        verdict = self._get(key)
+        if verdict is None:
+            verdict = self._validate(name, value, validation)
+            self._store(key, verdict)
+        return verdict
+
+    @staticmethod
+    def _validate(name: str, value, validation: str) -> tuple[bool, str | None]:
+        loop = _validation_loop.get()
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if loop is not None and loop is not running and loop.is_running():
+            # The policy runs in a worker thread of the loop of the turn
+            return asyncio.run_coroutine_threadsafe(
+                validation_check(name, value, validation), loop
+            ).result()
+        return run_sync(validation_check(name, value, validation))
+
+    async def prevalidate(self, code: str, bot: GenieRuntime) -> int:
+        """Validate concurrently the literal values that the code assigns to fields
+        with a validation rule.
+
+        Args:
+            code (str): The user target that is going to be executed.
+            bot (GenieRuntime): The bot instance.
+
+        Returns:
+            int: The number of values validated with the LLM.
+        """
+        pending = {}
+        for name, value, validation in self.pending_validations(code, bot):
+            key = self.key(name, value, validation)
+            if key in self._verdicts:
+                self.hits += 1
+                self._verdicts.move_to_end(key)
+            elif key not in pending:
+                self.misses += 1
+                pending[key] = (name, value, validation)
+
+        if not pending:
+            return 0
+
+        verdicts = await asyncio.gather(
+            *[validation_check(*args) for args in pending.values()],
+            return_exceptions=True,
+        )
+        for key, verdict in zip(pending, verdicts):
+            if isinstance(verdict, Exception):
+                # The value is validated again when it is assigned
+                logger.error(f"Validation of {key[0]}={key[1]} failed: {verdict}")
+                continue
+            self._store(key, verdict)
+        return len(pending)
+
+    @staticmethod
+    def pending_validations(code: str, bot: GenieRuntime) -> list[tuple]:
+        """Find the (field name, value, validation) of the literal values assigned to
+        fields with a validation rule, either as `Worksheet(field=value)` or as
+        `variable.field = value`.
+        """
+        try:
+            tree = ast.parse(code)
+        except SyntaxError:
+            return []
+
+        def worksheet_by_name(name):
+            ws = bot.context.context.get(name)
+            if inspect.isclass(ws) and issubclass(ws, GenieWorksheet):
+                return ws
+
+        # The worksheets created by the code itself, e.g. profile = Profile()
+        created = {}
+        for node in ast.walk(tree):
+            if (
+                isinstance(node, ast.Assign)
+                and len(node.targets) == 1
+                and isinstance(node.targets[0], ast.Name)
+                and isinstance(node.value, ast.Call)
+                and isinstance(node.value.func, ast.Name)
+            ):
+                ws = worksheet_by_name(node.value.func.id)
+                if ws is not None:
+                    created[node.targets[0].id] = ws
+
+        assignments = []
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
+                ws = worksheet_by_name(node.func.id)
+                if ws is not None:
+                    for kw in node.keywords:
+                        if kw.arg is not None:
+                            assignments.append((ws, kw.arg, kw.value))
+            elif (
+                isinstance(node, ast.Assign)
+                and len(node.targets) == 1
+                and isinstance(node.targets[0], ast.Attribute)
+                and isinstance(node.targets[0].value, ast.Name)
+            ):
+                var_name = node.targets[0].value.id
+                ws = created.get(var_name, bot.context.context.get(var_name))
+                if isinstance(ws, GenieWorksheet) or inspect.isclass(ws):
+                    assignments.append((ws, node.targets[0].attr, node.value))
+
+        validations = []
+        for ws, attr, value_node in assignments:
+            field = getattr(ws, attr, None)
+            if not isinstance(field, GenieField) or not field.validation:
+                continue
+            try:
+                value = literal_value(value_node)
+            except (ValueError, TypeError, SyntaxError, MemoryError, RecursionError):
+                continue
+            # These values are not validated by GenieField.init_value
+            if value == "" or value is None:
+                continue
+            validations.append((field.name, value, field.validation))
+        return validations
+
+    def clear(self):
+        self._verdicts.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "verdicts": len(self._verdicts),
+        }
+
+
+# The event loop running the turn whose agent policy is in a worker thread, where the
+# validations of FieldValidator.check are run (see arun_agent_policy)
+_validation_loop: ContextVar[asyncio.AbstractEventLoop | None] = ContextVar(
+    "validation_loop", default=None
+)
+
+
+@contextmanager
+def validations_on_loop(loop: asyncio.AbstractEventLoop):
+    """Run the validations of FieldValidator.check on the loop in this block, including
+    in the worker threads started with a copy of the context (asyncio.to_thread)."""
+    token = _validation_loop.set(loop)
+    try:
+        yield
+    finally:
+        _validation_loop.reset(token)
+
+
+# The verdicts are shared by all the bots, they only depend on the value and the rule
+field_validator = FieldValidator()
+
+
+@dataclass(frozen=True, slots=True)
+class GenieFieldSpec:
+    """The static description of a GenieField. The spec is shared between the field
+    defined on the worksheet class and all the fields of its instances."""
+
+    # The type of the slot, e.g., str, int, etc.
+    slottype: Any
+    # The name of the field (variable name)
+    name: str
+    # The question to ask the user if the field is not filled
+    question: str = ""
+    # A description of the field. This is provided to the LLM for better understanding.
+    description: str = ""
+    # A predicate to determine if the field should be filled
+    predicate: str = ""
+    # Whether to ask the user for this field
+    ask: bool = True
+    # Whether this field is optional
+    optional: bool = False
+    # Any actions to perform when this field is filled
+    actions: Any = None
+    # Whether this field requires confirmation
+    requires_confirmation: bool = False
+    # Whether this field is internal (not shown to the user and filled by the system)
+    internal: bool = False
+    # Whether this field is a primary key. Used for database Worksheets.
+    primary_key: bool = False
+    # Any validation criteria for this field
+    validation: str | None = None
+
+
+def spec_property(name: str) -> property:
+    """Expose an attribute of the GenieFieldSpec on the GenieField.
+
+    Assigning to the attribute replaces the spec of the field, so other fields
+    sharing the same spec are not affected.
+
+    Args:
+        name (str): The name of the attribute in the spec.
+
+    Returns:
+        property: The property to set on the GenieField class.
+    """
+
+    def setter(self, value):
+        self.spec = replace(self.spec, **{name: value})
+        self.touch()
+
+    return property(attrgetter(f"spec.{name}"), setter)
+
+
 class GenieField:
+    # The static description of the field is stored in the spec, only the state
+    # of the field (value, confirmation, action_performed) is stored per instance
+    __slots__ = (
+        "spec",
+        "parent",
+        "action_performed",
+        "_value",
+        "_confirmed",
+        "_version",
+        "__weakref__",
+    )
+
+    slottype = spec_property("slottype")
+    name = spec_property("name")
+    question = spec_property("question")
+    description = spec_property("description")
+    predicate = spec_property("predicate")
+    ask = spec_property("ask")
+    optional = spec_property("optional")
+    actions = spec_property("actions")
+    requires_confirmation = spec_property("requires_confirmation")
+    internal = spec_property("internal")
+    primary_key = spec_property("primary_key")
+    validation = spec_property("validation")
+
     def __init__(
         self,
         # The type of the slot, e.g., str, int, etc.
@@ -156,52 +659,94 @@ class GenieField:
         validation: str | None = None,
         # The parent worksheet
         parent=None,
-        # The bot instance (GenieRuntime)
-        bot=None,
         # Whether an action has been performed for this field
         action_performed=False,
         **kwargs,
     ):
-        self.predicate = predicate
-        self.slottype = slottype
-        self.name = name
-        self.question = question
-        self.ask = ask
-        self.optional = optional
-        if self.ask is False:
-            self.optional = True
-        self.actions = actions
-        self.requires_confirmation = requires_confirmation
-        self.internal = internal
-        self.description = description
-        self.primary_key = primary_key
-        self.validation = validation
+        self.spec = GenieFieldSpec(
+            slottype=slottype,
+            name=name,
+            question=question,
+            description=description,
+            predicate=predicate,
+            ask=ask,
+            optional=True if ask is False else optional,
+            actions=actions,
+            requires_confirmation=requires_confirmation,
+            internal=internal,
+            primary_key=primary_key,
+            validation=validation,
+        )
+        self.init_state(value, confirmed, action_performed, parent)
+
+    @classmethod
+    def from_spec(
+        cls,
+        spec: GenieFieldSpec,
+        value=None,
+        confirmed: bool = False,
+        action_performed: bool = False,
+        parent=None,
+    ) -> GenieField:
+        """Create a field sharing an existing spec, without copying its attributes.
+
+        Args:
+            spec (GenieFieldSpec): The spec of the field.
+            value (Any): The initial value of the field.
+            confirmed (bool): Whether the field has been confirmed by the user.
+            action_performed (bool): Whether an action has been performed for this field.
+            parent: The parent worksheet.
+
+        Returns:
+            GenieField: The new field.
+        """
+        field = cls.__new__(cls)
+        field.spec = spec
+        field.init_state(value, confirmed, action_performed, parent)
+        return field
+
+    @property
+    def bot(self) -> GenieRuntime | None:
+        """The runtime running the code that uses the field, see active_runtime."""
+        return active_runtime()
+
+    def init_state(self, value, confirmed, action_performed, parent):
         self.parent = parent
-        self.bot = bot
 
         self.action_performed = action_performed
         self._value = self.init_value(value)
         self._confirmed = confirmed
+        # Creating the field is not a modification of its parent
+        self._version = next(_state_versions)
+        self.track_value()
+
+    def touch(self):
+        """Mark the field as modified, so that snapshots of it (and of the worksheets
+        holding it) are taken again."""
+        stamp_modification(self)
+
+    def track_value(self):
+        """Track the in-place modifications of a list or dict value, and the
+        modifications of the worksheets in the value (see stamp_modification)."""
+        value = self._value
+        if isinstance(value, GenieValue):
+            if value.value.__class__ is list:
+                value.value = TrackedList(value.value)
+            elif value.value.__class__ is dict:
+                value.value = TrackedDict(value.value)
+            if isinstance(value.value, TrackedValue):
+                value.value.add_owner(self)
+        hold_values(self, value)
 
     def __deepcopy__(self, memo):
-        return GenieField(
-            slottype=deepcopy(self.slottype, memo),
-            name=deepcopy(self.name, memo),
-            question=deepcopy(self.question, memo),
-            description=deepcopy(self.description, memo),
-            predicate=deepcopy(self.predicate, memo),
-            ask=deepcopy(self.ask, memo),
-            optional=deepcopy(self.optional, memo),
-            actions=deepcopy(self.actions, memo),
+        # The spec is never modified in place, so the copy can share it. The copy of
+        # a worksheet gets fields whose parent is the copy.
+        return GenieField.from_spec(
+            self.spec,
             value=deepcopy(self.value, memo),
-            requires_confirmation=deepcopy(self.requires_confirmation, memo),
-            internal=deepcopy(self.internal, memo),
-            primary_key=deepcopy(self.primary_key, memo),
-            confirmed=deepcopy(self.confirmed, memo),
-            validation=deepcopy(self.validation, memo),
-            action_performed=deepcopy(self.action_performed, memo),
-            parent=self.parent,
-            bot=self.bot,
+            confirmed=self.confirmed,
+            action_performed=self.action_performed,
+            parent=memo.get(id(self.parent), self.parent),
         )
 
     def perform_action(self, bot: GenieRuntime, local_context: GenieContext):
@@ -226,6 +771,7 @@ class GenieField:
         # Perform the action
         acts = self.actions.perform(self, bot, local_context)
         self.action_performed = True
+        self.touch()
 
         return acts
 
@@ -302,6 +848,7 @@ class GenieField:
     @confirmed.setter
     def confirmed(self, confirmed: bool):
         self._confirmed = confirmed
+        self.touch()
 
     @property
     def value(self):
@@ -313,6 +860,8 @@ class GenieField:
     def value(self, value):
         self.action_performed = False
         self._value = self.init_value(value)
+        self.track_value()
+        self.touch()
 
     def init_value(self, value):
 
@@ -337,14 +886,15 @@ class GenieField:
             valid = True
             if self.validation:
                 # Use LLM to check if the value is valid based on the validation rule
-                matches_criteria, reason = validation_check(
+                # (memoized, see FieldValidator.prevalidate)
+                matches_criteria, reason = field_validator.check(
                     self.name, value, self.validation
                 )
                 if not matches_criteria:
                     # If the validation fails, use the original value, log the error and set valid to False
                     if isinstance(value, GenieValue):
                         value = value.value
-                    self.parent.bot.context.agent_acts.add(
+                    self.bot.context.agent_acts.add(
                         ReportAgentAct(
                             query=f"{self.name}={value}",
                             message=f"Invalid value for {self.name}: {value} - {reason}",
@@ -368,6 +918,11 @@ class GenieField:
 
 
 class GenieWorksheet(metaclass=GenieREPR):
+    @property
+    def bot(self) -> GenieRuntime | None:
+        """The runtime running the code that uses the worksheet, see active_runtime."""
+        return active_runtime()
+
     def __init__(self, **kwargs):
         self.action_performed = False
         self.result = None
@@ -375,32 +930,37 @@ class GenieWorksheet(metaclass=GenieREPR):
 
         # Since the user doesn't initialize the fields, we need to do it for them
         # first, we go over all the GenieFields in the class
-        # then, we create a params dict with all the fields in the GenieField
+        # then, we create a new GenieField sharing the spec of the class field
         # finally, we check if the user has passed in a value for any GenieField
         # if they have, we set the value of the GenieField to the value passed in
         # and then we set the attribute of the class to the GenieField
-        for attr_name, attr_value in self.__class__.__dict__.items():
-            if isinstance(attr_value, GenieField):
-                params = {
-                    field: getattr(attr_value, field)
-                    for field in dir(attr_value)
-                    if not field.startswith("__")
-                }
-                # if the user has passed in a value for the GenieField, set it
-                # eg. Book(booking_id=125)
-                # then the user has passed in a value for booking_id
-                # attr_name is all the GenieFields in the class
-                # kwargs is all the values the user has passed in (like booking_id=125)
-                if attr_name in kwargs:
-                    params["value"] = kwargs[attr_name]
-                    if params["value"] == "":
-                        params["value"] = None
-
-                if "optional" in params:
-                    if not params["optional"] and params["value"] == "NA":
-                        params["value"] = None
-
-                setattr(self, attr_name, GenieField(**params))
+        for attr_name in self._field_names:
+            field = self.__class__.__dict__[attr_name]
+            value = field.value
+            # if the user has passed in a value for the GenieField, set it
+            # eg. Book(booking_id=125)
+            # then the user has passed in a value for booking_id
+            # attr_name is all the GenieFields in the class
+            # kwargs is all the values the user has passed in (like booking_id=125)
+            if attr_name in kwargs:
+                value = kwargs[attr_name]
+                if value == "":
+                    value = None
+
+            if not field.optional and value == "NA":
+                value = None
+
+            setattr(
+                self,
+                attr_name,
+                GenieField.from_spec(
+                    field.spec,
+                    value=value,
+                    confirmed=field.confirmed,
+                    action_performed=field.action_performed,
+                    parent=field.parent,
+                ),
+            )
 
     def perform_action(self, bot: GenieRuntime, local_context: GenieContext):
         """Perform the action associated with this worksheet if it hasn't been performed yet.
@@ -456,15 +1016,21 @@ class GenieWorksheet(metaclass=GenieREPR):
 
         return f"{self.__class__.__name__}({', '.join([repr(param) for param in parameters])})"
 
-    def schema_without_type(self, context: GenieContext):
+    def schema_without_type(
+        self, context: GenieContext, lookups: ContextLookups | None = None
+    ):
         """Generate a schema representation of the worksheet without type information.
 
         Args:
             context (GenieContext): The context for the worksheet.
+            lookups (ContextLookups | None): The lookups of the context, shared by the
+                worksheets rendered together.
 
         Returns:
             str: The schema representation without type.
         """
+        if lookups is None:
+            lookups = ContextLookups(context)
         parameters = []
         for field in get_genie_fields_from_ws(self):
             if field.value is None:
@@ -484,7 +1050,7 @@ class GenieWorksheet(metaclass=GenieREPR):
                     result_strings = []
                     for val in field.value:
                         if isinstance(val, GenieType):
-                            var_name, idx = find_list_variable(val, context)
+                            var_name, idx = lookups.find_list_variable(val)
                             if var_name is None and idx is None:
                                 result_strings.append(val)
                             else:
@@ -514,7 +1080,7 @@ class GenieWorksheet(metaclass=GenieREPR):
                     parameters.append(f"{field.name} = {repr(field.value)}")
             elif isinstance(field.value, GenieType):
                 # This should be straight forward, same as the one above
-                var_name, idx = find_list_variable(field.value, context)
+                var_name, idx = lookups.find_list_variable(field.value)
                 if var_name is None and idx is None:
                     if field.confirmed:
                         parameters.append(
@@ -530,7 +1096,7 @@ class GenieWorksheet(metaclass=GenieREPR):
                     else:
                         parameters.append(f"{field.name} = {var_name}[{idx}]")
             else:
-                var_name = get_variable_name(field.value, context)
+                var_name = lookups.get_variable_name(field.value)
 
                 if isinstance(var_name, str):
                     if field.confirmed:
@@ -560,7 +1126,7 @@ class GenieWorksheet(metaclass=GenieREPR):
         self.result = GenieResult(
             execute_query(code, self, bot, local_context), self, var_name
         )
-        self.bot.context.agent_acts.add(
+        bot.context.agent_acts.add(
             ReportAgentAct(code, self.result, None, var_name + ".result")
         )
         self.action_performed = True
@@ -579,6 +1145,8 @@ class GenieWorksheet(metaclass=GenieREPR):
         return cls(**initialize_from_dict)
 
     def __setattr__(self, name, value):
+        # Stamp the modification, also on the objects holding the worksheet
+        stamp_modification(self)
         if hasattr(self, name):
             attr = getattr(self, name)
             if isinstance(attr, GenieField):
@@ -601,6 +1169,7 @@ class GenieWorksheet(metaclass=GenieREPR):
                     attr.value = GenieValue(value)
                 return
         super().__setattr__(name, value)
+        hold_values(self, value)
 
     def ask(self):
         """This is a hack for when the user asks the system to ask a question from a different worksheet.
@@ -664,6 +1233,10 @@ class Answer(GenieWorksheet):
                     _ordered_attributes.append(f"{db_name}_{param}")
 
         self._ordered_attributes = _ordered_attributes
+        # Answer builds its fields dynamically, so the field names are per instance
+        self._field_names = field_names_from_attributes(
+            _ordered_attributes, self.__dict__
+        )
 
     def execute(self, bot: GenieRuntime, local_context: GenieContext):
         """Execute the actions associated with this answer.
@@ -698,7 +1271,7 @@ class Answer(GenieWorksheet):
                 self.result = GenieResult(output, self, var_name)
 
                 # Report the agent act
-                self.bot.context.agent_acts.add(
+                bot.context.agent_acts.add(
                     ReportAgentAct(
                         self.query, self.result, var_name, var_name + ".result"
                     )
@@ -713,7 +1286,7 @@ class Answer(GenieWorksheet):
                 # We don't use this for now but we can use it to ask for more information
                 var_name = get_variable_name(self, local_context)
                 self.result = GenieResult(more_field_info_result, self, var_name)
-                self.bot.context.agent_acts.add(
+                bot.context.agent_acts.add(
                     ReportAgentAct(
                         f"AskClarificationQuestion({ws.__class__.__name__}, {field_name.name})",
                         self.result,
@@ -787,6 +1360,9 @@ class Answer(GenieWorksheet):
                     self.param_names.append(f"{db_name}_{param}")
                     self._ordered_attributes.append(f"{db_name}_{param}")
 
+        self._field_names = field_names_from_attributes(
+            self._ordered_attributes, self.__dict__
+        )
         self.nl_query = query_str
 
 
@@ -810,9 +1386,6 @@ class Action:
         return len(self.action)
 
     def perform(self, obj, bot: GenieRuntime, local_context: GenieContext):
-        code = modify_action_code(self.action, obj, bot, local_context)
-        code = sanitize_dev_code(code, bot.get_all_variables())
-
         # this is right now a hack. We are just going to assign all the statments to a variable
         # and then return the variable
         acts = []
@@ -821,16 +1394,15 @@ class Action:
         # 2. then return __return
 
         # We append the results to the __return variable. This is done by the rewriter
-        transformed_code = rewrite_action_code(
-            code,
-            ["say", "propose", "answer_clarification_question"],  # predefined actions
+        # (see GenieCodeCache.template)
+        template = bot.code_cache.template(
+            "action", self.action, obj, bot, local_context
         )
-        code_ = f"__return = []\n{transformed_code}"
 
         local_context.context[f"__return"] = None
 
         # Execute the action code
-        bot.execute(code_, local_context)
+        bot.execute_template(template, local_context)
 
         # Context management
         if local_context.context["__return"] is not None:
@@ -843,7 +1415,58 @@ class Action:
         return acts
 
 
+# The session of the conversation being handled, see GenieRuntime.activate
+_active_session: ContextVar[GenieSession | None] = ContextVar(
+    "genie_session", default=None
+)
+
+
+class GenieSession:
+    """The state of one conversation with a GenieRuntime.
+
+    The runtime holds what is shared by all the conversations (worksheet classes,
+    apis, prompts and compiled code) and reads the state below from the session
+    activated for the current task or thread (GenieRuntime.activate), so one runtime
+    can serve many conversations at the same time.
+    """
+
+    def __init__(self, runtime: GenieRuntime):
+        self.runtime = runtime
+        self.context = GenieContext()
+        self.dlg_history = []
+        self.order_of_actions = []
+        # Snapshots of the context taken by the agent policy
+        self.context_snapshots = GenieContextSnapshots()
+        # Values of the predicates, evaluated again only when what they read changes
+        self.predicate_cache = PredicateCache()
+
+
+def active_runtime() -> GenieRuntime | None:
+    """The runtime whose session is active, i.e. the one running the current code.
+
+    Worksheets and fields get their `bot` from it instead of a class attribute, so
+    the same classes can be used by several runtimes.
+    """
+    session = _active_session.get()
+    return session.runtime if session is not None else None
+
+
+def session_property(name: str) -> property:
+    """Property of the GenieRuntime that reads and writes the active session."""
+
+    def setter(self, value):
+        setattr(self.session, name, value)
+
+    return property(attrgetter(f"session.{name}"), setter)
+
+
 class GenieRuntime:
+    context = session_property("context")
+    dlg_history = session_property("dlg_history")
+    order_of_actions = session_property("order_of_actions")
+    context_snapshots = session_property("context_snapshots")
+    predicate_cache = session_property("predicate_cache")
+
     def __init__(
         self,
         # The name of the bot
@@ -868,6 +1491,10 @@ class GenieRuntime:
         self.name = name
         self.genie_worksheets = []
         self.genie_db_models = []
+        # The names of the fields of the worksheets, see get_all_variables
+        self._all_variables = None
+        # (schemas of the classes, SemanticParserSchema), see semantic_parser_schema
+        self._semantic_parser_schema = None
         if starting_prompt is None:
             self.starting_prompt = f"Hello! I'm the {name}. What would you like to do?"
         self.starting_prompt = starting_prompt
@@ -876,7 +1503,12 @@ class GenieRuntime:
         self.suql_parser = suql_parser
 
         self._interpreter = GenieInterpreter()
-        self.context = GenieContext()
+        # Compiled predicates and actions of the developer-written code
+        self.code_cache = GenieCodeCache()
+        # The worksheets, models and apis added to the context, see new_session
+        self._spec_variables = []
+        # Used when no session is active (e.g. a single conversation)
+        self._default_session = GenieSession(self)
         self.local_context_init = GenieContext()
 
         # add the api to the context
@@ -888,14 +1520,9 @@ class GenieRuntime:
                 apis = [func for name, func in api_funcs if not name.startswith("_")]
         else:
             apis = []
-        self.dlg_history = []
-
-        self.order_of_actions = []
 
         apis.extend([self.suql_runner])
 
-        Answer.bot = self
-
         # Add the predefined apis and functions
         apis.extend(
             [
@@ -911,6 +1538,57 @@ class GenieRuntime:
         for api in apis:
             self.add_api(api)
 
+    @property
+    def session(self) -> GenieSession:
+        """The session of the current conversation."""
+        session = _active_session.get()
+        if session is not None and session.runtime is self:
+            return session
+        return self._default_session
+
+    def new_session(self) -> GenieSession:
+        """Create the state for a new conversation with the worksheets, database
+        models and apis of the runtime in its context."""
+        session = GenieSession(self)
+        for name, value in self._spec_variables:
+            session.context.set(name, value)
+        session.context.context["answer_clarification_question"] = partial(
+            answer_clarification_question, context=session.context
+        )
+        return session
+
+    @contextmanager
+    def activate(self, session: GenieSession):
+        """Handle the conversation of the session in the current task or thread.
+
+        Args:
+            session (GenieSession): A session created by new_session.
+        """
+        token = _active_session.set(session)
+        try:
+            yield session
+        finally:
+            _active_session.reset(token)
+
+    @contextmanager
+    def running(self):
+        """Make the runtime the active one (see active_runtime) while it runs code,
+        with its default session if none of its sessions is active."""
+        session = _active_session.get()
+        if session is not None and session.runtime is self:
+            yield
+            return
+        token = _active_session.set(self._default_session)
+        try:
+            yield
+        finally:
+            _active_session.reset(token)
+
+    def _add_spec_variable(self, name: str, value):
+        self._spec_variables.append((name, value))
+        self.context.set(name, value)
+        self.code_cache.invalidate()
+
     def reset(self):
         """Reset the bot's context and state."""
         self.context.reset_agent_acts()
@@ -923,31 +1601,30 @@ class GenieRuntime:
             del self.context.context[key]
         self.dlg_history = None
         self.order_of_actions = []
+        self.context_snapshots.clear()
+        self.predicate_cache.clear()
 
     def add_worksheet(self, ws):
         """Add a worksheet to the bot's context."""
-        ws.bot = self
         for field in get_genie_fields_from_ws(ws):
             field.parent = ws
-            field.bot = self
         self.genie_worksheets.append(ws)
-        self.context.set(ws.__name__, ws)
+        self._all_variables = None
+        self._add_spec_variable(ws.__name__, ws)
         # self.context.update(self._grab_all_variables(ws))
         # self.local_context_init.update(self._grab_all_variables(ws))
 
     def add_db_model(self, db_model):
         """Add a database model to the bot's context."""
-        db_model.bot = self
         for field in get_genie_fields_from_ws(db_model):
             field.parent = db_model
-            field.bot = self
         self.genie_db_models.append(db_model)
-        self.context.set(db_model.__name__, db_model)
+        self._add_spec_variable(db_model.__name__, db_model)
         # self.context.update(self._grab_all_variables(db_model))
         # self.local_context_init.update(self._grab_all_variables(db_model))
 
     def add_api(self, api):
-        self.context.set(callable_name(api), api)
+        self._add_spec_variable(callable_name(api), api)
 
     def geniews(
         self,
@@ -995,12 +1672,13 @@ class GenieRuntime:
             local_context = GenieContext(
                 {k: v for k, v in self.local_context_init.context.items()}
             )
-        self._interpreter.execute(
-            code,
-            self.context,
-            local_context,
-            sp=sp,
-        )
+        with self.running():
+            self._interpreter.execute(
+                code,
+                self.context,
+                local_context,
+                sp=sp,
+            )
 
         # Add the parents for all the objects in the local context
         collect_all_parents(local_context)
@@ -1015,11 +1693,31 @@ class GenieRuntime:
             local_context = GenieContext(
                 {k: v for k, v in self.local_context_init.context.items()}
             )
-        return self._interpreter.eval(
-            code,
-            self.context,
-            local_context,
-        )
+        with self.running():
+            return self._interpreter.eval(
+                code,
+                self.context,
+                local_context,
+            )
+
+    def execute_template(self, template: CodeTemplate, local_context: GenieContext):
+        """Execute developer-written code prepared by the code cache."""
+        local_context.update({k: v for k, v in self.local_context_init.context.items()})
+        compiled = self.code_cache.compile(template, local_context, self.context)
+        with self.running():
+            self._interpreter.execute_compiled(compiled, self.context, local_context)
+
+        # Add the parents for all the objects in the local context
+        collect_all_parents(local_context)
+
+    def eval_template(self, template: CodeTemplate, local_context: GenieContext):
+        """Evaluate a predicate prepared by the code cache."""
+        local_context.update({k: v for k, v in self.local_context_init.context.items()})
+        compiled = self.code_cache.compile(template, local_context, self.context)
+        with self.running():
+            return self.predicate_cache.evaluate(
+                compiled, self._interpreter, self.context, local_context
+            )
 
     def update_from_context(self, context):
         """add new variables to the context"""
@@ -1043,17 +1741,77 @@ class GenieRuntime:
             else:
                 yield db
 
-    def get_all_variables(self):
-        """Get all fields (variables) from all worksheets."""
-        all_variables = []
-        for ws in self.genie_worksheets:
-            for field in get_genie_fields_from_ws(ws):
-                all_variables.append(field.name)
+    def semantic_parser_schema(self) -> SemanticParserSchema:
+        """The schema of the worksheets and databases for the semantic parser.
+
+        Rendered once, until a worksheet or a database is added or modified."""
+        classes = tuple(self.genie_worksheets + self.genie_db_models)
+        schemas = tuple(cls.get_semantic_parser_schema() for cls in classes)
+        cached = self._semantic_parser_schema
+        if cached is None or cached[0] != schemas:
+            schema = SemanticParserSchema(
+                worksheets="\n".join(schemas[: len(self.genie_worksheets)]),
+                dbs="\n".join(schemas[len(self.genie_worksheets) :]),
+            )
+            cached = self._semantic_parser_schema = (schemas, schema)
+        return cached[1]
+
+    def get_all_variables(self) -> frozenset[str]:
+        """Get all fields (variables) from all worksheets.
+
+        Computed once, until a worksheet is added."""
+        if self._all_variables is None:
+            self._all_variables = frozenset(
+                field.name
+                for ws in self.genie_worksheets
+                for field in get_genie_fields_from_ws(ws)
+            )
+        return self._all_variables
+
 
-        return all_variables
+@dataclass(frozen=True)
+class SemanticParserSchema:
+    """The worksheets and databases given to the semantic parser.
+
+    They only change when a worksheet or a database is added, so this is the static
+    part of the semantic parser prompt, shared by all the turns and sessions."""
+
+    worksheets: str
+    dbs: str
+
+    def stats(self, model: str = "gpt-3.5-turbo", tokens: bool = True) -> dict:
+        """The size of the static part of the prompt.
+
+        Args:
+            model (str): The model whose encoding counts the tokens.
+            tokens (bool): Count the tokens. tiktoken downloads the encoding the first
+                time it is used, if it is not available (e.g. offline) only the
+                characters are counted.
+        """
+        text = f"{self.worksheets}\n{self.dbs}"
+        stats = {"characters": len(text)}
+        if tokens:
+            try:
+                stats["tokens"] = num_tokens_from_string(text, model)
+            except Exception as e:
+                logger.warning(f"Cannot count the tokens of the prompt ({e})")
+        return stats
 
 
 class GenieInterpreter:
+    """Executes the code of the semantic parser and the developer.
+
+    The code is compiled once, statement by statement. The names that the code reads
+    but that are not defined in the contexts are bound to None before the execution
+    (see CompiledCode.statements). The duration of every statement is recorded in
+    `statement_timings` and slow statements (e.g. slow API calls in actions) are logged.
+    """
+
+    def __init__(self, slow_statement_seconds: float = 1.0, max_timings: int = 1000):
+        self.slow_statement_seconds = slow_statement_seconds
+        # (statement, duration in seconds) of the latest executed statements
+        self.statement_timings = deque(maxlen=max_timings)
+
     def execute(self, code, global_context, local_context, sp=False):
         # There are some issues here. since there are no numbers now,
         # when we do courses_to_take = CoursesToTake(courses_0_details=course)
@@ -1069,20 +1827,13 @@ class GenieInterpreter:
             # If the execution is for action then we replace the undefined variables
             code = replace_undefined_variables(code, local_context, global_context)
         try:
-            try:
-                exec(code, global_context.context, local_context.context)
-            except NameError as e:
-                local_context.set(e.name, None)
-                # regex to catch the variable name. If the variable name is "user_task" then we want to find "user_task.value" as well until we hit a space.
-                # This is just a hack ideally we should traverse the ast or at least use the tokenize module to find the variable name
-                var_name = re.findall(rf"{e.name}\.\w+", code)
-                if var_name:
-                    code = code.replace(var_name[0], f"{e.name}")
-                exec(code, global_context.context, local_context.context)
-                local_context.delete(e.name)
+            compiled = compile_code(code, "exec")
         except Exception as e:
             logger.error(f"Error: {e}")
             logger.error(f"Code: {code}")
+            return
+
+        self.execute_compiled(compiled, global_context, local_context)
 
     def eval(self, code, global_context, local_context):
         # perform rewrite to update any variables that is not in the local context
@@ -1093,6 +1844,421 @@ class GenieInterpreter:
         except (NameError, AttributeError) as e:
             return False
 
+    def execute_compiled(self, compiled: CompiledCode, global_context, local_context):
+        # Names that are not defined anywhere are set to None for the execution
+        missing = compiled.undefined_names(global_context, local_context)
+        for name in missing:
+            local_context.set(name, None)
+
+        try:
+            for statement, code_object in compiled.statements(missing):
+                if code_object is None:
+                    continue
+                start = time.perf_counter()
+                try:
+                    exec(code_object, global_context.context, local_context.context)
+                finally:
+                    self.record_timing(statement, time.perf_counter() - start)
+        except Exception as e:
+            logger.error(f"Error: {e}")
+            logger.error(f"Code: {compiled.code}")
+        finally:
+            for name in missing:
+                if name in local_context.context:
+                    local_context.delete(name)
+
+    def eval_compiled(self, compiled: CompiledCode, global_context, local_context):
+        try:
+            return eval(
+                compiled.code_object, global_context.context, local_context.context
+            )
+        except (NameError, AttributeError) as e:
+            return False
+
+    def record_timing(self, statement: str, seconds: float):
+        self.statement_timings.append((statement, seconds))
+        if seconds >= self.slow_statement_seconds:
+            logger.info(f"Slow statement ({seconds:.2f}s): {statement}")
+
+
+class CodeTemplate:
+    """Developer-written code after the static rewrites (`self`, api signs and field
+    names) have been applied. Only the resolution of the variables is left, since it
+    depends on the objects present in the context."""
+
+    def __init__(self, key: tuple, code: str, mode: str):
+        self.key = key
+        self.code = code
+        # "eval" for predicates and "exec" for actions
+        self.mode = mode
+
+        # All the names used in the code. These are resolved against the context
+        # before the code is executed.
+        names = []
+        for node in ast.walk(ast.parse(code)):
+            if isinstance(node, ast.Name) and node.id not in names:
+                names.append(node.id)
+        self.names = tuple(names)
+
+
+class CompiledCode:
+    """Code object for a CodeTemplate with a given resolution of its variables.
+
+    Code executed with exec is also compiled statement by statement, so that every
+    statement is executed (and timed) once.
+    """
+
+    def __init__(self, code: str, mode: str = "exec"):
+        self.code = code
+        self.mode = mode
+        self.tree = ast.parse(code, mode=mode)
+        # Predicates are evaluated as a whole
+        self.code_object = (
+            compile(self.tree, "<genie>", mode) if mode == "eval" else None
+        )
+
+        # The names read by the code that are not assigned by the code itself
+        assigned = set()
+        loaded = []
+        for node in ast.walk(self.tree):
+            if isinstance(node, ast.Name):
+                if isinstance(node.ctx, ast.Load):
+                    if node.id not in loaded:
+                        loaded.append(node.id)
+                else:
+                    assigned.add(node.id)
+            elif isinstance(node, ast.arg):
+                assigned.add(node.arg)
+            elif isinstance(
+                node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+            ):
+                assigned.add(node.name)
+            elif isinstance(node, ast.alias):
+                assigned.add((node.asname or node.name).split(".")[0])
+            elif isinstance(node, ast.ExceptHandler) and node.name:
+                assigned.add(node.name)
+        self.free_names = tuple(name for name in loaded if name not in assigned)
+
+        # undefined names -> [(statement, code object)]
+        self._statements = {}
+        self._dependencies = None
+        self._has_calls = None
+
+    @property
+    def dependencies(self) -> tuple[tuple[str, ...], ...]:
+        """The variables read by the code as attribute paths, e.g. `profile.username`
+        is ("profile", "username"). Only the paths starting at a free name are kept.
+        """
+        if self._dependencies is None:
+            paths = []
+
+            def visit(node):
+                path = []
+                current = node
+                while isinstance(current, ast.Attribute):
+                    path.append(current.attr)
+                    current = current.value
+                if isinstance(current, ast.Name):
+                    if current.id in self.free_names:
+                        path.append(current.id)
+                        path = tuple(reversed(path))
+                        if path not in paths:
+                            paths.append(path)
+                    return
+                for child in ast.iter_child_nodes(current):
+                    visit(child)
+
+            visit(self.tree)
+            self._dependencies = tuple(paths)
+        return self._dependencies
+
+    @property
+    def has_calls(self) -> bool:
+        """Whether the code calls a function (or a method)."""
+        if self._has_calls is None:
+            self._has_calls = any(
+                isinstance(node, ast.Call) for node in ast.walk(self.tree)
+            )
+        return self._has_calls
+
+    def undefined_names(self, global_context, local_context) -> tuple[str, ...]:
+        return tuple(
+            name
+            for name in self.free_names
+            if name not in local_context.context
+            and name not in global_context.context
+            and not hasattr(builtins, name)
+        )
+
+    def statements(self, undefined_names: tuple[str, ...] = ()) -> list[tuple]:
+        """Get the compiled statements of the code.
+
+        The undefined names are going to be None, so their attributes are read from
+        (or assigned to) the name itself, i.e. `name.attr` becomes `name`. Every
+        statement is compiled on its own, a statement that cannot be compiled is
+        logged and its code object is None, the other ones are still executed.
+
+        Args:
+            undefined_names (tuple[str, ...]): The free names that are not defined.
+
+        Returns:
+            list[tuple]: The source and the code object of every statement.
+        """
+        statements = self._statements.get(undefined_names)
+        if statements is not None:
+            return statements
+
+        tree = self.tree
+        if undefined_names:
+
+            class ReplaceUndefinedAttributes(ast.NodeTransformer):
+                def visit_Attribute(self, node):
+                    if (
+                        isinstance(node.value, ast.Name)
+                        and node.value.id in undefined_names
+                    ):
+                        return ast.copy_location(
+                            ast.Name(id=node.value.id, ctx=node.ctx), node
+                        )
+                    self.generic_visit(node)
+                    return node
+
+            tree = ReplaceUndefinedAttributes().visit(deepcopy(tree))
+            ast.fix_missing_locations(tree)
+
+        if self.mode == "exec":
+            statements = []
+            for statement in tree.body:
+                source = ast.unparse(statement)
+                try:
+                    code_object = compile(
+                        ast.Module([statement], []), "<genie>", "exec"
+                    )
+                except (SyntaxError, ValueError) as e:
+                    logger.error(f"Error: {e}")
+                    logger.error(f"Code: {source}")
+                    code_object = None
+                statements.append((source, code_object))
+        else:
+            statements = [(self.code, compile(tree, "<genie>", self.mode))]
+        self._statements[undefined_names] = statements
+        return statements
+
+
+@lru_cache(maxsize=1024)
+def compile_code(code: str, mode: str) -> CompiledCode:
+    """Compile code that is not prepared by the GenieCodeCache (e.g. the user target)."""
+    return CompiledCode(code, mode)
+
+
+class GenieCodeCache:
+    """Cache for the predicates and actions written by the developer.
+
+    Before a predicate or an action is executed it is rewritten
+    (`modify_action_code`, `sanitize_dev_code`, `rewrite_action_code`), its variables
+    are resolved (`replace_undefined_variables`) and it is compiled. The rewrites only
+    depend on the source, the worksheet class and the worksheets registered with the
+    runtime, so they are cached per schema version. The compiled code is cached per
+    resolution of the variables.
+    """
+
+    # predefined actions whose results are returned from Action.perform
+    builtin_actions = ["say", "propose", "answer_clarification_question"]
+
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self.schema_version = 0
+        self.hits = 0
+        self.misses = 0
+        self._templates: dict[tuple, CodeTemplate] = {}
+        self._compiled: dict[tuple, CompiledCode] = {}
+
+    def invalidate(self):
+        """Drop all the cached code. Called whenever the schema of the runtime changes."""
+        self.schema_version += 1
+        self._templates.clear()
+        self._compiled.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "templates": len(self._templates),
+            "compiled": len(self._compiled),
+            "schema_version": self.schema_version,
+        }
+
+    def template(
+        self,
+        kind: str,
+        code: str,
+        obj: GenieField | GenieWorksheet | None,
+        bot: GenieRuntime,
+        local_context: GenieContext,
+    ) -> CodeTemplate:
+        """Get the rewritten developer code.
+
+        Args:
+            kind (str): "predicate", "action" (Action.perform) or "query" (execute_query).
+            code (str): The developer-written code.
+            obj (GenieField | GenieWorksheet | None): The object `self` refers to.
+            bot (GenieRuntime): The bot instance.
+            local_context (GenieContext): The context the code is executed in.
+
+        Returns:
+            CodeTemplate: The rewritten code.
+        """
+        # `self` is rebound for every execution
+        bind_self_object(obj, local_context)
+
+        key = (kind, code, worksheet_class(obj), self.schema_version)
+        template = self._templates.get(key)
+        if template is not None:
+            return template
+
+        code = modify_action_code(code, obj, bot, local_context)
+        if kind == "predicate":
+            code = sanitize_dev_code(code, bot.get_all_variables()).strip()
+            template = CodeTemplate(key, code, "eval")
+        elif kind == "action":
+            code = sanitize_dev_code(code, bot.get_all_variables())
+            code = rewrite_action_code(code, self.builtin_actions)
+            template = CodeTemplate(key, f"__return = []\n{code}", "exec")
+        else:
+            template = CodeTemplate(key, f"__return = {code}", "exec")
+
+        self._store(self._templates, key, template)
+        return template
+
+    def compile(
+        self,
+        template: CodeTemplate,
+        local_context: GenieContext,
+        global_context: GenieContext,
+    ) -> CompiledCode:
+        """Resolve the variables of the template against the contexts and compile it.
+
+        Args:
+            template (CodeTemplate): The rewritten code.
+            local_context (GenieContext): The local context.
+            global_context (GenieContext): The global context.
+
+        Returns:
+            CompiledCode: The compiled code.
+        """
+        bindings = tuple(
+            resolve_variable_name(name, local_context, global_context)
+            for name in template.names
+        )
+        key = (template.key, bindings)
+        compiled = self._compiled.get(key)
+        if compiled is not None:
+            self.hits += 1
+            return compiled
+
+        self.misses += 1
+        code = replace_undefined_variables(template.code, local_context, global_context)
+        if template.mode == "eval":
+            code = code.strip()
+        compiled = CompiledCode(code, template.mode)
+        self._store(self._compiled, key, compiled)
+        return compiled
+
+    def _store(self, cache: dict, key, value):
+        if len(cache) >= self.maxsize:
+            # evict the oldest entry, the cache is shared by the sessions
+            cache.pop(next(iter(cache)), None)
+        cache[key] = value
+
+
+class ContextVariables(dict):
+    """The variables of a GenieContext.
+
+    Keeps an index from field names to the worksheet instances that have a field with
+    that name. All the writes go through __setitem__ and __delitem__ (including the
+    ones from exec), so the index is always current and resolving a field name to its
+    `var.field` path does not depend on the size of the context."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__()
+        # field name -> keys of the worksheets with that field
+        self._field_index: dict[str, set] = {}
+        # key -> insertion order, used to keep the dict order between candidates
+        self._positions: dict[str, int] = {}
+        self._counter = 0
+        self.update(*args, **kwargs)
+
+    def __setitem__(self, key, value):
+        if key in self:
+            self._unindex(key, self[key])
+        if key not in self._positions:
+            self._positions[key] = self._counter
+            self._counter += 1
+        super().__setitem__(key, value)
+        self._index(key, value)
+
+    def __delitem__(self, key):
+        value = self[key]
+        super().__delitem__(key)
+        self._unindex(key, value)
+        # exec adds __builtins__ to the globals without going through __setitem__
+        self._positions.pop(key, None)
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, key, *default):
+        if key not in self:
+            if default:
+                return default[0]
+            raise KeyError(key)
+        value = self[key]
+        del self[key]
+        return value
+
+    def popitem(self):
+        key = next(reversed(self))
+        return key, self.pop(key)
+
+    def clear(self):
+        super().clear()
+        self._field_index.clear()
+        self._positions.clear()
+
+    def _index(self, key, value):
+        if isinstance(value, GenieWorksheet):
+            for field in get_genie_fields_from_ws(value):
+                self._field_index.setdefault(field.name, set()).add(key)
+
+    def _unindex(self, key, value):
+        if isinstance(value, GenieWorksheet):
+            for field in get_genie_fields_from_ws(value):
+                keys = self._field_index.get(field.name)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._field_index[field.name]
+
+    def variables_with_field(self, field_name: str) -> list[str]:
+        """Get the `var.field` paths of all the worksheets with the given field."""
+        keys = self._field_index.get(field_name)
+        if not keys:
+            return []
+        if len(keys) == 1:
+            return [f"{key}.{field_name}" for key in keys]
+        return [
+            f"{key}.{field_name}"
+            for key in sorted(keys, key=self._positions.__getitem__)
+        ]
+
 
 class GenieContext:
     """A class to store the context of the Genie runtime."""
@@ -1100,7 +2266,7 @@ class GenieContext:
     def __init__(self, context: dict = None):
         if context is None:
             context = {}
-        self.context = context
+        self.context = ContextVariables(context)
         self.agent_acts = None
         self.reset_agent_acts()
 
@@ -1140,6 +2306,89 @@ class GenieContext:
         del self.context[key]
 
 
+class ContextLookups:
+    """Finds the variables of a context that the schemas of worksheets refer to.
+
+    The items of the list variables are indexed, so finding the list variable of
+    every result of a worksheet does not scan all the list variables of the context.
+    Like find_list_variable, a worksheet is found by identity (or wrapped in a
+    GenieValue). `update` indexes the items appended to the list variables since the
+    last update, the lists are indexed again if one is replaced or removed. Items
+    replaced in place are not seen.
+    """
+
+    def __init__(self, context: GenieContext):
+        self.context = context
+        # (variable, id of the list, length) of the indexed list variables
+        self.signature = ()
+        # id of an item -> (item, variable, index) of its first occurrence
+        self._positions = {}
+        # The list variables found since the last reset, see found_list_variables
+        self.found = []
+        self.compared_values = False
+        self.update()
+
+    @staticmethod
+    def list_signature(context: GenieContext) -> tuple:
+        return tuple(
+            (key, id(value), len(value))
+            for key, value in context.context.items()
+            if isinstance(value, list)
+        )
+
+    def update(self):
+        """Index the items added to the list variables of the context."""
+        signature = self.list_signature(self.context)
+        if signature == self.signature:
+            return
+
+        indexed = {(key, list_id): length for key, list_id, length in self.signature}
+        current = [(key, list_id) for key, list_id, _ in signature]
+        if [pair for pair in current if pair in indexed] != list(indexed) or any(
+            indexed.get((key, list_id), 0) > length
+            for key, list_id, length in signature
+        ):
+            indexed = {}
+            self._positions = {}
+
+        order = {key: i for i, (key, _, _) in enumerate(signature)}
+        for key, list_id, length in signature:
+            value = self.context.context[key]
+            for idx in range(indexed.get((key, list_id), 0), length):
+                item = value[idx]
+                self._index(item, key, idx, order)
+                if isinstance(item, GenieValue):
+                    self._index(item.value, key, idx, order)
+        self.signature = signature
+
+    def _index(self, item, key, idx, order):
+        entry = self._positions.get(id(item))
+        if entry is None or order[entry[1]] > order[key]:
+            self._positions[id(item)] = (item, key, str(idx))
+
+    def reset(self):
+        self.found = []
+        self.compared_values = False
+
+    def position(self, val) -> tuple[str | None, str | None]:
+        entry = self._positions.get(id(val))
+        if entry is None or entry[0] is not val:
+            return None, None
+        return entry[1], entry[2]
+
+    def find_list_variable(self, val) -> tuple[str | None, str | None]:
+        """Same as find_list_variable for a worksheet."""
+        position = self.position(val)
+        self.found.append((val, position))
+        return position
+
+    def get_variable_name(self, obj):
+        """Same as get_variable_name, which compares the values of the worksheets of the
+        same class."""
+        self.compared_values = True
+        return get_variable_name(obj, self.context)
+
+
 class TurnContext:
     def __init__(self):
         self.context: list[GenieContext] = []
@@ -1148,26 +2397,33 @@ class TurnContext:
         self.context.append(deepcopy(context))
 
 
+def worksheet_class(obj: GenieField | GenieWorksheet | None) -> type | None:
+    """Get the worksheet class an object belongs to."""
+    if obj is None or inspect.isclass(obj):
+        return obj
+    if isinstance(obj, GenieField):
+        if obj.parent is None or inspect.isclass(obj.parent):
+            return obj.parent
+        return obj.parent.__class__
+    return obj.__class__
+
+
 def get_genie_fields_from_ws(obj: GenieWorksheet) -> list[GenieField]:
-    """Get all GenieField instances from a GenieWorksheet."""
-    fields = []
-    for attr in obj._ordered_attributes:
-        if not attr.startswith("_"):
-            field = getattr(obj, attr)
-            if isinstance(field, GenieField):
-                fields.append(field)
-    return fields
+    """Get all GenieField instances from a GenieWorksheet.
+
+    The field names are computed once per class by GenieREPR (per instance for Answer).
+    """
+    return [getattr(obj, attr) for attr in obj._field_names]
 
 
 def execute_query(
     code: str, obj: GenieWorksheet, bot: GenieRuntime, local_context: GenieContext
 ):
     # refactoring the developer written code
-    code = modify_action_code(code, obj, bot, local_context)
-    code_ = f"__return = {code}"
+    template = bot.code_cache.template("query", code, obj, bot, local_context)
     local_context.context[f"__return"] = None
 
-    bot.execute(code_, local_context)
+    bot.execute_template(template, local_context)
 
     if "_obj" in local_context.context:
         del local_context.context["_obj"]
@@ -1200,10 +2456,7 @@ def modify_action_code(code, obj, bot, local_context):
 
     def replace_self(code):
         # Replace 'self.' with 'custom_obj.' to reference the custom object
-        if isinstance(obj, GenieWorksheet):
-            local_context.context["_obj"] = obj
-        elif isinstance(obj, GenieField):
-            local_context.context["_obj"] = obj.parent
+        bind_self_object(obj, local_context)
         modified_args = code.replace("self.", "_obj" + ".")
         modified_args = re.sub(r"self$", "_obj", modified_args)
         modified_args = re.sub(r"self}", "_obj" + "}", modified_args)
@@ -1217,6 +2470,19 @@ def modify_action_code(code, obj, bot, local_context):
     return code
 
 
+def bind_self_object(obj, local_context: GenieContext):
+    """Make the object referred to as `self` in developer code available as `_obj`.
+
+    Args:
+        obj (GenieField | GenieWorksheet): The object the code is attached to.
+        local_context (GenieContext): The context the code is executed in.
+    """
+    if isinstance(obj, GenieWorksheet):
+        local_context.context["_obj"] = obj
+    elif isinstance(obj, GenieField):
+        local_context.context["_obj"] = obj.parent
+
+
 def eval_predicates(
     predicates: list | str,
     obj: GenieField | GenieWorksheet,
@@ -1247,10 +2513,8 @@ def parse_single_predicate(predicate: str, obj, bot, context) -> bool:
     elif predicate == "":
         return True
 
-    code = modify_action_code(predicate, obj, bot, context)
-    code = sanitize_dev_code(code, bot.get_all_variables()).strip()
-
-    res: bool = bot.eval(code, context)
+    template = bot.code_cache.template("predicate", predicate, obj, bot, context)
+    res: bool = bot.eval_template(template, context)
 
     if "_obj" in context.context:
         del context.context["_obj"]
@@ -1379,19 +2643,301 @@ def count_number_of_vars(context: dict):
     return var_counters
 
 
-def genie_deepcopy(context):
-    """Special deepcopy function for Genie context."""
-    new_context = {}
-    for key, value in context.items():
-        if key == "__builtins__":
-            continue
-        if isinstance(value, GenieWorksheet):
-            new_context[key] = deepcopy(value)
-        elif isinstance(value, GenieField):
-            new_context[key] = deepcopy(value)
-        else:
-            new_context[key] = value
-    return new_context
+def state_version(obj) -> int:
+    """Get the latest modification of a GenieWorksheet or GenieField, including the
+    fields and values reachable from it.
+
+    The modifications are also stamped on the objects holding the modified object
+    (see stamp_modification), so the version of a worksheet or a field is read
+    directly. The list and dict values of the fields are tracked (see TrackedValue),
+    other objects mutated in place are not seen.
+
+    Args:
+        obj (Any): The object to get the version of.
+
+    Returns:
+        int: The version, 0 if nothing reachable from the object is tracked.
+    """
+    if isinstance(obj, GenieField):
+        return obj._version
+    if isinstance(obj, GenieWorksheet):
+        return obj.__dict__.get("_version", 0)
+    if isinstance(obj, GenieValue):
+        return state_version(obj.value)
+    if isinstance(obj, TrackedValue):
+        items = obj.values() if isinstance(obj, dict) else obj
+        return max(obj._version, max(map(state_version, items), default=0))
+    if isinstance(obj, (list, tuple)):
+        return max((state_version(item) for item in obj), default=0)
+    return 0
+
+
+def is_tracked(obj) -> bool:
+    """Whether every modification of the object is seen by state_version, or the
+    object cannot be modified (it only changes when its variable is assigned another
+    object)."""
+    return (
+        obj is _UNDEFINED
+        or isinstance(obj, (GenieField, GenieWorksheet, TrackedValue, Enum))
+        or is_immutable(obj)
+    )
+
+
+class GenieContextSnapshots:
+    """Copy-on-write snapshots of the variables of a context.
+
+    A snapshot holds a frozen copy of every GenieWorksheet and GenieField of the
+    context. The copy of an object is reused by the following snapshots until the
+    object is modified, so consecutive snapshots (and the dialogue turns holding
+    them) share the unchanged objects. The frozen copies must not be modified.
+    The copy of an object is dropped when the object is garbage collected.
+    """
+
+    def __init__(self):
+        # id of the object -> (weak reference to the object, state_version of the
+        # object, frozen copy)
+        self._copies = {}
+        self.copies = 0
+        self.reuses = 0
+
+    def snapshot(self, context: dict) -> dict:
+        """Take a snapshot of the context: the worksheets and fields are frozen
+        copies, the other variables are shared.
+
+        Args:
+            context (dict): The variables of the context.
+
+        Returns:
+            dict: The snapshot of the variables.
+        """
+        new_context = {}
+        for key, value in context.items():
+            if key == "__builtins__":
+                continue
+            if isinstance(value, (GenieWorksheet, GenieField)):
+                new_context[key] = self.frozen_copy(value)
+            else:
+                new_context[key] = value
+        return new_context
+
+    def frozen_copy(self, obj: GenieWorksheet | GenieField):
+        """Get a copy of the object, copying it only if it changed since its last copy."""
+        version = state_version(obj)
+        key = id(obj)
+        entry = self._copies.get(key)
+        if entry is not None and entry[0]() is obj and entry[1] == version:
+            self.reuses += 1
+            return entry[2]
+
+        copies = self._copies
+
+        def forget(ref):
+            # the id of the object can be given to a new object
+            if copies.get(key, (None,))[0] is ref:
+                copies.pop(key, None)
+
+        frozen = deepcopy(obj)
+        copies[key] = (weakref.ref(obj, forget), version, frozen)
+        self.copies += 1
+        return frozen
+
+    def clear(self):
+        self._copies.clear()
+
+    def stats(self) -> dict:
+        return {
+            "copies": self.copies,
+            "reuses": self.reuses,
+            "objects": len(self._copies),
+        }
+
+
+class PredicateValue:
+    """The result of a predicate and the objects it was computed from."""
+
+    __slots__ = ("result", "version", "dependencies")
+
+    def __init__(self, result, version: int, dependencies: tuple):
+        self.result = result
+        # Every modification made after the evaluation has a greater version
+        self.version = version
+        # (attribute path, object the path resolved to)
+        self.dependencies = dependencies
+
+    def is_current(self, global_context: GenieContext, local_context: GenieContext):
+        for path, obj in self.dependencies:
+            current = resolve_dependency(path, global_context, local_context)
+            if current is not obj or state_version(current) > self.version:
+                return False
+        return True
+
+
+class PredicateCache:
+    """Truth values of the compiled predicates.
+
+    A predicate only depends on the fields and variables it reads
+    (CompiledCode.dependencies). Its value is reused until one of them is modified
+    or resolves to another object, so the predicates of the worksheets that were not
+    touched during a turn are not evaluated again. The predicates that call a
+    function (has_calls) are always evaluated, since the function can read anything.
+    So are the predicates reading an object whose modifications are not tracked
+    (see is_tracked), e.g. a plain list that can be modified in place.
+    """
+
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        # evaluations of predicates reading objects that are not tracked
+        self.untracked = 0
+        # CompiledCode -> PredicateValue
+        self._values: dict[CompiledCode, PredicateValue] = {}
+
+    def evaluate(
+        self,
+        compiled: CompiledCode,
+        interpreter: GenieInterpreter,
+        global_context: GenieContext,
+        local_context: GenieContext,
+    ):
+        """Evaluate the predicate, or reuse its value if nothing it reads changed.
+
+        Args:
+            compiled (CompiledCode): The compiled predicate.
+            interpreter (GenieInterpreter): The interpreter to evaluate it with.
+            global_context (GenieContext): The global context.
+            local_context (GenieContext): The local context.
+
+        Returns:
+            Any: The value of the predicate.
+        """
+        if compiled.has_calls:
+            return interpreter.eval_compiled(compiled, global_context, local_context)
+
+        value = self._values.get(compiled)
+        if value is not None and value.is_current(global_context, local_context):
+            self.hits += 1
+            return value.result
+
+        self.misses += 1
+        version = next(_state_versions)
+        result = interpreter.eval_compiled(compiled, global_context, local_context)
+        dependencies = tuple(
+            (path, resolve_dependency(path, global_context, local_context))
+            for path in compiled.dependencies
+        )
+        if not all(is_tracked(obj) for _, obj in dependencies):
+            self.untracked += 1
+            self._values.pop(compiled, None)
+            return result
+
+        if compiled not in self._values and len(self._values) >= self.maxsize:
+            # evict the oldest entry
+            del self._values[next(iter(self._values))]
+        self._values[compiled] = PredicateValue(result, version, dependencies)
+        return result
+
+    def clear(self):
+        self._values.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "untracked": self.untracked,
+            "hit_rate": self.hits / total if total else 0.0,
+            "predicates": len(self._values),
+        }
+
+
+# Returned by resolve_dependency for the names that are not in the contexts
+_UNDEFINED = object()
+
+
+def resolve_dependency(
+    path: tuple[str, ...], global_context: GenieContext, local_context: GenieContext
+):
+    """Get the object an attribute path of a predicate refers to.
+
+    The path is followed through worksheet instances only, so `profile.username.value`
+    resolves to the `username` field whose version covers its value.
+
+    Args:
+        path (tuple[str, ...]): The attribute path, see CompiledCode.dependencies.
+        global_context (GenieContext): The global context.
+        local_context (GenieContext): The local context.
+
+    Returns:
+        Any: The object, or _UNDEFINED if the name is not defined in the contexts.
+    """
+    name = path[0]
+    if name in local_context.context:
+        obj = local_context.context[name]
+    elif name in global_context.context:
+        obj = global_context.context[name]
+    else:
+        return _UNDEFINED
+
+    for attr in path[1:]:
+        if not isinstance(obj, GenieWorksheet):
+            break
+        obj = getattr(obj, attr, _UNDEFINED)
+    return obj
+
+
+class ContextCheckpoint:
+    """The variables of a context at some point, used to find the variables that
+    were modified afterwards.
+
+    The worksheets and fields are compared with their copy at the checkpoint (with
+    same_worksheet and same_field), but only when they were modified after the
+    checkpoint or when their variable now refers to another object. The copies are the frozen
+    copies of the context snapshots, so only the objects modified since their last
+    snapshot are copied.
+    """
+
+    def __init__(self, context: dict, snapshots: GenieContextSnapshots):
+        # Every modification made after the checkpoint has a greater version
+        self.version = next(_state_versions)
+        self.variables = dict(context)
+        self.copies = snapshots.snapshot(context)
+
+    def modified_variables(self, context: dict) -> dict:
+        """Get the variables of the context that are new or were modified since the
+        checkpoint.
+
+        Args:
+            context (dict): The variables of the context.
+
+        Returns:
+            dict: The new or modified variables.
+        """
+        modified = {}
+        for key, value in context.items():
+            if key not in self.variables:
+                modified[key] = value
+                continue
+
+            previous = self.variables[key]
+            if isinstance(value, GenieWorksheet) and isinstance(
+                previous, GenieWorksheet
+            ):
+                if self._changed(value, previous) and not same_worksheet(
+                    value, self.copies[key]
+                ):
+                    modified[key] = value
+            elif isinstance(value, GenieField) and isinstance(previous, GenieField):
+                if self._changed(value, previous) and not same_field(
+                    value, self.copies[key]
+                ):
+                    modified[key] = value
+            elif value != previous:
+                modified[key] = value
+        return modified
+
+    def _changed(self, value, previous) -> bool:
+        return value is not previous or state_version(value) > self.version
 
 
 def get_field_variable_name(obj: GenieWorksheet, context: GenieContext):
@@ -1427,21 +2973,8 @@ def collect_all_parents(context: GenieContext):
 
 
 def find_all_variables_matching_name(field_name: str, context: GenieContext):
-    """Go through all the variables in the context recursively and return the variables that match the field_name"""
-    variables = []
-
-    def find_matching_variables(obj, field_name, key):
-        for field in get_genie_fields_from_ws(obj):
-            if field.name == field_name:
-                variables.append(key + "." + field_name)
-            # if isinstance(field.value, GenieWorksheet):
-            # find_matching_variables(field.value, field_name, key + "." + field.name)
-
-    for key, value in context.context.items():
-        if isinstance(value, GenieWorksheet):
-            find_matching_variables(value, field_name, key)
-
-    return variables
+    """Return the variables in the context that have a field matching the field_name"""
+    return context.context.variables_with_field(field_name)
 
 
 def replace_undefined_variables(
@@ -1451,48 +2984,15 @@ def replace_undefined_variables(
 
     class ReplaceVariables(ast.NodeTransformer):
         def visit_Name(self, node):
-            if node.id in local_context.context:
-                if isinstance(local_context.context[node.id], GenieField):
-                    if node.id.endswith(".value"):
-                        name = node.id
-                    else:
-                        name = node.id + ".value"
-                    return ast.copy_location(
-                        ast.Name(
-                            id=name,
-                            ctx=node.ctx,
-                        ),
-                        node,
-                    )
-            elif node.id in global_context.context:
-                if isinstance(global_context.context[node.id], GenieField):
-                    if node.id.endswith(".value"):
-                        name = node.id
-                    else:
-                        name = node.id + ".value"
-                    return ast.copy_location(
-                        ast.Name(
-                            id=name,
-                            ctx=node.ctx,
-                        ),
-                        node,
-                    )
-            else:
-                replacement_var = variable_resolver(
-                    node.id, global_context, local_context
+            name = resolve_variable_name(node.id, local_context, global_context)
+            if name is not None:
+                return ast.copy_location(
+                    ast.Name(
+                        id=name,
+                        ctx=node.ctx,
+                    ),
+                    node,
                 )
-                if replacement_var:
-                    if replacement_var.endswith(".value"):
-                        name = replacement_var
-                    else:
-                        name = replacement_var + ".value"
-                    return ast.copy_location(
-                        ast.Name(
-                            id=name,
-                            ctx=node.ctx,
-                        ),
-                        node,
-                    )
             return node
 
     # Parse the code into an AST
@@ -1507,6 +3007,39 @@ def replace_undefined_variables(
     return code
 
 
+def resolve_variable_name(
+    var_name: str, local_context: GenieContext, global_context: GenieContext
+) -> str | None:
+    """Get the name that should replace `var_name` in the code.
+
+    Args:
+        var_name (str): The variable name used in the code.
+        local_context (GenieContext): The local context.
+        global_context (GenieContext): The global context.
+
+    Returns:
+        str | None: The replacement name or None if the name is left as is.
+    """
+    if var_name in local_context.context:
+        if isinstance(local_context.context[var_name], GenieField):
+            name = var_name
+        else:
+            return None
+    elif var_name in global_context.context:
+        if isinstance(global_context.context[var_name], GenieField):
+            name = var_name
+        else:
+            return None
+    else:
+        name = variable_resolver(var_name, global_context, local_context)
+        if not name:
+            return None
+
+    if name.endswith(".value"):
+        return name
+    return name + ".value"
+
+
 def variable_resolver(var_name, global_context, local_context):
     """We need to resolve the variable name since they are stored as <obj_name>.<field_name> in the context
     and the user only provides the field name. We also need to keep track of the latest object of a worksheet
@@ -1711,77 +3244,134 @@ class AskForConfirmationAgentAct(AgentAct):
         return f"AskForFieldConfirmation({ws_name}, {field_name})"
 
 
+# The types whose values cannot be mutated, so their hash and equality never change
+_immutable_types = (str, int, float, bool, bytes, type(None))
+
+
+def is_immutable(value) -> bool:
+    """Whether the value is made of immutable builtins (and tuples of them), i.e. it
+    can be used as a dict key whose equality does not change after it is stored."""
+    if isinstance(value, tuple) and type(value) is tuple:
+        return all(is_immutable(item) for item in value)
+    return type(value) in _immutable_types
+
+
+def report_key(act: ReportAgentAct):
+    """Get the (query, message) of a ReportAgentAct as a key, None if it is not
+    immutable (e.g. a GenieField query or a GenieValue message)."""
+    key = (act.query, act.message)
+    return key if is_immutable(key) else None
+
+
+def params_key(params):
+    """Get a key for the params of a ProposeAgentAct, None if they are not a dict of
+    immutable values."""
+    if not isinstance(params, dict):
+        return None
+    items = tuple(params.items())
+    return frozenset(items) if is_immutable(items) else None
+
+
+def same_report(act1: ReportAgentAct, act2: ReportAgentAct):
+    return act1.query == act2.query and act1.message == act2.message
+
+
+def same_proposal(act1: ProposeAgentAct, act2: ProposeAgentAct):
+    return act1.params == act2.params and same_worksheet(act1.ws, act2.ws)
+
+
 class AgentActs:
+    """The acts of the agent in a turn, with the rules of which acts can be added.
+
+    The acts are indexed when they are added: the keys are only taken from immutable
+    values (the others are compared one by one, as they can be mutated in place). The
+    query, message and params of an act must not be replaced or mutated after it is
+    added, the index keeps the values it had then.
+    """
+
+    # Only one of these acts can be present, except for multiple ProposeAgentActs
+    exclusive_acts = ("ProposeAgentAct", "AskAgentAct", "AskForConfirmationAgentAct")
+
     def __init__(self, args):
         self.args = args
         self.actions = []
 
+        # The actions grouped by the name of their class
+        self._acts_by_type = {}
+        # (query, message) of the ReportAgentActs, when they are immutable
+        self._report_keys = set()
+        # ReportAgentActs whose (query, message) is not immutable, compared one by one
+        self._unhashable_reports = []
+        # ProposeAgentActs grouped by their params, when they are immutable
+        self._proposals = {}
+        # ProposeAgentActs whose params are not immutable, compared one by one
+        self._unhashable_proposals = []
+
     def add(self, action):
         self._add(action)
 
     def _add(self, action):
         if self.should_add(action):
             self.actions.append(action)
+            self._index(action)
+
+    def _index(self, action):
+        act_type = action.__class__.__name__
+        self._acts_by_type.setdefault(act_type, []).append(action)
+
+        if act_type == "ReportAgentAct":
+            key = report_key(action)
+            if key is None:
+                self._unhashable_reports.append(action)
+            else:
+                self._report_keys.add(key)
+        elif act_type == "ProposeAgentAct":
+            key = params_key(action.params)
+            if key is None:
+                self._unhashable_proposals.append(action)
+            else:
+                self._proposals.setdefault(key, []).append(action)
 
     def should_add(self, incoming_action):
         """There can be multiple ReportActs, and (multiple propose acts or one ask acts or one confirmation act) but only one of each type of act"""
-        acts_to_action = {}
-        for action in self.actions:
-            if action.__class__.__name__ in acts_to_action:
-                acts_to_action[action.__class__.__name__].append(action)
-            else:
-                acts_to_action[action.__class__.__name__] = [action]
+        act_type = incoming_action.__class__.__name__
 
         # Check if the incoming action is a ReportAct, if it is then check if there is already a ReportAct with the same query
-        if incoming_action.__class__.__name__ == "ReportAgentAct":
-            for action in acts_to_action.get("ReportAgentAct", []):
-                if (
-                    action.query == incoming_action.query
-                    and action.message == incoming_action.message
-                ):
+        if act_type == "ReportAgentAct":
+            key = report_key(incoming_action)
+            if key is None:
+                candidates = self._acts_by_type.get("ReportAgentAct", [])
+            elif key in self._report_keys:
+                return False
+            else:
+                candidates = self._unhashable_reports
+
+            for action in candidates:
+                if same_report(action, incoming_action):
                     return False
             return True
         # Check if the incoming action is a ProposeAct, if it is then check if there is already a ProposeAct with the same query
         # or AskAgentAct or AskForConfirmationAct are present
-        elif incoming_action.__class__.__name__ == "ProposeAgentAct":
-            if (
-                "AskAgentAct" in acts_to_action
-                or "AskForConfirmationAgentAct" in acts_to_action
-            ):
-                return False
-            for action in acts_to_action.get("ProposeAgentAct", []):
-                if action.params == incoming_action.params and same_worksheet(
-                    action.ws, incoming_action.ws
-                ):
-                    return False
-            return True
-        # Check if the incoming action is a AskAgentAct, if other AskAgentAct or ProposeAgentAct or AskForConfirmationAgentAct are present
-        elif incoming_action.__class__.__name__ == "AskAgentAct":
+        elif act_type == "ProposeAgentAct":
             if (
-                "ProposeAgentAct" in acts_to_action
-                or "AskAgentAct" in acts_to_action
-                or "AskForConfirmationAgentAct" in acts_to_action
+                "AskAgentAct" in self._acts_by_type
+                or "AskForConfirmationAgentAct" in self._acts_by_type
             ):
                 return False
-            return True
-        # Check if the incoming action is a AskForConfirmationAct, if other AskAgentAct or ProposeAgentAct or AskForConfirmationAgentAct are present
-        elif incoming_action.__class__.__name__ == "AskForConfirmationAgentAct":
-            if (
-                "ProposeAgentAct" in acts_to_action
-                or "AskAgentAct" in acts_to_action
-                or "AskForConfirmationAgentAct" in acts_to_action
-            ):
-                return False
-            return True
 
-        # for action in self.actions:
-        #     if isinstance(action, ReportAgentAct) or isinstance(action, ReportAgentAct):
-        #         if action == incoming_action:
-        #             return True
-        #     else:
-        #         return True
+            key = params_key(incoming_action.params)
+            if key is None:
+                candidates = self._acts_by_type.get("ProposeAgentAct", [])
+            else:
+                candidates = self._proposals.get(key, []) + self._unhashable_proposals
 
-        # return False
+            for action in candidates:
+                if same_proposal(action, incoming_action):
+                    return False
+            return True
+        # Check if the incoming action is a AskAgentAct or AskForConfirmationAct, if other AskAgentAct or ProposeAgentAct or AskForConfirmationAgentAct are present
+        elif act_type in ("AskAgentAct", "AskForConfirmationAgentAct"):
+            return self.can_have_other_acts()
 
     def extend(self, actions):
         for action in actions:
@@ -1794,35 +3384,143 @@ class AgentActs:
         return next(self.actions)
 
     def can_have_other_acts(self):
-        acts_to_action = {}
-        for action in self.actions:
-            if action.__class__.__name__ in acts_to_action:
-                acts_to_action[action.__class__.__name__].append(action)
-            else:
-                acts_to_action[action.__class__.__name__] = [action]
-
-        if (
-            "ProposeAgentAct" in acts_to_action
-            or "AskAgentAct" in acts_to_action
-            or "AskForConfirmationAgentAct" in acts_to_action
-        ):
-            return False
+        for act_type in self.exclusive_acts:
+            if act_type in self._acts_by_type:
+                return False
         return True
 
 
-def sanitize_dev_code(code: str, all_variables: list[str]):
-    """Sanitize the developer's code to ensure it doesn't contain any undefined variables."""
-    l = PythonLexer()
-    tokens = l.get_tokens(code)
-    new_tokens_list = []
-    for token in tokens:
-        if token[0] == Token.Name and token[1] in all_variables:
-            new_tokens_list.append((Token.Name, token[1] + ".value"))
-        else:
-            new_tokens_list.append(token)
+# Names that are not variables for sanitize_dev_code, unless they directly follow a "."
+# (the builtins, keywords and pseudo names)
+NON_VARIABLE_NAMES = (
+    frozenset(dir(builtins)) | frozenset(keyword.kwlist) | {"self", "cls"}
+) - {
+    "BaseExceptionGroup",
+    "ExceptionGroup",
+    "_",
+    "__build_class__",
+    "__debug__",
+    "__loader__",
+    "__package__",
+    "__spec__",
+    "anext",
+    "ascii",
+    "copyright",
+    "credits",
+    "exec",
+    "exit",
+    "help",
+    "license",
+    "quit",
+}
+
+
+def sanitize_dev_code(code: str, all_variables: frozenset[str] | list[str]):
+    """Sanitize the developer's code to ensure it doesn't contain any undefined variables.
+
+    Every name of a field (including attributes, keyword arguments and the expressions
+    of f-strings) is replaced by `name.value`. The result is cached per code.
+
+    Args:
+        code (str): The developer-written code.
+        all_variables (frozenset[str] | list[str]): The names of the fields, see
+            GenieRuntime.get_all_variables.
+
+    Returns:
+        str: The sanitized code, ending with a newline.
+    """
+    if not isinstance(all_variables, frozenset):
+        all_variables = frozenset(all_variables)
+    return _sanitize_dev_code(code, all_variables)
+
+
+@lru_cache(maxsize=4096)
+def _sanitize_dev_code(code: str, all_variables: frozenset[str]) -> str:
+    # Same normalization of the newlines as pygments' lexer, used previously
+    code = code.replace("\r\n", "\n").replace("\r", "\n").strip("\n") + "\n"
+    try:
+        return sanitize_names(code, all_variables)
+    except (tokenize.TokenError, SyntaxError) as e:
+        # The code is invalid, it fails with its own error when it is compiled
+        logger.warning(f"Cannot sanitize the code {code!r}: {e}")
+        return code
+
+
+def sanitize_names(code: str, all_variables: frozenset[str]) -> str:
+    """Append `.value` to the names of the fields in the code, using the tokenizer."""
+    # (start, end, replacement) as offsets in the code
+    edits = []
+    line_offsets = [0, 0]
+    for line in code.splitlines(keepends=True):
+        line_offsets.append(line_offsets[-1] + len(line))
+
+    def offset(position):
+        return line_offsets[position[0]] + position[1]
+
+    previous = None
+    for token in tokenize.generate_tokens(io.StringIO(code).readline):
+        if token.type == tokenize.NAME and token.string in all_variables:
+            after_dot = (
+                previous is not None
+                and previous.string == "."
+                and previous.end == token.start
+            )
+            # function and class names, and decorators (including "a @b")
+            defined = previous is not None and (
+                previous.string in ("def", "class")
+                or (previous.string == "@" and previous.end == token.start)
+            )
+            if after_dot or (token.string not in NON_VARIABLE_NAMES and not defined):
+                edits.append((offset(token.end), offset(token.end), ".value"))
+        elif token.type == tokenize.STRING and "f" in token.string[:3].lower():
+            string = sanitize_fstring(token.string, all_variables)
+            if string != token.string:
+                edits.append((offset(token.start), offset(token.end), string))
+        if token.type not in (tokenize.NL, tokenize.COMMENT):
+            previous = token
+
+    for start, end, replacement in reversed(edits):
+        code = code[:start] + replacement + code[end:]
+    return code
 
-    new_code = tokenize.untokenize(new_tokens_list)
-    return new_code
+
+def sanitize_fstring(string: str, all_variables: frozenset[str]) -> str:
+    """Sanitize the expressions in the replacement fields of an f-string literal."""
+    prefix_end = min(i for i in (string.find("'"), string.find('"')) if i >= 0)
+    result = [string[:prefix_end]]
+    i = prefix_end
+    while i < len(string):
+        if string.startswith("{{", i):
+            result.append("{{")
+            i += 2
+            continue
+        if string[i] != "{":
+            result.append(string[i])
+            i += 1
+            continue
+
+        # The expression ends with "}", ":" (format spec) or "!" (conversion)
+        # outside of brackets and strings
+        j = i + 1
+        depth = 0
+        while j < len(string):
+            char = string[j]
+            if char in "'\"":
+                j = string.index(char, j + 1)
+            elif char in "([{":
+                depth += 1
+            elif char in ")]}" and depth > 0:
+                depth -= 1
+            elif depth == 0 and (
+                char in "}:" or (char == "!" and string[j + 1 : j + 2] != "=")
+            ):
+                break
+            j += 1
+
+        expression = sanitize_names(f"({string[i + 1 : j]})", all_variables)
+        result.append("{" + expression.strip()[1:-1])
+        i = j
+    return "".join(result)
 
 
 def any_open_empty_ws(turn_context: GenieContext, global_context: GenieContext):
@@ -1855,7 +3553,9 @@ def any_open_empty_ws(turn_context: GenieContext, global_context: GenieContext):
 
 
 def find_list_variable(val, context):
-    """Find the variable name which is a list and the index of the required value in the context."""
+    """Find the variable name which is a list and the index of the required value in the context.
+
+    To find many values in the same context, use ContextLookups."""
     for key, value in context.context.items():
         if isinstance(value, list):
             for idx, v in enumerate(value):
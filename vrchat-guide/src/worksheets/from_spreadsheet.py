@@ -11,7 +11,7 @@ from worksheets.environment import (
     GenieWorksheet,
     get_genie_fields_from_ws,
 )
-from worksheets.gsheet_utils import fill_all_empty, retrieve_gsheet
+from worksheets.gsheet_utils import fill_all_empty, load_gsheet
 
 # Range of the gsheet
 gsheet_range_default = "A1:AD1007"
@@ -34,16 +34,27 @@ FIELD_VALIDATION = 13
 EMPTY_COL = 14
 
 
-def gsheet_to_classes(gsheet_id, gsheet_range=gsheet_range_default):
+def gsheet_to_classes(gsheet_id, gsheet_range=gsheet_range_default, refresh=False):
     """Convert Google Sheets data to Genie classes.
 
     Args:
-        gsheet_id (str): The ID of the Google Sheet.
+        gsheet_id (str): The ID of the Google Sheet, or the path of its CSV/JSON export.
         gsheet_range (str): The range of cells to retrieve.
+        refresh (bool): Fetch the sheet again instead of using the cached rows.
+
+    Yields:
+        Tuple[str, type]: The type of the class and the class itself."""
+    yield from rows_to_classes(load_gsheet(gsheet_id, gsheet_range, refresh=refresh))
+
+
+def rows_to_classes(rows):
+    """Convert the rows of a sheet to Genie classes.
+
+    Args:
+        rows (List): The rows of the sheet, with the header row.
 
     Yields:
         Tuple[str, type]: The type of the class and the class itself."""
-    rows = retrieve_gsheet(gsheet_id, gsheet_range)
     if not rows:
         raise ValueError("No data found.")
 
@@ -216,12 +227,26 @@ str_to_type = {
 def gsheet_to_genie(
     gsheet_id,
     gsheet_range=gsheet_range_default,
+    refresh=False,
 ):
     """Convert Google Sheets data to Genie componenets that are used to create the agent
 
     Args:
-        gsheet_id (str): The ID of the Google Sheet.
+        gsheet_id (str): The ID of the Google Sheet, or the path of its CSV/JSON export.
         gsheet_range (str): The range of cells to retrieve.
+        refresh (bool): Fetch the sheet again instead of using the cached rows.
+
+    Returns:
+        Tuple[List[GenieWorksheet], List[GenieDB], List[GenieType]]: The lists of Genie components.
+    """
+    return rows_to_genie(load_gsheet(gsheet_id, gsheet_range, refresh=refresh))
+
+
+def rows_to_genie(rows):
+    """Convert the rows of a sheet to the Genie components (see gsheet_to_genie).
+
+    Args:
+        rows (List): The rows of the sheet, with the header row.
 
     Returns:
         Tuple[List[GenieWorksheet], List[GenieDB], List[GenieType]]: The lists of Genie components.
@@ -232,7 +257,7 @@ def gsheet_to_genie(
     genie_dbs_names = {}
     genie_types = []
     genie_types_names = {}
-    for genie_type, cls in gsheet_to_classes(gsheet_id, gsheet_range):
+    for genie_type, cls in rows_to_classes(rows):
         if genie_type == "worksheet":
             genie_worsheets.append(cls)
             genie_worsheets_names[cls.__name__] = cls
@@ -1,6 +1,10 @@
 from __future__ import print_function
 
+import csv
+import hashlib
+import json
 import os
+import time
 from typing import List
 
 from google.auth.transport.requests import Request
@@ -11,6 +15,16 @@ from googleapiclient.errors import HttpError
 
 CURR_DIR = os.path.dirname(os.path.realpath(__file__))
 
+# Where the rows of the sheets are cached, see GSheetCache
+GSHEET_CACHE_DIR = os.getenv(
+    "GENIE_GSHEET_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "worksheets", "gsheets"),
+)
+
+# Fetch the cached sheets again when they are older than this, in seconds. Unset, they
+# are only fetched again on an explicit refresh.
+GSHEET_MAX_AGE = os.getenv("GENIE_GSHEET_MAX_AGE")
+
 # If modifying these scopes, delete the file token.json.
 SCOPES = ["https://www.googleapis.com/auth/spreadsheets.readonly"]
 
@@ -40,6 +54,187 @@ def retrieve_gsheet(id, range):
         print(err)
 
 
+class GSheetCache:
+    """Local content-addressed cache of the rows of Google Sheets.
+
+    The rows of a sheet are stored in `<revision>.json`, where the revision is the
+    sha256 of their content (see rows_revision), so every version of a sheet that was
+    fetched stays available. `<sheet id>-<range hash>.json` points to the latest
+    revision of the sheet and range, with the time it was fetched. The worksheets
+    compiled from a revision are stored next to it (see codegen.load_gsheet_module).
+    """
+
+    def __init__(self, cache_dir: str = GSHEET_CACHE_DIR):
+        self.cache_dir = cache_dir
+
+    def _latest_path(self, id, range):
+        range_hash = hashlib.sha256(range.encode()).hexdigest()[:12]
+        return os.path.join(self.cache_dir, f"{id}-{range_hash}.json")
+
+    def _rows_path(self, revision):
+        return os.path.join(self.cache_dir, f"{revision}.json")
+
+    def spec_path(self, revision, version):
+        """The path of the module compiled from a revision of a sheet, by the given
+        version of the code generator."""
+        return os.path.join(self.cache_dir, f"{revision}-spec{version}.py")
+
+    def latest(self, id, range):
+        """Get the latest revision of the sheet in the cache and the time it was
+        fetched, None if it was never fetched."""
+        try:
+            with open(self._latest_path(id, range)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def latest_revision(self, id, range):
+        """Get the latest revision of the sheet in the cache, None if it was never fetched."""
+        latest = self.latest(id, range)
+        return latest["revision"] if latest is not None else None
+
+    def get(self, id, range, revision=None):
+        """Get the cached rows of the sheet.
+
+        Args:
+            id (str): The ID of the Google Sheet.
+            range (str): The range of cells.
+            revision (str, optional): The revision to load, the latest one by default.
+
+        Returns:
+            List | None: The rows, None if they are not in the cache.
+        """
+        if revision is None:
+            revision = self.latest_revision(id, range)
+            if revision is None:
+                return None
+        try:
+            with open(self._rows_path(revision)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def put(self, id, range, rows):
+        """Store the rows of the sheet as its latest revision.
+
+        Args:
+            id (str): The ID of the Google Sheet.
+            range (str): The range of cells.
+            rows (List): The rows.
+
+        Returns:
+            str: The revision of the rows.
+        """
+        data = rows_data(rows)
+        revision = hashlib.sha256(data).hexdigest()
+        latest = {
+            "id": id,
+            "range": range,
+            "revision": revision,
+            "fetched_at": time.time(),
+        }
+        self.write(self._rows_path(revision), data)
+        self.write(self._latest_path(id, range), json.dumps(latest).encode())
+        return revision
+
+    def write(self, path, content: bytes):
+        """Write a file of the cache, through a temporary file so that readers never
+        see a partial file."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+
+def rows_data(rows) -> bytes:
+    return json.dumps(rows, separators=(",", ":")).encode()
+
+
+def rows_revision(rows) -> str:
+    """The revision of the rows of a sheet in the GSheetCache."""
+    return hashlib.sha256(rows_data(rows)).hexdigest()
+
+
+def is_offline():
+    """Whether Google Sheets must not be called (GENIE_OFFLINE=1)."""
+    return os.getenv("GENIE_OFFLINE", "").lower() in ("1", "true", "yes")
+
+
+def read_sheet_export(path):
+    """Read the rows of a sheet exported as CSV, or as JSON (a list of rows).
+
+    Args:
+        path (str): The path of the export.
+
+    Returns:
+        List: The rows.
+    """
+    if path.endswith(".json"):
+        with open(path) as f:
+            return json.load(f)
+    with open(path, newline="") as f:
+        return [row for row in csv.reader(f)]
+
+
+def load_gsheet(id, range, refresh=False, revision=None, cache=None, max_age=None):
+    """Get the rows of a sheet, calling Google Sheets only if needed.
+
+    `id` can also be the path of a CSV or JSON export of the sheet. Otherwise the
+    rows are read from the GSheetCache without any remote call, and fetched (and
+    cached) only if they are not cached yet, if `refresh` is set or if they are older
+    than `max_age`. In offline mode (GENIE_OFFLINE=1) the sheet is never fetched.
+
+    Args:
+        id (str): The ID of the Google Sheet, or the path of its export.
+        range (str): The range of cells to retrieve.
+        refresh (bool): Fetch the latest version of the sheet.
+        revision (str, optional): Load this cached revision of the sheet.
+        cache (GSheetCache, optional): The cache, GSHEET_CACHE_DIR by default.
+        max_age (float, optional): Fetch the sheet again when the cached rows are
+            older than this, in seconds. GENIE_GSHEET_MAX_AGE by default, never
+            if it is not set.
+
+    Returns:
+        List: A list of values from the specified range in the Google Sheet.
+    """
+    if os.path.isfile(id):
+        return read_sheet_export(id)
+
+    if cache is None:
+        cache = GSheetCache()
+    if max_age is None and GSHEET_MAX_AGE:
+        max_age = float(GSHEET_MAX_AGE)
+
+    if revision is not None:
+        rows = cache.get(id, range, revision)
+        if rows is None:
+            raise ValueError(f"Revision {revision} of the sheet {id} is not cached")
+        return rows
+
+    if not refresh or is_offline():
+        latest = cache.latest(id, range)
+        if latest is not None and (
+            max_age is None
+            or is_offline()
+            or time.time() - latest.get("fetched_at", 0) <= max_age
+        ):
+            rows = cache.get(id, range, latest["revision"])
+            if rows is not None:
+                return rows
+
+    if is_offline():
+        raise ValueError(
+            f"The sheet {id} is not cached and GENIE_OFFLINE is set, "
+            "refresh the cache or use an export of the sheet"
+        )
+
+    rows = retrieve_gsheet(id, range)
+    if rows:
+        cache.put(id, range, rows)
+    return rows
+
+
 def fill_all_empty(rows, desired_columns):
     for row in rows:
         for i in range(desired_columns - len(row)):
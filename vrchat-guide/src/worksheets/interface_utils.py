@@ -25,6 +25,7 @@ def convert_to_json(dialogue: list[CurrentDialogueTurn]):
             "user_target_sp": turn.user_target_sp,
             "user_target": turn.user_target,
             "user_target_suql": turn.user_target_suql,
+            "suql_parse_timings": turn.suql_parse_timings,
         }
         json_dialogue.append(json_turn)
     return json_dialogue
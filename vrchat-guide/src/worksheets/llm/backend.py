@@ -0,0 +1,437 @@
+"""Offline backends for the LLM calls, to benchmark and test without network access.
+
+- record: the chat models of llm_generate (and validation_check) are called as usual
+  and every response is appended to a fixture file, with the time the model took.
+- replay: the responses are read from the fixture file, in the order they were
+  recorded, with a simulated latency. A call that was not recorded fails.
+- standin: the chat models call an OpenAI-compatible server (StandInServer) that
+  answers from a fixture file with a simulated latency. Other clients, such as the
+  chainlite chains, use it by setting their api base to its url.
+
+    from worksheets.llm.backend import configure_llm_backend
+    configure_llm_backend("replay", fixture="turns.jsonl", latency="recorded")
+
+or `WORKSHEETS_LLM_BACKEND=replay WORKSHEETS_LLM_FIXTURE=turns.jsonl`. The time spent
+in the model (recorded or simulated) is in the `stats()` of the backend, or of the
+StandInServer, so the time of a turn can be split between the model latency and the
+overhead of the runtime.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from loguru import logger
+
+MESSAGE_ROLES = {"system": "system", "human": "user", "ai": "assistant"}
+
+# The parameters of a call that change the output of the model, with the values that
+# ChatOpenAI sends when they are not set
+GENERATION_PARAMS = {
+    "temperature": 0.7,
+    "max_tokens": None,
+    "top_p": None,
+    "frequency_penalty": None,
+    "presence_penalty": None,
+    "seed": None,
+    "stop": None,
+    "n": 1,
+    "response_format": None,
+}
+
+
+def generation_params(params: dict | None) -> dict:
+    """The generation parameters (see GENERATION_PARAMS) of the parameters of a chat
+    model, or of a chat completions request."""
+    params = params or {}
+    values = {
+        name: params.get(name, default) for name, default in GENERATION_PARAMS.items()
+    }
+    return {name: value for name, value in values.items() if value is not None}
+
+
+def fixture_key(model: str, messages: list[dict], params: dict | None = None) -> str:
+    """The key of a call in a fixture file: the model (without the `azure/` prefix),
+    the messages as {"role", "content"} and the generation parameters."""
+    model = model.replace("azure/", "")
+    return hashlib.sha256(
+        json.dumps(
+            [model, messages, generation_params(params)], sort_keys=True
+        ).encode()
+    ).hexdigest()
+
+
+def message_dicts(messages: List[BaseMessage]) -> list[dict]:
+    return [
+        {
+            "role": MESSAGE_ROLES.get(message.type, message.type),
+            "content": message.content,
+        }
+        for message in messages
+    ]
+
+
+class Latency:
+    """A distribution of the latency of the model, in seconds.
+
+    The spec is `<seconds>`, `uniform:<low>,<high>`, `lognormal:<mu>,<sigma>` or
+    `recorded` (the time the model took when the call was recorded).
+    """
+
+    def __init__(self, spec: str = "0", seed: int = 0):
+        self.spec = spec
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+        name, _, args = spec.partition(":")
+        self.name = name
+        self.args = [float(arg) for arg in args.split(",")] if args else []
+        if name not in ["uniform", "lognormal", "recorded"]:
+            self.name = "constant"
+            self.args = [float(spec)]
+
+    def sample(self, recorded: float | None = None) -> float:
+        with self._lock:
+            if self.name == "uniform":
+                return self.random.uniform(*self.args)
+            if self.name == "lognormal":
+                return self.random.lognormvariate(*self.args)
+        if self.name == "recorded":
+            return recorded or 0.0
+        return self.args[0]
+
+
+class Fixture:
+    """The calls of a fixture file, one JSON object per line with the key, the model,
+    the messages, the generation parameters, the output and the seconds the model
+    took."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        # key -> the recorded calls, replayed in order
+        self.calls: dict[str, list[dict]] = {}
+        # key -> the number of times it was replayed
+        self._replayed: dict[str, int] = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        call = json.loads(line)
+                        self.calls.setdefault(call["key"], []).append(call)
+
+    def record(
+        self,
+        model: str,
+        messages: list[dict],
+        params: dict | None,
+        output: str,
+        seconds: float,
+    ):
+        call = {
+            "key": fixture_key(model, messages, params),
+            "model": model,
+            "messages": messages,
+            "params": generation_params(params),
+            "output": output,
+            "seconds": seconds,
+        }
+        with self._lock:
+            self.calls.setdefault(call["key"], []).append(call)
+            with open(self.path, "a") as f:
+                f.write(json.dumps(call) + "\n")
+
+    def replay(
+        self, model: str, messages: list[dict], params: dict | None = None
+    ) -> dict | None:
+        """Get the recorded call, the same prompt (with the same generation
+        parameters) gets the recorded outputs in order (and then the last one)."""
+        key = fixture_key(model, messages, params)
+        with self._lock:
+            calls = self.calls.get(key)
+            if not calls:
+                return None
+            index = self._replayed.get(key, 0)
+            self._replayed[key] = index + 1
+            return calls[min(index, len(calls) - 1)]
+
+
+class LLMBackend:
+    """Where the chat models of llm_generate send their calls (see LLMClients)."""
+
+    def __init__(
+        self,
+        # "record", "replay" or "standin"
+        mode: str,
+        fixture: str | None = None,
+        url: str | None = None,
+        # The latency of the replayed calls, see Latency
+        latency: str = "0",
+        seed: int = 0,
+    ):
+        if mode not in ["record", "replay", "standin"]:
+            raise ValueError(f"Unknown LLM backend {mode}")
+        if mode in ["record", "replay"] and fixture is None:
+            raise ValueError(f"The {mode} backend needs a fixture file")
+        if mode == "standin" and url is None:
+            raise ValueError("The standin backend needs the url of the server")
+        self.mode = mode
+        self.fixture = Fixture(fixture) if fixture else None
+        self.url = url
+        self.latency = Latency(latency, seed)
+
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.model_seconds = 0.0
+
+    def add_call(self, seconds: float):
+        with self._lock:
+            self.calls += 1
+            self.model_seconds += seconds
+
+    def chat_model(
+        self,
+        model_name: str,
+        inner: BaseChatModel | None = None,
+        params: dict | None = None,
+    ):
+        """The chat model of llm_generate for this backend.
+
+        Args:
+            model_name (str): The model, `azure/<deployment>` for Azure OpenAI.
+            inner (BaseChatModel | None): The real chat model, for the record mode.
+            params (dict | None): The parameters of the model, e.g. temperature.
+        """
+        return RecordReplayChatModel(
+            backend=self, model=model_name, inner=inner, params=params or {}
+        )
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "calls": self.calls,
+                "model_seconds": self.model_seconds,
+            }
+
+
+class RecordReplayChatModel(BaseChatModel):
+    """Chat model recording the calls of a real chat model, or replaying them."""
+
+    backend: Any
+    model: str
+    inner: Optional[BaseChatModel] = None
+    # The parameters of the model, the generation parameters are part of the key of
+    # the calls in the fixture file
+    params: Dict[str, Any] = {}
+
+    @property
+    def _llm_type(self) -> str:
+        return f"worksheets-{self.backend.mode}"
+
+    def _result(self, output: str) -> ChatResult:
+        return ChatResult(
+            generations=[ChatGeneration(message=AIMessage(content=output))]
+        )
+
+    def _call_params(self, stop, kwargs) -> dict:
+        params = {**self.params, **kwargs}
+        if stop is not None:
+            params["stop"] = stop
+        return params
+
+    def _replayed(self, messages: List[BaseMessage], params: dict) -> tuple[str, float]:
+        call = self.backend.fixture.replay(self.model, message_dicts(messages), params)
+        if call is None:
+            raise LookupError(
+                f"No recorded response of {self.model} for these messages and "
+                f"parameters in {self.backend.fixture.path}"
+            )
+        return call["output"], self.backend.latency.sample(call["seconds"])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        params = self._call_params(stop, kwargs)
+        if self.backend.mode == "replay":
+            output, seconds = self._replayed(messages, params)
+            time.sleep(seconds)
+        else:
+            start = time.perf_counter()
+            output = self.inner.invoke(messages, stop=stop, **kwargs).content
+            seconds = time.perf_counter() - start
+            self.backend.fixture.record(
+                self.model, message_dicts(messages), params, output, seconds
+            )
+        self.backend.add_call(seconds)
+        return self._result(output)
+
+    async def _agenerate(
+        self, messages, stop=None, run_manager=None, **kwargs
+    ) -> ChatResult:
+        params = self._call_params(stop, kwargs)
+        if self.backend.mode == "replay":
+            output, seconds = self._replayed(messages, params)
+            await asyncio.sleep(seconds)
+        else:
+            start = time.perf_counter()
+            output = (await self.inner.ainvoke(messages, stop=stop, **kwargs)).content
+            seconds = time.perf_counter() - start
+            self.backend.fixture.record(
+                self.model, message_dicts(messages), params, output, seconds
+            )
+        self.backend.add_call(seconds)
+        return self._result(output)
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        server: StandInServer = self.server.stand_in
+        output, seconds = server.respond(request["model"], request["messages"], request)
+        time.sleep(seconds)
+
+        body = json.dumps(
+            {
+                "id": "chatcmpl-standin",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request["model"],
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": output},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": 0,
+                    "completion_tokens": 0,
+                    "total_tokens": 0,
+                },
+            }
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StandInServer:
+    """Local OpenAI-compatible chat completions server, answering from a fixture
+    file (or with a default output) after a simulated latency."""
+
+    def __init__(
+        self,
+        fixture: str | None = None,
+        latency: str = "0",
+        # The output of the calls that are not in the fixture file
+        default_output: str = "",
+        host: str = "127.0.0.1",
+        port: int = 0,
+        seed: int = 0,
+    ):
+        self.fixture = Fixture(fixture) if fixture else None
+        self.latency = Latency(latency, seed)
+        self.default_output = default_output
+
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.misses = 0
+        self.model_seconds = 0.0
+
+        self._server = ThreadingHTTPServer((host, port), StandInHandler)
+        self._server.daemon_threads = True
+        self._server.stand_in = self
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def respond(
+        self, model: str, messages: list[dict], params: dict | None = None
+    ) -> tuple[str, float]:
+        """The output of a call and its simulated latency.
+
+        Args:
+            params (dict | None): The parameters of the request, e.g. temperature.
+        """
+        call = self.fixture.replay(model, messages, params) if self.fixture else None
+        if call is None:
+            output = self.default_output
+            seconds = self.latency.sample()
+        else:
+            output = call["output"]
+            seconds = self.latency.sample(call["seconds"])
+        with self._lock:
+            self.calls += 1
+            self.misses += call is None
+            self.model_seconds += seconds
+        return output, seconds
+
+    def start(self) -> StandInServer:
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        logger.info(f"Stand-in LLM server on {self.url}")
+        return self
+
+    def serve_forever(self):
+        logger.info(f"Stand-in LLM server on {self.url}")
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "misses": self.misses,
+                "model_seconds": self.model_seconds,
+            }
+
+
+# The backend of llm_generate, None to call the models
+_backend: LLMBackend | None = None
+
+
+def configure_llm_backend(mode: str | None, **kwargs) -> LLMBackend | None:
+    """Set the backend of llm_generate (see LLMBackend), None for the real models.
+
+    Returns:
+        LLMBackend | None: The backend, e.g. for its stats.
+    """
+    global _backend
+    _backend = LLMBackend(mode, **kwargs) if mode else None
+    return _backend
+
+
+def llm_backend() -> LLMBackend | None:
+    return _backend
+
+
+if os.getenv("WORKSHEETS_LLM_BACKEND"):
+    configure_llm_backend(
+        os.getenv("WORKSHEETS_LLM_BACKEND"),
+        fixture=os.getenv("WORKSHEETS_LLM_FIXTURE"),
+        url=os.getenv("WORKSHEETS_LLM_STANDIN_URL"),
+        latency=os.getenv("WORKSHEETS_LLM_LATENCY", "0"),
+    )
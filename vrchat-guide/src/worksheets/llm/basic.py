@@ -1,23 +1,28 @@
+import asyncio
 import datetime
 import os
+import random
+import threading
 from typing import Any, Dict, List, Optional, Tuple
 
-from langchain.prompts import (
-    ChatPromptTemplate,
-    HumanMessagePromptTemplate,
-    SystemMessagePromptTemplate,
-)
+from jinja2 import meta
+from jinja2.sandbox import SandboxedEnvironment
 from langchain.schema import HumanMessage, StrOutputParser, SystemMessage
 from langchain_community.callbacks.manager import get_openai_callback
 from langchain_openai import AzureChatOpenAI, ChatOpenAI
 from loguru import logger
 
+from worksheets.llm.backend import llm_backend
+from worksheets.llm.cache import llm_cache_bypass
+from worksheets.utils import register_loop_close_hook
+
 current_dir = os.path.dirname(os.path.realpath(__file__))
 
 date_today = datetime.date.today().strftime("%Y-%m-%d")
 logfile = os.path.join(current_dir, "..", "..", "logs", f"worksheets-{date_today}.log")
 
-logger.add(logfile)
+# The log file is written by a background thread, not by the coroutine logging
+logger.add(logfile, enqueue=True)
 
 INSTRUCTION_START = "<|startofinstruction|>"
 INSTRUCTION_END = "<|endofinstruction|>"
@@ -28,6 +33,9 @@ USER_EXAMPLE_END = "<|endofexampleuser|>"
 AI_EXAMPLE_START = "<|startofexampleai|>"
 AI_EXAMPLE_END = "<|endofexampleai|>"
 
+# The fraction of the llm_generate calls whose filled prompt is logged
+prompt_log_sample_rate = float(os.getenv("WORKSHEETS_PROMPT_LOG_SAMPLE_RATE", "1.0"))
+
 config_params = {
     "api_key": os.getenv("AZURE_OPENAI_WS_KEY"),
     "azure_endpoint": os.getenv("AZURE_WS_ENDPOINT"),
@@ -35,6 +43,151 @@ config_params = {
 }
 
 
+class LLMClients:
+    """The chat models used by llm_generate, created once per model and parameters.
+
+    Every chat model has its own HTTP client, so reusing it keeps its connections
+    open between the calls instead of connecting again on every call. The async
+    connections belong to the event loop that opened them, so the chat models are
+    kept per event loop. A loop that ends should close its chat models with aclose
+    (run_sync does), the ones of loops found closed are closed and dropped by get.
+    When an offline backend is configured (see worksheets.llm.backend), the chat
+    models record, replay or call the stand-in server.
+    """
+
+    def __init__(self):
+        # event loop -> {(provider, model, streaming, params, backend): chat model}
+        self._clients = {}
+        self._lock = threading.Lock()
+        # The tasks closing the chat models of the closed loops
+        self._closing = set()
+        self.created = 0
+        self.reused = 0
+        self.closed = 0
+
+    @staticmethod
+    def key(model_name: str, stream: bool, llm_params: dict) -> tuple:
+        if "azure/" in model_name:
+            provider, model = "azure", model_name.replace("azure/", "")
+        else:
+            provider, model = "openai", model_name
+        params = tuple(
+            sorted((name, repr(value)) for name, value in llm_params.items())
+        )
+        return provider, model, stream, params
+
+    def get(self, model_name: str, stream: bool = False, **llm_params):
+        """Get the chat model, creating it the first time it is used in the event loop.
+
+        Args:
+            model_name (str): The model, `azure/<deployment>` for Azure OpenAI.
+            stream (bool): Whether the model streams its output.
+            **llm_params: The parameters of the model, e.g. temperature.
+
+        Returns:
+            BaseChatModel: The chat model.
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        backend = llm_backend()
+        key = self.key(model_name, stream, llm_params) + (backend,)
+
+        with self._lock:
+            dropped = []
+            for other in [
+                other
+                for other in self._clients
+                if other is not None and other.is_closed()
+            ]:
+                dropped.extend(self._clients.pop(other).values())
+            if dropped:
+                self._close_later(dropped, loop)
+            clients = self._clients.setdefault(loop, {})
+
+            llm = clients.get(key)
+            if llm is not None:
+                self.reused += 1
+                return llm
+
+            provider, model = key[:2]
+            if backend is not None and backend.mode == "replay":
+                llm = backend.chat_model(model_name, params=llm_params)
+            elif backend is not None and backend.mode == "standin":
+                llm = ChatOpenAI(
+                    model=model,
+                    streaming=stream,
+                    **{**llm_params, "base_url": backend.url, "api_key": "standin"},
+                )
+            elif provider == "azure":
+                llm = AzureChatOpenAI(
+                    azure_deployment=model,
+                    streaming=stream,
+                    **config_params,
+                    **llm_params,
+                )
+            else:
+                llm = ChatOpenAI(
+                    model=model,
+                    streaming=stream,
+                    **llm_params,
+                )
+            if backend is not None and backend.mode == "record":
+                llm = backend.chat_model(model_name, llm, llm_params)
+            clients[key] = llm
+            self.created += 1
+            return llm
+
+    async def aclose(self):
+        """Close the chat models of the running event loop, before it ends."""
+        with self._lock:
+            clients = self._clients.pop(asyncio.get_running_loop(), {})
+        await self._close(list(clients.values()))
+
+    async def _close(self, llms: list):
+        for llm in llms:
+            # The recorded chat model of the record backend
+            llm = getattr(llm, "inner", None) or llm
+            try:
+                if getattr(llm, "root_client", None) is not None:
+                    llm.root_client.close()
+                if getattr(llm, "root_async_client", None) is not None:
+                    await llm.root_async_client.close()
+            except Exception as e:
+                # The connections of a closed loop cannot always be closed cleanly
+                logger.debug(
+                    f"Cannot close the client of {llm.__class__.__name__}: {e}"
+                )
+            self.closed += 1
+
+    def _close_later(self, llms: list, loop):
+        if loop is None:
+            asyncio.run(self._close(llms))
+            return
+        task = loop.create_task(self._close(llms))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    def clear(self):
+        with self._lock:
+            self._clients.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "loops": len(self._clients),
+                "clients": sum(len(clients) for clients in self._clients.values()),
+                "created": self.created,
+                "reused": self.reused,
+                "closed": self.closed,
+            }
+
+
+llm_clients = LLMClients()
+register_loop_close_hook(llm_clients.aclose)
+
+
 def load_prompt(prompt_file: str) -> Tuple[str, str]:
     with open(prompt_file, "r") as f:
         text = f.read()
@@ -87,6 +240,106 @@ def get_examples(example_path: str) -> List[Tuple[Any, Any]]:
     return list(zip(user_examples, ai_examples))
 
 
+class CompiledPrompt:
+    """A prompt file and its examples, with the jinja2 templates compiled once.
+
+    The messages are the ones of the ChatPromptTemplate built from the prompt
+    (SystemMessagePromptTemplate, the examples, HumanMessagePromptTemplate). The
+    langchain jinja2 templates are compiled again every time they are formatted, so
+    the compiled templates are rendered directly, in the same sandboxed environment.
+    """
+
+    def __init__(self, system_prompt: str, prompt: str, examples: list):
+        environment = SandboxedEnvironment()
+        self.system_template = environment.from_string(system_prompt)
+        self.template = environment.from_string(prompt)
+        self.examples = []
+        for example in examples:
+            self.examples.append(HumanMessage(content=example[0]))
+            self.examples.append(SystemMessage(content=example[1]))
+
+        self.input_variables = sorted(
+            meta.find_undeclared_variables(environment.parse(system_prompt))
+            | meta.find_undeclared_variables(environment.parse(prompt))
+        )
+
+    def format_messages(self, prompt_inputs: Dict[str, Any]) -> list:
+        missing = set(self.input_variables).difference(prompt_inputs)
+        if missing:
+            # Same as the validation of ChatPromptTemplate
+            raise KeyError(
+                f"Input to ChatPromptTemplate is missing variables {missing}. "
+                f" Expected: {self.input_variables}"
+                f" Received: {list(prompt_inputs.keys())}"
+            )
+        return [
+            SystemMessage(content=self.system_template.render(**prompt_inputs)),
+            *self.examples,
+            HumanMessage(content=self.template.render(**prompt_inputs)),
+        ]
+
+
+class PromptTemplates:
+    """The compiled prompts of llm_generate, loaded again when their file changes."""
+
+    def __init__(self):
+        # (prompt file, example file) -> (modification times, CompiledPrompt)
+        self._prompts = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def mtime(path: str | None) -> int | None:
+        try:
+            return os.stat(path).st_mtime_ns if path else None
+        except FileNotFoundError:
+            return None
+
+    def get(self, prompt_file: str, example_file: str | None = None) -> CompiledPrompt:
+        """Get the compiled prompt of the files.
+
+        Args:
+            prompt_file (str): The path of the prompt.
+            example_file (str | None): The path of the examples of the prompt.
+
+        Returns:
+            CompiledPrompt: The compiled prompt.
+        """
+        key = (prompt_file, example_file)
+        mtimes = (self.mtime(prompt_file), self.mtime(example_file))
+        with self._lock:
+            entry = self._prompts.get(key)
+            if entry is not None and entry[0] == mtimes:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        system_prompt, prompt = load_prompt(prompt_file)
+        examples = get_examples(example_file) if example_file else []
+        compiled = CompiledPrompt(system_prompt, prompt, examples)
+        with self._lock:
+            self._prompts[key] = (mtimes, compiled)
+        return compiled
+
+    def clear(self):
+        with self._lock:
+            self._prompts.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "prompts": len(self._prompts),
+            }
+
+
+prompt_templates = PromptTemplates()
+
+
 async def llm_generate(
     prompt_path: str,
     prompt_inputs: Dict[str, Any],
@@ -94,57 +347,34 @@ async def llm_generate(
     example_path: Optional[str] = None,
     model_name: str = "azure/gpt-4o",
     stream=False,
+    # Call the LLM even if the response is cached, see worksheets.llm.cache
+    bypass_cache=False,
     **llm_params,
 ) -> str:
     if prompt_dir is None:
         prompt_dir = os.path.join(current_dir, "..", "prompts")
-    if "azure/" in model_name:
-        llm = AzureChatOpenAI(
-            azure_deployment=model_name.replace("azure/", ""),
-            streaming=stream,
-            **config_params,
-            **llm_params,
-        )
-    else:
-        llm = ChatOpenAI(
-            model=model_name,
-            streaming=stream,
-            **llm_params,
-        )
+    llm = llm_clients.get(model_name, stream, **llm_params)
 
-    system_prompt, prompt = load_prompt(os.path.join(prompt_dir, prompt_path))
     if example_path:
-        examples = get_examples(os.path.join(prompt_dir, example_path, prompt_path))
+        example_file = os.path.join(prompt_dir, example_path, prompt_path)
     else:
-        examples = []
-
-    messages = [
-        SystemMessagePromptTemplate.from_template(
-            system_prompt, template_format="jinja2"
-        )
-    ]
-
-    for example in examples:
-        messages.append(HumanMessage(content=example[0]))
-        messages.append(SystemMessage(content=example[1]))
-
-    messages.append(
-        HumanMessagePromptTemplate.from_template(prompt, template_format="jinja2")
+        example_file = None
+    prompt_template = prompt_templates.get(
+        os.path.join(prompt_dir, prompt_path), example_file
     )
 
-    prompt_template = ChatPromptTemplate.from_messages(messages)
-
-    filled_prompt = await prompt_template.ainvoke(prompt_inputs)
-    filled_prompt_str = ""
-
-    for message in filled_prompt.messages:
-        filled_prompt_str += message.content + "\n"
-    logger.info(f"Prompt===========:\n{filled_prompt_str}")
+    # The prompt is rendered once, the filled messages are given to the model
+    filled_prompt = prompt_template.format_messages(prompt_inputs)
+    if random.random() < prompt_log_sample_rate:
+        filled_prompt_str = ""
+        for message in filled_prompt:
+            filled_prompt_str += message.content + "\n"
+        logger.info(f"Prompt===========:\n{filled_prompt_str}")
 
-    chain = prompt_template | llm | StrOutputParser()
+    chain = llm | StrOutputParser()
 
-    with get_openai_callback() as cb:
-        parsed_output = await chain.ainvoke(prompt_inputs)
+    with get_openai_callback() as cb, llm_cache_bypass(bypass_cache):
+        parsed_output = await chain.ainvoke(filled_prompt)
 
         logger.info(
             f"Total token usage: prompt tokens: {cb.prompt_tokens}, completion tokens: {cb.completion_tokens}"
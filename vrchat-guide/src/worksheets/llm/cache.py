@@ -0,0 +1,295 @@
+"""Persistent cache of the responses of the deterministic LLM calls.
+
+The semantic parser and the SUQL parser call the LLM at temperature 0, and the same
+prompts come back often (evaluation replays, baseline reruns, the same first
+questions from many users). The cache is a langchain cache, so it is used by every
+chat model of the process: the ones of llm_generate and the ones of the chainlite
+chains. It is opt-in:
+
+    from worksheets.llm.cache import enable_llm_cache
+    enable_llm_cache("llm_cache.sqlite", ttl=7 * 24 * 3600)
+
+or `WORKSHEETS_LLM_CACHE=llm_cache.sqlite`. The turns that must get a fresh response
+are run in `with llm_cache_bypass(): ...`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import warnings
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Optional, Sequence
+
+from langchain_core._api import LangChainBetaWarning
+from langchain_core.caches import BaseCache
+from langchain_core.globals import get_llm_cache, set_llm_cache
+from langchain_core.load import dumps, loads
+from langchain_core.outputs import Generation
+from loguru import logger
+
+# The cached responses are loaded with langchain's serialization
+warnings.filterwarnings(
+    "ignore", category=LangChainBetaWarning, message="The function `loads` is in beta"
+)
+
+# The temperature in the serialized chat model or in the parameters of the call
+_temperature_pattern = re.compile(r"""["']temperature["'](?::|,) ?([-+0-9.eE]+)""")
+
+# Set in the turns that must not use the cached responses, see llm_cache_bypass
+_bypass: ContextVar[bool] = ContextVar("llm_cache_bypass", default=False)
+
+
+@contextmanager
+def llm_cache_bypass(bypass: bool = True):
+    """Call the LLM instead of using the cached responses (which are not updated
+    either) in this block, including the coroutines it starts. A nested block cannot
+    turn the bypass off."""
+    token = _bypass.set(_bypass.get() or bypass)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+
+def is_deterministic(llm_string: str) -> bool:
+    """Whether the chat model is called at temperature 0, i.e. its response can be
+    reused for the same messages."""
+    matches = _temperature_pattern.findall(llm_string)
+    if not matches:
+        return False
+    try:
+        return float(matches[-1]) == 0.0
+    except ValueError:
+        return False
+
+
+class LLMResponseCache(BaseCache):
+    """SQLite cache of the LLM responses, with a time to live and a size budget.
+
+    The key is the hash of the chat model with its parameters (langchain's
+    llm_string, which includes the model name and the temperature) and of the
+    rendered messages. When the stored responses are over the budget, the least
+    recently used ones are deleted. The times the responses are used are written in
+    batches (when a response is stored, or every `flush_every` hits), so a hit only
+    reads the database. The async versions run in a worker thread.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        # Seconds after which a response is called again, None to keep it
+        ttl: Optional[float] = None,
+        # The total size of the stored responses, in bytes of utf-8
+        max_bytes: int = 256 * 1024 * 1024,
+        # The number of hits whose time of use is kept in memory before writing them
+        flush_every: int = 64,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.flush_every = flush_every
+        self._lock = threading.Lock()
+        # key -> the time the response was last used, not written yet
+        self._used: dict[str, float] = {}
+        self._unflushed_hits = 0
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses "
+            "(key TEXT PRIMARY KEY, response TEXT, size INTEGER, created REAL, "
+            "used REAL)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS responses_used ON responses (used)"
+        )
+        self._db.commit()
+        self._bytes = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.bypassed = 0
+        self.stores = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{llm_string}\0{prompt}".encode()).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[Sequence[Generation]]:
+        if not is_deterministic(llm_string):
+            return None
+        if _bypass.get():
+            self.bypassed += 1
+            return None
+
+        key = self.key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT response, size, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and self.ttl is not None and now - row[2] > self.ttl:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db.commit()
+                self._bytes -= row[1]
+                self._used.pop(key, None)
+                self.expired += 1
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+
+            self._used[key] = now
+            self._unflushed_hits += 1
+            if self._unflushed_hits >= self.flush_every:
+                self._flush_used()
+                self._db.commit()
+            self.hits += 1
+
+        try:
+            return [loads(generation) for generation in json.loads(row[0])]
+        except Exception as e:
+            logger.error(f"Cannot load the cached LLM response: {e}")
+            return None
+
+    def update(
+        self, prompt: str, llm_string: str, return_val: Sequence[Generation]
+    ) -> None:
+        if not is_deterministic(llm_string) or _bypass.get():
+            return
+
+        key = self.key(prompt, llm_string)
+        response = json.dumps([dumps(generation) for generation in return_val])
+        size = len(response.encode())
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT size FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                self._bytes -= row[0]
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, response, size, now, now),
+            )
+            self._bytes += size
+            self._used.pop(key, None)
+            self.stores += 1
+            self._flush_used()
+            self._evict()
+            self._db.commit()
+
+    def _flush_used(self):
+        """Write the times of use kept in memory, the caller commits."""
+        if self._used:
+            self._db.executemany(
+                "UPDATE responses SET used = ? WHERE key = ?",
+                [(used, key) for key, used in self._used.items()],
+            )
+            self._used.clear()
+        self._unflushed_hits = 0
+
+    def flush(self):
+        """Write the times the responses were used."""
+        with self._lock:
+            self._flush_used()
+            self._db.commit()
+
+    def _evict(self):
+        while self._bytes > self.max_bytes:
+            rows = self._db.execute(
+                "SELECT key, size FROM responses ORDER BY used LIMIT 64"
+            ).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if self._bytes <= self.max_bytes:
+                    break
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._bytes -= size
+                self.evictions += 1
+
+    # asyncio.to_thread runs them with the context of the caller, see llm_cache_bypass
+    async def alookup(
+        self, prompt: str, llm_string: str
+    ) -> Optional[Sequence[Generation]]:
+        return await asyncio.to_thread(self.lookup, prompt, llm_string)
+
+    async def aupdate(
+        self, prompt: str, llm_string: str, return_val: Sequence[Generation]
+    ) -> None:
+        await asyncio.to_thread(self.update, prompt, llm_string, return_val)
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
+            self._used.clear()
+            self._unflushed_hits = 0
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            stored = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "expired": self.expired,
+                "bypassed": self.bypassed,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "stored_responses": stored,
+                "stored_bytes": self._bytes,
+            }
+
+    def close(self):
+        self.flush()
+        self._db.close()
+
+
+def enable_llm_cache(
+    path: str, ttl: Optional[float] = None, max_bytes: int = 256 * 1024 * 1024
+) -> LLMResponseCache:
+    """Cache the responses of the deterministic LLM calls of the process.
+
+    Args:
+        path (str): The path of the SQLite database.
+        ttl (float | None): Seconds after which a response is called again.
+        max_bytes (int): The total size of the stored responses, in bytes.
+
+    Returns:
+        LLMResponseCache: The cache, e.g. for its stats.
+    """
+    cache = LLMResponseCache(path, ttl=ttl, max_bytes=max_bytes)
+    set_llm_cache(cache)
+    return cache
+
+
+def llm_cache() -> LLMResponseCache | None:
+    """The cache enabled by enable_llm_cache, if any."""
+    cache = get_llm_cache()
+    return cache if isinstance(cache, LLMResponseCache) else None
+
+
+if os.getenv("WORKSHEETS_LLM_CACHE"):
+    enable_llm_cache(
+        os.getenv("WORKSHEETS_LLM_CACHE"),
+        ttl=(
+            float(os.getenv("WORKSHEETS_LLM_CACHE_TTL"))
+            if os.getenv("WORKSHEETS_LLM_CACHE_TTL")
+            else None
+        ),
+    )
@@ -1,5 +1,6 @@
+import asyncio
 import inspect
-from typing import Dict, Union
+from typing import Union
 
 from loguru import logger
 
@@ -8,8 +9,8 @@ from worksheets.environment import (
     Answer,
     AskAgentAct,
     AskForConfirmationAgentAct,
+    ContextCheckpoint,
     GenieContext,
-    GenieField,
     GenieRuntime,
     GenieType,
     GenieValue,
@@ -17,49 +18,14 @@ from worksheets.environment import (
     any_open_empty_ws,
     count_number_of_vars,
     eval_predicates,
+    field_validator,
     generate_var_name,
-    genie_deepcopy,
     get_genie_fields_from_ws,
     get_variable_name,
-    same_field,
-    same_worksheet,
+    validations_on_loop,
 )
 
 
-def diff_between_contexts(context1: Dict, context2: Dict):
-    """Given two contexts, return the difference between them.
-
-    There is a special case for GenieWorksheets and GenieFields.
-
-    Args:
-        context1 (Dict): The first context.
-        context2 (Dict): The second context.
-
-    Returns:
-        Dict: The difference between the two contexts.
-    """
-    diff = {}
-    for key, value in context2.items():
-        if key not in context1:
-            diff[key] = value
-        else:
-            # special case for GenieWorksheets
-            if isinstance(value, GenieWorksheet) and isinstance(
-                context1[key], GenieWorksheet
-            ):
-                if not same_worksheet(value, context1[key]):
-                    diff[key] = value
-            # special case for GenieFields
-            elif isinstance(value, GenieField) and isinstance(
-                context1[key], GenieField
-            ):
-                if not same_field(value, context1[key]):
-                    diff[key] = value
-            elif value != context1[key]:
-                diff[key] = value
-    return diff
-
-
 def discover_objects(
     local_context: GenieContext, answer_objects, ws_objects, type_objects, bot
 ):
@@ -102,20 +68,37 @@ def discover_objects(
         bot.context.agent_acts.extend(incoming_actions)
 
 
+async def arun_agent_policy(current_dlg_turn, bot):
+    """Run the agent policy of the turn without blocking the event loop.
+
+    The values of the user target are validated concurrently first, then the policy
+    runs in a worker thread (with a copy of the context, e.g. the active session). The
+    values it still has to validate are validated on the event loop.
+
+    Args:
+        current_dlg_turn (CurrentDialogueTurn): The current dialogue turn.
+        bot (Agent): The bot instance.
+    """
+    if current_dlg_turn.user_target is not None:
+        await field_validator.prevalidate(current_dlg_turn.user_target, bot)
+    with validations_on_loop(asyncio.get_running_loop()):
+        await asyncio.to_thread(run_agent_policy, current_dlg_turn, bot)
+
+
 def run_agent_policy(current_dlg_turn, bot):
     user_target = current_dlg_turn.user_target
     if user_target is None:
         user_target = ""
     user_target_by_line = user_target.split("\n")
 
-    # We need to keep the original global context to be able to compare it with the new one
+    # We need to keep a checkpoint of the global context to find the objects that are updated by the user target
     # This helps in detecting the objects that have been updated. Useful for executing actions for lets say confirm fields.
-    original_global_context = genie_deepcopy(bot.context.context)
+    checkpoint = ContextCheckpoint(bot.context.context, bot.context_snapshots)
     turn_context = GenieContext()
 
     # First we execute the user target and then generate the agent acts
-    original_global_context = _code_execution_and_policy_generation(
-        user_target_by_line, original_global_context, turn_context, bot
+    checkpoint = _code_execution_and_policy_generation(
+        user_target_by_line, checkpoint, turn_context, bot
     )
 
     # Check if we can have other acts. The set of agent acts can have:
@@ -126,7 +109,7 @@ def run_agent_policy(current_dlg_turn, bot):
         code_strings = get_available_ws(turn_context, bot)
         if len(code_strings):
             _code_execution_and_policy_generation(
-                code_strings, original_global_context, turn_context, bot
+                code_strings, checkpoint, turn_context, bot
             )
 
         bot.update_from_context(turn_context)
@@ -166,8 +149,13 @@ def get_available_ws(turn_context, bot):
 
 
 def _update_current_dlg_turn(current_dlg_turn, turn_context, bot):
-    current_dlg_turn.context.update(genie_deepcopy(turn_context.context))
-    current_dlg_turn.global_context.update(genie_deepcopy(bot.context.context))
+    # The snapshots share the objects that did not change with the previous turns
+    current_dlg_turn.context.update(
+        bot.context_snapshots.snapshot(turn_context.context)
+    )
+    current_dlg_turn.global_context.update(
+        bot.context_snapshots.snapshot(bot.context.context)
+    )
 
     if current_dlg_turn.system_action is None:
         current_dlg_turn.system_action = bot.context.agent_acts
@@ -176,7 +164,7 @@ def _update_current_dlg_turn(current_dlg_turn, turn_context, bot):
 
 
 def _code_execution_and_policy_generation(
-    user_target_by_line, original_global_context, turn_context, bot
+    user_target_by_line, checkpoint: ContextCheckpoint, turn_context, bot
 ):
     for code_line in user_target_by_line:
         if code_line == "":
@@ -186,10 +174,8 @@ def _code_execution_and_policy_generation(
         # Execute the code line by line
         bot.execute(code_line, local_context, sp=True)
 
-        # Get the difference between the original global context and the current context
-        diff_context = diff_between_contexts(
-            original_global_context, bot.context.context
-        )
+        # Get the objects of the global context that are new or were updated by the code line
+        diff_context = checkpoint.modified_variables(bot.context.context)
 
         # add context from the global context to the local context
         # but only for the keys that are not available in global context
@@ -207,8 +193,8 @@ def _code_execution_and_policy_generation(
         # Update the global context with the local context
         bot.update_from_context(local_context)
 
-        # For the next line, the new context is the original global context
-        original_global_context = genie_deepcopy(bot.context.context)
+        # For the next line, the changes are relative to the current global context
+        checkpoint = ContextCheckpoint(bot.context.context, bot.context_snapshots)
         turn_context.update(local_context.context)
 
     # Go over all the objects and find ask confirmation or ask question actions
@@ -220,8 +206,9 @@ def _code_execution_and_policy_generation(
     if bot.context.agent_acts.can_have_other_acts():
         discover_and_execute_ordered(bot)
 
-    # TODO: Why do return the original_global_context and not the bot.context.context?
-    return original_global_context
+    # The changes made by the policy above are found as modifications by the next
+    # call (the worksheets opened by get_available_ws)
+    return checkpoint
 
 
 def discover_and_execute_ordered(bot):
@@ -37,3 +37,6 @@ class CurrentDialogueTurn:
 
     # User's target SUQL query
     user_target_suql: str = None
+
+    # Time spent parsing every answer query to SUQL, as (query, seconds)
+    suql_parse_timings: List[tuple] = None
@@ -29,7 +29,7 @@ class FindFunctionCalls(ast.NodeTransformer):
         # Process nested function calls with keyword arguments
         self.generic_visit(node)
         # For args
-        logger.debug(f"[+] Entering Call {ast.dump(node)}")
+        logger.opt(lazy=True).debug("[+] Entering Call {}", lambda: ast.dump(node))
         for i, arg in enumerate(node.args):
             if isinstance(arg, ast.Call):
                 if isinstance(arg.func, ast.Name):
@@ -55,12 +55,12 @@ class FindFunctionCalls(ast.NodeTransformer):
                     else:
                         kw.value = ast.Name(id=var_name, ctx=ast.Load())
 
-        logger.debug(f"[-] Exiting Call {ast.dump(node)}")
+        logger.opt(lazy=True).debug("[-] Exiting Call {}", lambda: ast.dump(node))
         return node
 
     def visit_Attribute(self, node: Attribute) -> Any:
         self.generic_visit(node)
-        logger.debug(f"[+] Entering Attribute {ast.dump(node)}")
+        logger.opt(lazy=True).debug("[+] Entering Attribute {}", lambda: ast.dump(node))
         if (
             isinstance(node.value, ast.Call)
             and node.value.func.id in self.valid_functions
@@ -71,12 +71,12 @@ class FindFunctionCalls(ast.NodeTransformer):
             else:
                 node.value = ast.Name(id=var_name, ctx=ast.Load())
 
-        logger.debug(f"[-] Exiting Attribute {ast.dump(node)}")
+        logger.opt(lazy=True).debug("[-] Exiting Attribute {}", lambda: ast.dump(node))
         return node
 
     def visit_Expr(self, node: Expr) -> Any:
         self.generic_visit(node)
-        logger.debug(f"[+] Entering Expr {ast.dump(node)}")
+        logger.opt(lazy=True).debug("[+] Entering Expr {}", lambda: ast.dump(node))
         if (
             isinstance(node.value, ast.Call)
             and isinstance(node.value.func, ast.Name)
@@ -89,12 +89,12 @@ class FindFunctionCalls(ast.NodeTransformer):
                 node.value = ast.Name(id=var_name, ctx=ast.Load())
         else:
             self.assignments.append(node)
-        logger.debug(f"[-] Exiting Expr {ast.dump(node)}")
+        logger.opt(lazy=True).debug("[-] Exiting Expr {}", lambda: ast.dump(node))
         return node
 
     def visit_Assign(self, node: Assign) -> Any:
         self.generic_visit(node)
-        logger.debug(f"[+] Entering Assing {ast.dump(node)}")
+        logger.opt(lazy=True).debug("[+] Entering Assing {}", lambda: ast.dump(node))
         if (
             isinstance(node.value, ast.Call)
             and isinstance(node.value.func, ast.Name)
@@ -106,7 +106,7 @@ class FindFunctionCalls(ast.NodeTransformer):
             else:
                 node.value = ast.Name(id=var_name, ctx=ast.Load())
 
-        logger.debug(f"[-] Exiting Assign {ast.dump(node)}")
+        logger.opt(lazy=True).debug("[-] Exiting Assign {}", lambda: ast.dump(node))
         return node
 
     def _generate_var_name(self, name):
@@ -131,7 +131,9 @@ class FindFunctionCalls(ast.NodeTransformer):
         # Create a new variable and add it to assignments
         new_var = ast.Name(id=var_name, ctx=ast.Store())
         new_assignment = ast.Assign(targets=[new_var], value=value)
-        logger.debug(f"[*] Exiting Create New Variable {ast.dump(new_assignment)}")
+        logger.opt(lazy=True).debug(
+            "[*] Exiting Create New Variable {}", lambda: ast.dump(new_assignment)
+        )
         self.assignments.append(new_assignment)
 
         return var_name
@@ -258,8 +260,6 @@ def rewrite_code_to_extract_funcs(
     # new_tree = genie_value_transformer.visit(new_tree)
     new_code = ast.unparse(ast.fix_missing_locations(new_tree))
 
-    print(new_code)
-
     return new_code.strip()
 
 
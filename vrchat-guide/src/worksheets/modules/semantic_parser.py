@@ -1,6 +1,8 @@
+import asyncio
 import datetime
 import os
 import re
+import time
 
 from loguru import logger
 from sql_metadata import Parser
@@ -19,6 +21,9 @@ from worksheets.utils import extract_code_block_from_output
 
 current_dir = os.path.dirname(__file__)
 
+# The number of answer queries of a user target parsed to SUQL at the same time
+MAX_CONCURRENT_SUQL_PARSES = 4
+
 
 async def semantic_parsing(current_dlg_turn, dlg_history, bot):
     # Reset the agent acts
@@ -83,43 +88,36 @@ async def _nl_to_code(current_dlg_turn, dlg_history, bot: GenieRuntime, **kwargs
     )
 
     # extract `answer("query")` where query is a string from user_target
+    # The queries are parsed concurrently (once if the same query is asked twice)
+    semaphore = asyncio.BoundedSemaphore(MAX_CONCURRENT_SUQL_PARSES)
+
+    async def parse(answer_query):
+        async with semaphore:
+            logger.info(f"Answer query: {answer_query}")
+            start = time.perf_counter()
+            parsed = await _answer_to_suql(dlg_history, answer_query, bot)
+            return parsed, time.perf_counter() - start
 
     answer_queries, pattern_type = extract_answer(user_target)
+    unique_queries = list(dict.fromkeys(answer_queries))
+    results = dict(
+        zip(
+            unique_queries,
+            await asyncio.gather(
+                *[parse(answer_query[1:-1]) for answer_query in unique_queries]
+            ),
+        )
+    )
+    current_dlg_turn.suql_parse_timings = [
+        (answer_query[1:-1], seconds) for answer_query, (_, seconds) in results.items()
+    ]
+
+    # The results are applied in the order of the queries in the code
     suql_queries = []
     for answer_query in answer_queries:
-        logger.info(f"Answer query: {answer_query}")
-        suql_query = await bot.suql_parser.parse(dlg_history, answer_query[1:-1], bot)
-
-        if suql_query is None:
-            logger.error(f"SUQL parsing failed for {answer_query}")
-            suql_query = ""
-
-        suql_query = suql_query.replace("\*", "*")
-
-        if "SELECT" in suql_query:
-            tables = Parser(suql_query).tables
-
-            # Check for required parameters in the tables
-            table_req_params = {}
-            for table in tables:
-                req_params, table_class = get_required_params_in_table(table, bot)
-                table_req_params[table] = req_params
-
-            _, unfilled_params = _check_required_params(suql_query, table_req_params)
-        else:
-            tables = []
-            unfilled_params = {}
-
+        (suql_query, unfilled_params, tables), _ = results[answer_query]
         suql_queries.append(suql_query)
 
-        # If query has unfilled params, but the primary key is filled, then we don't need required params
-        if len(unfilled_params) > 0:
-            id_filled, _ = _check_required_params(
-                suql_query, get_table_primary_keys(bot)
-            )
-            if id_filled:
-                unfilled_params = {}
-
         # Semantic parser generates a new Answer object
         if pattern_type == "func":
             answer_str = f"Answer({repr(suql_query)}, {unfilled_params}, {tables}, {repr(answer_query[1:-1])})"
@@ -136,6 +134,42 @@ async def _nl_to_code(current_dlg_turn, dlg_history, bot: GenieRuntime, **kwargs
     return user_target.strip(), suql_queries
 
 
+async def _answer_to_suql(dlg_history, answer_query: str, bot: GenieRuntime):
+    """Parse the answer query to SUQL.
+
+    Returns:
+        tuple: The SUQL query, the unfilled required parameters and the tables."""
+    suql_query = await bot.suql_parser.parse(dlg_history, answer_query, bot)
+
+    if suql_query is None:
+        logger.error(f"SUQL parsing failed for {answer_query}")
+        suql_query = ""
+
+    suql_query = suql_query.replace("\*", "*")
+
+    if "SELECT" in suql_query:
+        tables = Parser(suql_query).tables
+
+        # Check for required parameters in the tables
+        table_req_params = {}
+        for table in tables:
+            req_params, table_class = get_required_params_in_table(table, bot)
+            table_req_params[table] = req_params
+
+        _, unfilled_params = _check_required_params(suql_query, table_req_params)
+    else:
+        tables = []
+        unfilled_params = {}
+
+    # If query has unfilled params, but the primary key is filled, then we don't need required params
+    if len(unfilled_params) > 0:
+        id_filled, _ = _check_required_params(suql_query, get_table_primary_keys(bot))
+        if id_filled:
+            unfilled_params = {}
+
+    return suql_query, unfilled_params, tables
+
+
 def get_table_primary_keys(bot):
     """Get the primary keys for all tables in the bot's database models.
 
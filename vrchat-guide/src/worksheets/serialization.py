@@ -0,0 +1,490 @@
+"""Compact binary snapshots of the state of a conversation (GenieSession).
+
+A snapshot holds the context of the session (its worksheets, fields and agent acts),
+the dialogue history and the order of the actions. Everything defined by the
+runtime (worksheet classes, database models, apis, enums) is stored by name and
+resolved against the runtime the snapshot is restored into, so only the values of
+the fields and the other per-session objects are written.
+
+The objects are written once and referenced by their index afterwards, which keeps
+the sharing between the dialogue turns (see GenieContextSnapshots) and the cycles
+between worksheets and their fields.
+
+Format: MAGIC, the format version (1 byte), the codec (1 byte, msgpack if it is
+installed, JSON otherwise, see snapshot_codec) and the zlib compressed payload.
+"""
+
+from __future__ import annotations
+
+import datetime
+import json
+import zlib
+from enum import Enum
+from functools import cache, partial
+from typing import List, get_args, get_origin
+
+from loguru import logger
+
+from worksheets.environment import (
+    Action,
+    AgentAct,
+    AgentActs,
+    Answer,
+    AskAgentAct,
+    AskForConfirmationAgentAct,
+    GenieContext,
+    GenieField,
+    GenieFieldSpec,
+    GenieResult,
+    GenieRuntime,
+    GenieSession,
+    GenieValue,
+    GenieWorksheet,
+    MoreFieldInfo,
+    ProposeAgentAct,
+    ReportAgentAct,
+    answer_clarification_question,
+    get_genie_fields_from_ws,
+)
+from worksheets.modules.dialogue import CurrentDialogueTurn
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MAGIC = b"GWSS"
+FORMAT_VERSION = 2
+
+CODEC_JSON = 0
+CODEC_MSGPACK = 1
+
+CODEC_NAMES = {CODEC_JSON: "json", CODEC_MSGPACK: "msgpack"}
+
+# Tags of the encoded objects, an encoded object is a list starting with its tag
+REF = 0
+LIST = 1
+TUPLE = 2
+DICT = 3
+VALUE = 4
+RESULT = 5
+FIELD = 6
+WORKSHEET = 7
+SPEC = 8
+CLASS = 9
+TYPE = 10
+LIST_TYPE = 11
+ENUM = 12
+DATE = 13
+TIME = 14
+DATETIME = 15
+ACTION = 16
+ACT = 17
+AGENT_ACTS = 18
+CONTEXT = 19
+TURN = 20
+
+SCALAR_TYPES = {bool, int, float, str}
+
+# Types that can be used as the slottype of a field or stored as a value
+BUILTIN_TYPES = {
+    t.__name__: t
+    for t in [str, int, float, bool, list, dict, datetime.date, datetime.time]
+}
+
+AGENT_ACT_TYPES = {
+    t.__name__: t
+    for t in [ReportAgentAct, AskAgentAct, ProposeAgentAct, AskForConfirmationAgentAct]
+}
+
+TURN_FIELDS = tuple(CurrentDialogueTurn.__dataclass_fields__)
+
+SPEC_FIELDS = tuple(GenieFieldSpec.__dataclass_fields__)
+
+# Attributes that are only meaningful in the process that created the object
+TRANSIENT_ATTRIBUTES = {"_version"}
+
+
+def runtime_classes(runtime: GenieRuntime) -> dict[str, type]:
+    """Get the worksheet classes whose instances can be stored in a session."""
+    classes = {cls.__name__: cls for cls in [Answer, MoreFieldInfo]}
+    for ws in runtime.genie_worksheets + runtime.genie_db_models:
+        classes[ws.__name__] = ws
+    return classes
+
+
+def runtime_enums(runtime: GenieRuntime) -> dict[str, type]:
+    """Get the Enum classes used as the slottypes of the fields of the runtime."""
+    enums = {}
+    for ws in runtime.genie_worksheets + runtime.genie_db_models:
+        for field in get_genie_fields_from_ws(ws):
+            for slottype in [field.slottype, *get_args(field.slottype)]:
+                if isinstance(slottype, type) and issubclass(slottype, Enum):
+                    enums[slottype.__name__] = slottype
+    return enums
+
+
+class SessionEncoder:
+    """Encode the objects of a session into lists and scalars."""
+
+    def __init__(self, runtime: GenieRuntime):
+        self.runtime = runtime
+        self.classes = runtime_classes(runtime)
+        # id of an object defined by the runtime -> its name in the context
+        self.spec_names = {}
+        for name, value in runtime._spec_variables:
+            self.spec_names.setdefault(id(value), name)
+        # id of an object -> (index of the object, object)
+        self.memo = {}
+
+    def encode(self, obj):
+        if obj is None or type(obj) in SCALAR_TYPES:
+            return obj
+        if isinstance(obj, Enum):
+            return [ENUM, obj.__class__.__name__, obj.name]
+        if isinstance(obj, (bool, int, float, str)):
+            return obj
+
+        entry = self.memo.get(id(obj))
+        if entry is not None:
+            return [REF, entry[0]]
+
+        if id(obj) in self.spec_names:
+            return [SPEC, self.spec_names[id(obj)]]
+        if isinstance(obj, partial) and obj.func is answer_clarification_question:
+            # bound to the context of the session, see GenieRuntime.new_session
+            return [SPEC, "answer_clarification_question"]
+        if isinstance(obj, type):
+            return self.encode_type(obj)
+        if get_origin(obj) is list:
+            return [LIST_TYPE, self.encode(get_args(obj)[0])]
+
+        # Every other object is given an index, before its content is encoded
+        # in case it refers back to the object
+        self.memo[id(obj)] = (len(self.memo), obj)
+
+        if isinstance(obj, list):
+            return [LIST, [self.encode(item) for item in obj]]
+        if isinstance(obj, tuple):
+            return [TUPLE, [self.encode(item) for item in obj]]
+        if isinstance(obj, dict):
+            return [DICT, self.encode_items(obj)]
+        if isinstance(obj, GenieResult):
+            return [
+                RESULT,
+                self.encode(obj.value),
+                obj.confirmed,
+                self.encode(obj.parent),
+                obj.parent_var_name,
+            ]
+        if isinstance(obj, GenieValue):
+            return [VALUE, self.encode(obj.value), obj.confirmed]
+        if isinstance(obj, GenieField):
+            return self.encode_field(obj)
+        if isinstance(obj, GenieWorksheet):
+            return [
+                WORKSHEET,
+                obj.__class__.__name__,
+                self.encode_items(
+                    {
+                        key: value
+                        for key, value in obj.__dict__.items()
+                        if key not in TRANSIENT_ATTRIBUTES
+                    }
+                ),
+            ]
+        if isinstance(obj, datetime.datetime):
+            return [DATETIME, obj.isoformat()]
+        if isinstance(obj, datetime.date):
+            return [DATE, obj.isoformat()]
+        if isinstance(obj, datetime.time):
+            return [TIME, obj.isoformat()]
+        if isinstance(obj, Action):
+            return [ACTION, obj.action]
+        if isinstance(obj, AgentAct):
+            return [ACT, obj.__class__.__name__, self.encode_items(obj.__dict__)]
+        if isinstance(obj, AgentActs):
+            return [
+                AGENT_ACTS,
+                self.encode(obj.args),
+                [self.encode(action) for action in obj.actions],
+            ]
+        if isinstance(obj, GenieContext):
+            return [
+                CONTEXT,
+                self.encode_items(
+                    {
+                        key: value
+                        for key, value in obj.context.items()
+                        if key != "__builtins__"
+                    }
+                ),
+                self.encode(obj.agent_acts),
+            ]
+        if isinstance(obj, CurrentDialogueTurn):
+            return [TURN, [self.encode(getattr(obj, name)) for name in TURN_FIELDS]]
+
+        raise TypeError(f"Cannot serialize {obj.__class__.__name__}: {obj!r}")
+
+    def encode_items(self, items: dict) -> list:
+        encoded = []
+        for key, value in items.items():
+            encoded.append(self.encode(key))
+            encoded.append(self.encode(value))
+        return encoded
+
+    def encode_type(self, cls: type):
+        if cls.__name__ in self.classes and self.classes[cls.__name__] is cls:
+            return [CLASS, cls.__name__]
+        if BUILTIN_TYPES.get(cls.__name__) is cls:
+            return [TYPE, cls.__name__]
+        if issubclass(cls, Enum):
+            return [ENUM, cls.__name__, None]
+        raise TypeError(f"Cannot serialize the type {cls.__name__}")
+
+    def encode_field(self, field: GenieField):
+        parent_class = (
+            field.parent
+            if isinstance(field.parent, type)
+            else field.parent.__class__ if field.parent is not None else None
+        )
+        class_field = (
+            parent_class.__dict__.get(field.name) if parent_class is not None else None
+        )
+        if isinstance(class_field, GenieField) and class_field.spec is field.spec:
+            # the spec of the field defined on the worksheet class
+            spec = [CLASS, parent_class.__name__]
+        else:
+            spec = [self.encode(getattr(field.spec, name)) for name in SPEC_FIELDS]
+
+        return [
+            FIELD,
+            spec,
+            field.name,
+            self.encode(field._value),
+            field._confirmed,
+            field.action_performed,
+            self.encode(field.parent),
+        ]
+
+
+class SessionDecoder:
+    """Rebuild the objects encoded by SessionEncoder for a runtime."""
+
+    def __init__(self, runtime: GenieRuntime, session: GenieSession):
+        self.runtime = runtime
+        self.session = session
+        self.classes = runtime_classes(runtime)
+        self.enums = runtime_enums(runtime)
+        self.spec = {name: value for name, value in runtime._spec_variables}
+        self.spec["answer_clarification_question"] = partial(
+            answer_clarification_question, context=session.context
+        )
+        # index -> object, in the order of SessionEncoder.memo
+        self.objects = []
+
+    def decode(self, data):
+        if not isinstance(data, list):
+            return data
+
+        tag = data[0]
+        if tag == REF:
+            return self.objects[data[1]]
+        if tag == SPEC:
+            return self.spec[data[1]]
+        if tag == CLASS:
+            return self.worksheet_class(data[1])
+        if tag == TYPE:
+            return BUILTIN_TYPES[data[1]]
+        if tag == LIST_TYPE:
+            return List[self.decode(data[1])]
+        if tag == ENUM:
+            enum = self.enums.get(data[1])
+            if enum is None:
+                raise ValueError(f"Unknown enum {data[1]}")
+            return enum if data[2] is None else enum[data[2]]
+
+        index = len(self.objects)
+        self.objects.append(None)
+
+        if tag == LIST:
+            obj = self.objects[index] = []
+            obj.extend(self.decode(item) for item in data[1])
+        elif tag == TUPLE:
+            obj = self.objects[index] = tuple(self.decode(item) for item in data[1])
+        elif tag == DICT:
+            obj = self.objects[index] = {}
+            obj.update(self.decode_items(data[1]))
+        elif tag == VALUE:
+            obj = self.objects[index] = GenieValue.__new__(GenieValue)
+            obj.value = self.decode(data[1])
+            obj.confirmed = data[2]
+        elif tag == RESULT:
+            obj = self.objects[index] = GenieResult.__new__(GenieResult)
+            obj.value = self.decode(data[1])
+            obj.confirmed = data[2]
+            obj.parent = self.decode(data[3])
+            obj.parent_var_name = data[4]
+        elif tag == FIELD:
+            obj = self.objects[index] = self.decode_field(data, index)
+        elif tag == WORKSHEET:
+            cls = self.worksheet_class(data[1])
+            obj = self.objects[index] = cls.__new__(cls)
+            # the attributes are restored as they were, without GenieWorksheet.__setattr__
+            obj.__dict__.update(self.decode_items(data[2]))
+        elif tag == DATETIME:
+            obj = self.objects[index] = datetime.datetime.fromisoformat(data[1])
+        elif tag == DATE:
+            obj = self.objects[index] = datetime.date.fromisoformat(data[1])
+        elif tag == TIME:
+            obj = self.objects[index] = datetime.time.fromisoformat(data[1])
+        elif tag == ACTION:
+            obj = self.objects[index] = Action(data[1])
+        elif tag == ACT:
+            cls = AGENT_ACT_TYPES[data[1]]
+            obj = self.objects[index] = cls.__new__(cls)
+            obj.__dict__.update(self.decode_items(data[2]))
+        elif tag == AGENT_ACTS:
+            obj = self.objects[index] = AgentActs({})
+            obj.args = self.decode(data[1])
+            for action in data[2]:
+                action = self.decode(action)
+                obj.actions.append(action)
+                obj._index(action)
+        elif tag == CONTEXT:
+            # the first context is the one of the session (see dump_session), the
+            # partial of answer_clarification_question is bound to it
+            obj = self.objects[index] = (
+                self.session.context if index == 0 else GenieContext()
+            )
+            for key, value in self.decode_items(data[1]):
+                obj.context[key] = value
+            obj.agent_acts = self.decode(data[2])
+        elif tag == TURN:
+            obj = self.objects[index] = CurrentDialogueTurn()
+            for name, value in zip(TURN_FIELDS, data[1]):
+                setattr(obj, name, self.decode(value))
+        else:
+            raise ValueError(f"Unknown tag {tag}")
+        return obj
+
+    def decode_items(self, data: list):
+        for i in range(0, len(data), 2):
+            yield self.decode(data[i]), self.decode(data[i + 1])
+
+    def decode_field(self, data: list, index: int) -> GenieField:
+        _, spec, name, value, confirmed, action_performed, parent = data
+        if isinstance(spec, list) and spec[0] == CLASS:
+            spec = self.worksheet_class(spec[1]).__dict__[name].spec
+        else:
+            spec = GenieFieldSpec(
+                **{key: self.decode(item) for key, item in zip(SPEC_FIELDS, spec)}
+            )
+
+        field = GenieField.__new__(GenieField)
+        self.objects[index] = field
+        field.spec = spec
+        field.action_performed = action_performed
+        field._value = self.decode(value)
+        field._confirmed = confirmed
+        field.parent = self.decode(parent)
+        field.track_value()
+        field.touch()
+        return field
+
+    def worksheet_class(self, name: str) -> type:
+        cls = self.classes.get(name)
+        if cls is None:
+            raise ValueError(f"Unknown worksheet {name}")
+        return cls
+
+
+@cache
+def default_codec() -> int:
+    """The codec of the snapshots, msgpack if it is installed and JSON otherwise."""
+    if msgpack is not None:
+        return CODEC_MSGPACK
+    logger.warning(
+        "msgpack is not installed, the session snapshots are written as JSON "
+        "(install worksheets[session] for smaller and faster snapshots)"
+    )
+    return CODEC_JSON
+
+
+def snapshot_codec(snapshot: bytes) -> str:
+    """Get the name of the codec of a snapshot, "msgpack" or "json"."""
+    return CODEC_NAMES[snapshot[len(MAGIC) + 1]]
+
+
+def dump_session(
+    runtime: GenieRuntime,
+    session: GenieSession | None = None,
+    codec: int | None = None,
+) -> bytes:
+    """Serialize the state of a conversation.
+
+    Args:
+        runtime (GenieRuntime): The runtime of the session.
+        session (GenieSession | None): The session, the active session by default.
+        codec (int | None): CODEC_MSGPACK or CODEC_JSON, see default_codec.
+
+    Returns:
+        bytes: The snapshot.
+    """
+    if session is None:
+        session = runtime.session
+    if codec is None:
+        codec = default_codec()
+    if codec == CODEC_MSGPACK and msgpack is None:
+        raise ValueError("msgpack is required to write msgpack session snapshots")
+
+    encoder = SessionEncoder(runtime)
+    payload = [
+        encoder.encode(session.context),
+        encoder.encode(session.dlg_history),
+        encoder.encode(session.order_of_actions),
+    ]
+    if codec == CODEC_MSGPACK:
+        data = msgpack.packb(payload, use_bin_type=True)
+    elif codec == CODEC_JSON:
+        data = json.dumps(payload, separators=(",", ":")).encode()
+    else:
+        raise ValueError(f"Unknown session snapshot codec {codec}")
+    return MAGIC + bytes([FORMAT_VERSION, codec]) + zlib.compress(data, 1)
+
+
+def load_session(runtime: GenieRuntime, snapshot: bytes) -> GenieSession:
+    """Restore a conversation serialized by dump_session.
+
+    Args:
+        runtime (GenieRuntime): A runtime with the same worksheets, database models
+            and apis as the one the snapshot was taken from.
+        snapshot (bytes): The snapshot.
+
+    Returns:
+        GenieSession: The restored session, see GenieRuntime.activate.
+    """
+    header = len(MAGIC) + 2
+    if snapshot[: len(MAGIC)] != MAGIC:
+        raise ValueError("Not a session snapshot")
+    version, codec = snapshot[len(MAGIC)], snapshot[len(MAGIC) + 1]
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported session snapshot version {version}")
+
+    data = zlib.decompress(snapshot[header:])
+    if codec == CODEC_MSGPACK:
+        if msgpack is None:
+            raise ValueError("msgpack is required to load this session snapshot")
+        payload = msgpack.unpackb(data, raw=False)
+    elif codec == CODEC_JSON:
+        payload = json.loads(data)
+    else:
+        raise ValueError(f"Unknown session snapshot codec {codec}")
+
+    session = GenieSession(runtime)
+    decoder = SessionDecoder(runtime, session)
+    context, dlg_history, order_of_actions = payload
+    decoder.decode(context)
+    session.dlg_history = decoder.decode(dlg_history)
+    session.order_of_actions = decoder.decode(order_of_actions)
+    return session
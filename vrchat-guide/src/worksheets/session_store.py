@@ -0,0 +1,273 @@
+"""Sessions of the conversations served by one GenieRuntime, with a memory budget.
+
+The most recently used sessions are kept in memory. When their estimated size goes
+over the budget, the least recently used ones are saved to a SQLite database (see
+worksheets.serialization) and dropped from memory, and they are restored on the
+next message of their conversation.
+"""
+
+from __future__ import annotations
+
+import builtins
+import gc
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from types import BuiltinFunctionType, FunctionType, MethodType, ModuleType
+
+from loguru import logger
+
+from worksheets.environment import GenieRuntime, GenieSession
+from worksheets.serialization import dump_session, load_session
+
+# Objects that are shared by all the sessions, not counted in their size
+_shared_types = (type, ModuleType, FunctionType, BuiltinFunctionType, MethodType)
+
+
+def resident_size(session: GenieSession) -> int:
+    """Measure the memory used by the state of a session: the sizes (sys.getsizeof)
+    of the objects reachable from its context, dialogue history and order of actions,
+    without the runtime and what it shares with the other sessions (classes,
+    functions, modules and builtins).
+
+    Args:
+        session (GenieSession): The session.
+
+    Returns:
+        int: The size in bytes.
+    """
+    seen = {id(session.runtime), id(builtins.__dict__)}
+    stack = [session.context.context, session.dlg_history, session.order_of_actions]
+    size = 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, _shared_types):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        stack.extend(gc.get_referents(obj))
+    return size
+
+
+class SessionStore:
+    """LRU store of GenieSessions that spills the idle sessions to disk.
+
+    The budget limits the memory of the sessions kept in memory, as estimated from
+    the size of their objects (see resident_size), not the size of their snapshots,
+    which are compressed. Measuring a session walks all its objects, so it is only
+    measured when it is restored and every `measure_every` messages. In between, its
+    size grows by the average size of a dialogue turn (measured over all the
+    sessions) for every new turn. The sessions that are handling a message are not
+    evicted, so the budget can be exceeded while they are in use.
+    """
+
+    def __init__(
+        self,
+        runtime: GenieRuntime,
+        path: str,
+        # The estimated memory of the sessions kept in memory
+        max_bytes: int = 64 * 1024 * 1024,
+        # The number of messages of a session between two measures of its size
+        measure_every: int = 8,
+    ):
+        self.runtime = runtime
+        self.path = path
+        self.max_bytes = max_bytes
+        self.measure_every = measure_every
+
+        # session id -> (session, size)
+        self._resident: OrderedDict[str, tuple[GenieSession, int]] = OrderedDict()
+        self._resident_bytes = 0
+        # session id -> (measured size, number of turns then, messages since then)
+        self._measures: dict[str, tuple[int, int, int]] = {}
+        # The total of the measured sizes and of their turns, for the size of a turn
+        self._measured_bytes = 0
+        self._measured_turns = 0
+        # session id -> number of messages being handled, these are not evicted
+        self._in_use: dict[str, int] = {}
+        self._lock = threading.RLock()
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions "
+            "(id TEXT PRIMARY KEY, snapshot BLOB, updated REAL)"
+        )
+        self._db.commit()
+
+        self.measures = 0
+        self.measure_seconds = 0.0
+        self.evictions = 0
+        self.eviction_seconds = 0.0
+        self.rehydrations = 0
+        self.rehydration_seconds = 0.0
+
+    def get(self, session_id: str) -> GenieSession:
+        """Get the session, restoring it from disk or creating it if needed.
+
+        Args:
+            session_id (str): The id of the conversation.
+
+        Returns:
+            GenieSession: The session.
+        """
+        with self._lock:
+            entry = self._resident.get(session_id)
+            if entry is not None:
+                self._resident.move_to_end(session_id)
+                return entry[0]
+
+            row = self._db.execute(
+                "SELECT snapshot FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+            if row is None:
+                session = self.runtime.new_session()
+            else:
+                start = time.perf_counter()
+                session = load_session(self.runtime, row[0])
+                self._db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+                self._db.commit()
+                self.rehydration_seconds += time.perf_counter() - start
+                self.rehydrations += 1
+
+            size = self._measure(session_id, session)
+            self._resident[session_id] = (session, size)
+            self._resident_bytes += size
+            return session
+
+    def put(self, session_id: str, session: GenieSession):
+        """Update the size of the session after it was modified, evicting the least
+        recently used sessions if the store is over its budget.
+
+        Args:
+            session_id (str): The id of the conversation.
+            session (GenieSession): The session.
+        """
+        with self._lock:
+            size = self._estimate(session_id, session)
+            entry = self._resident.pop(session_id, None)
+            if entry is not None:
+                self._resident_bytes -= entry[1]
+            self._resident[session_id] = (session, size)
+            self._resident_bytes += size
+            self._evict()
+
+    def _measure(self, session_id: str, session: GenieSession) -> int:
+        start = time.perf_counter()
+        size = resident_size(session)
+        self.measure_seconds += time.perf_counter() - start
+        self.measures += 1
+
+        turns = len(session.dlg_history)
+        previous = self._measures.get(session_id)
+        if previous is not None:
+            self._measured_bytes -= previous[0]
+            self._measured_turns -= previous[1]
+        self._measures[session_id] = (size, turns, 0)
+        self._measured_bytes += size
+        self._measured_turns += turns
+        return size
+
+    def _estimate(self, session_id: str, session: GenieSession) -> int:
+        measure = self._measures.get(session_id)
+        if measure is None or measure[2] + 1 >= self.measure_every:
+            return self._measure(session_id, session)
+
+        size, turns, messages = measure
+        self._measures[session_id] = (size, turns, messages + 1)
+        new_turns = len(session.dlg_history) - turns
+        if new_turns <= 0 or not self._measured_turns:
+            return size
+        return size + new_turns * self._measured_bytes // self._measured_turns
+
+    @contextmanager
+    def activate(self, session_id: str):
+        """Handle a message of the conversation with its session active.
+
+        Args:
+            session_id (str): The id of the conversation.
+        """
+        with self._lock:
+            self._in_use[session_id] = self._in_use.get(session_id, 0) + 1
+            session = self.get(session_id)
+        try:
+            with self.runtime.activate(session):
+                yield session
+        finally:
+            with self._lock:
+                self._in_use[session_id] -= 1
+                if not self._in_use[session_id]:
+                    del self._in_use[session_id]
+            self.put(session_id, session)
+
+    def discard(self, session_id: str):
+        """Forget the session, when its conversation has ended."""
+        with self._lock:
+            entry = self._resident.pop(session_id, None)
+            if entry is not None:
+                self._resident_bytes -= entry[1]
+            self._forget_measure(session_id)
+            self._db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            self._db.commit()
+
+    def _evict(self):
+        for session_id in list(self._resident):
+            if self._resident_bytes <= self.max_bytes:
+                break
+            if session_id in self._in_use:
+                continue
+
+            start = time.perf_counter()
+            session, size = self._resident.pop(session_id)
+            self._forget_measure(session_id)
+            self._db.execute(
+                "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?)",
+                (session_id, dump_session(self.runtime, session), time.time()),
+            )
+            self._db.commit()
+            self._resident_bytes -= size
+            self.eviction_seconds += time.perf_counter() - start
+            self.evictions += 1
+            logger.debug(f"Evicted session {session_id} ({size} bytes)")
+
+    def _forget_measure(self, session_id: str):
+        measure = self._measures.pop(session_id, None)
+        if measure is not None:
+            self._measured_bytes -= measure[0]
+            self._measured_turns -= measure[1]
+
+    def stats(self) -> dict:
+        with self._lock:
+            resident = len(self._resident)
+            stored = self._db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+            return {
+                "resident_sessions": resident,
+                "resident_bytes": self._resident_bytes,
+                "bytes_per_session": (
+                    self._resident_bytes / resident if resident else 0.0
+                ),
+                "stored_sessions": stored,
+                "measures": self.measures,
+                "measure_ms": (
+                    self.measure_seconds * 1000 / self.measures
+                    if self.measures
+                    else 0.0
+                ),
+                "evictions": self.evictions,
+                "eviction_ms": (
+                    self.eviction_seconds * 1000 / self.evictions
+                    if self.evictions
+                    else 0.0
+                ),
+                "rehydrations": self.rehydrations,
+                "rehydration_ms": (
+                    self.rehydration_seconds * 1000 / self.rehydrations
+                    if self.rehydrations
+                    else 0.0
+                ),
+            }
+
+    def close(self):
+        self._db.close()
@@ -1,8 +1,14 @@
+import asyncio
 import re
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial
 
 import tiktoken
 
+# Coroutine functions awaited by run_sync before its event loop ends, e.g. to close
+# the clients opened on the loop (see register_loop_close_hook)
+loop_close_hooks = []
+
 
 def callable_name(any_callable):
     if isinstance(any_callable, partial):
@@ -63,3 +69,41 @@ def num_tokens_from_string(string: str, model: str = "gpt-3.5-turbo") -> int:
     encoding = tiktoken.encoding_for_model(model)
     num_tokens = len(encoding.encode(string))
     return num_tokens
+
+
+def register_loop_close_hook(hook):
+    """Register a coroutine function that run_sync awaits before its event loop ends.
+
+    Args:
+        hook: The coroutine function, called without arguments on the loop.
+
+    Returns:
+        The hook.
+    """
+    loop_close_hooks.append(hook)
+    return hook
+
+
+def run_sync(coroutine):
+    """Run a coroutine to completion from synchronous code.
+
+    If an event loop is already running in this thread (e.g. sync code called from a
+    coroutine), the coroutine is run on a new event loop in another thread. The loop
+    close hooks are awaited before the loop ends, e.g. the chat models created on
+    the loop are closed (see LLMClients).
+    """
+
+    async def run():
+        try:
+            return await coroutine
+        finally:
+            for hook in loop_close_hooks:
+                await hook()
+
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(run())
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, run()).result()
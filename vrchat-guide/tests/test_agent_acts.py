@@ -0,0 +1,163 @@
+import random
+
+import pytest
+
+from worksheets.environment import (
+    Action,
+    AgentActs,
+    AskAgentAct,
+    AskForConfirmationAgentAct,
+    GenieField,
+    GenieResult,
+    GenieRuntime,
+    GenieValue,
+    ProposeAgentAct,
+    ReportAgentAct,
+    get_genie_fields_from_ws,
+    same_worksheet,
+)
+from worksheets.from_spreadsheet import create_class
+
+
+class ReferenceAgentActs:
+    """The rules of AgentActs, comparing every act with all the acts added before."""
+
+    def __init__(self):
+        self.actions = []
+
+    def add(self, action):
+        if self.should_add(action):
+            self.actions.append(action)
+
+    def of_type(self, name):
+        return [action for action in self.actions if type(action).__name__ == name]
+
+    def should_add(self, incoming_action):
+        act_type = type(incoming_action).__name__
+        if act_type == "ReportAgentAct":
+            return not any(
+                action.query == incoming_action.query
+                and action.message == incoming_action.message
+                for action in self.of_type("ReportAgentAct")
+            )
+        if act_type == "ProposeAgentAct":
+            if self.of_type("AskAgentAct") or self.of_type(
+                "AskForConfirmationAgentAct"
+            ):
+                return False
+            return not any(
+                action.params == incoming_action.params
+                and same_worksheet(action.ws, incoming_action.ws)
+                for action in self.of_type("ProposeAgentAct")
+            )
+        return self.can_have_other_acts()
+
+    def can_have_other_acts(self):
+        return not any(
+            self.of_type(name)
+            for name in ["ProposeAgentAct", "AskAgentAct", "AskForConfirmationAgentAct"]
+        )
+
+
+@pytest.fixture(scope="module")
+def worksheets():
+    bot = GenieRuntime(name="test", prompt_dir=None, api=[])
+    worksheets = []
+    for name in ["Restaurant", "Booking"]:
+        fields = [
+            {
+                "slottype": str,
+                "name": field_name,
+                "description": "",
+                "predicate": "",
+                "actions": Action(""),
+            }
+            for field_name in ["name", "time"]
+        ]
+        _, ws = create_class(name, fields, "worksheet", "", Action(""), "", [])
+        bot.add_worksheet(ws)
+        worksheets.append(ws)
+    return worksheets
+
+
+def random_value(rng):
+    return rng.choice(
+        [None, "a", "b", 1, 1.0, True, ("a",), GenieValue("a"), ["a"], {"x": "a"}]
+    )
+
+
+def random_act(rng, worksheets):
+    kind = rng.choice(["report", "report", "report", "propose", "ask", "confirm"])
+    if kind == "report":
+        query = rng.choice(
+            [
+                None,
+                "q1",
+                "q2",
+                GenieField("str", "query", value=rng.choice(["q1", "q2"])),
+            ]
+        )
+        message = rng.choice(
+            [random_value(rng), GenieResult(rng.choice([["r"], "r"]), None, "answer")]
+        )
+        return ReportAgentAct(query, message)
+
+    ws_class = rng.choice(worksheets)
+    ws = ws_class(name=rng.choice(["a", "b"]), time=rng.choice([None, "7"]))
+    if kind == "propose":
+        params = rng.choice([{"name": "a"}, {"name": random_value(rng)}, {}, None])
+        return ProposeAgentAct(ws, params)
+    field = get_genie_fields_from_ws(ws)[0]
+    if kind == "ask":
+        return AskAgentAct(ws, field)
+    return AskForConfirmationAgentAct(ws, field)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_same_acts_as_reference(seed, worksheets):
+    rng = random.Random(seed)
+    for _ in range(100):
+        reference = ReferenceAgentActs()
+        acts = AgentActs({})
+        for _ in range(rng.randint(1, 15)):
+            act = random_act(rng, worksheets)
+            assert bool(acts.should_add(act)) == reference.should_add(act)
+            reference.add(act)
+            acts.add(act)
+            assert acts.actions == reference.actions
+            assert acts.can_have_other_acts() == reference.can_have_other_acts()
+
+
+def test_extend_skips_duplicate_reports():
+    acts = AgentActs({})
+    acts.extend([ReportAgentAct("q", "m"), ReportAgentAct("q", "m")])
+    acts.extend([ReportAgentAct("q", "other"), ReportAgentAct(None, "m")])
+    assert [(act.query, act.message) for act in acts] == [
+        ("q", "m"),
+        ("q", "other"),
+        (None, "m"),
+    ]
+
+
+def test_mutated_value_in_params(worksheets):
+    restaurant = worksheets[0]
+    value = GenieValue("a")
+    acts = AgentActs({})
+    acts.add(ProposeAgentAct(restaurant(name="a"), {"name": value}))
+
+    # The params hold a mutable value, so they are compared with their current value
+    value.value = "b"
+    assert not acts.should_add(ProposeAgentAct(restaurant(name="a"), {"name": "b"}))
+    assert acts.should_add(ProposeAgentAct(restaurant(name="a"), {"name": "a"}))
+
+
+def test_mutated_query_of_report():
+    query = GenieField("str", "query", value="q1")
+    acts = AgentActs({})
+    acts.add(ReportAgentAct(query, "m"))
+
+    query.value = "q2"
+    assert not acts.should_add(
+        ReportAgentAct(GenieField("str", "query", value="q2"), "m")
+    )
+    assert acts.should_add(ReportAgentAct(GenieField("str", "query", value="q1"), "m"))
@@ -0,0 +1,128 @@
+import csv
+from enum import Enum
+from typing import get_args, get_origin
+
+from worksheets.codegen import FIELD_ARGUMENTS, generate_module, import_module_file
+from worksheets.environment import Action, get_genie_fields_from_ws
+from worksheets.from_spreadsheet import gsheet_to_genie
+
+
+def row(**cells):
+    """A row of the sheet, the cells are given by the name of their column."""
+    columns = [
+        "form_predicate",
+        "form_name",
+        "field_predicate",
+        "kind",
+        "field_type",
+        "field_name",
+        "enum",
+        "description",
+        "dont_ask",
+        "required",
+        "confirmation",
+        "field_action",
+        "form_action",
+        "validation",
+        "empty",
+    ]
+    return [cells.get(column, "") for column in columns]
+
+
+ROWS = [
+    row(form_name="Form Name"),
+    row(form_name="Location", field_type="type"),
+    row(kind="input", field_type="str", field_name="city", required="TRUE"),
+    row(
+        form_predicate="profile.username",
+        form_name="Event",
+        field_type="worksheet",
+        field_name="add_event",
+        form_action=">add_event(event_name=self.event_name)",
+    ),
+    row(
+        kind="input",
+        field_type="str",
+        field_name="event_name",
+        description="The name of the event",
+        required="TRUE",
+        confirmation="TRUE",
+        validation="A short name",
+    ),
+    row(kind="input", field_type="Enum", field_name="level", dont_ask="TRUE"),
+    row(enum="Beginner"),
+    row(enum="Expert"),
+    row(kind="input", field_type="List[Location]", field_name="venues"),
+    row(
+        field_predicate="self.level == 'Expert'",
+        kind="internal",
+        field_type="bool",
+        field_name="is_private",
+        field_action="say('The event is private')",
+    ),
+    row(kind="output", field_type="Location"),
+]
+
+
+def describe_type(slottype):
+    if get_origin(slottype) is list:
+        return ["List", describe_type(get_args(slottype)[0])]
+    if isinstance(slottype, type) and issubclass(slottype, Enum):
+        return ["Enum", slottype.__name__, [member.name for member in slottype]]
+    if isinstance(slottype, type):
+        return slottype.__name__
+    return slottype
+
+
+def describe_value(value):
+    if isinstance(value, Action):
+        return ["Action", value.action]
+    return value
+
+
+def describe(cls):
+    """The specs of the fields of a class, and its other attributes."""
+    return {
+        "name": cls.__name__,
+        "bases": [base.__name__ for base in cls.__bases__],
+        "fields": [
+            {
+                argument: (
+                    describe_type(field.slottype)
+                    if argument == "slottype"
+                    else describe_value(getattr(field.spec, argument))
+                )
+                for argument in FIELD_ARGUMENTS
+            }
+            for field in get_genie_fields_from_ws(cls)
+        ],
+        "outputs": [output.__name__ for output in getattr(cls, "outputs", [])],
+        "attributes": {
+            attr: describe_value(cls.__dict__[attr])
+            for attr in ["predicate", "actions", "backend_api"]
+            if attr in cls.__dict__
+        },
+    }
+
+
+def test_the_generated_module_defines_the_classes_of_the_sheet(tmp_path):
+    export = tmp_path / "sheet.csv"
+    with open(export, "w", newline="") as f:
+        csv.writer(f).writerows(ROWS)
+
+    path = tmp_path / "spec.py"
+    path.write_text(generate_module(str(export)))
+    module = import_module_file(str(path), "spec")
+
+    for classes, generated in zip(
+        gsheet_to_genie(str(export)), [module.worksheets, module.dbs, module.types]
+    ):
+        assert [describe(cls) for cls in generated] == [
+            describe(cls) for cls in classes
+        ]
+
+    event = describe(module.Event)
+    assert event["outputs"] == ["Location"]
+    assert event["fields"][1]["slottype"] == ["Enum", "level", ["Beginner", "Expert"]]
+    assert event["fields"][2]["slottype"] == ["List", "Location"]
+    assert event["fields"][3]["predicate"] == "self.level == 'Expert'"
@@ -0,0 +1,53 @@
+import asyncio
+import threading
+
+import pytest
+
+from worksheets import environment
+from worksheets.environment import FieldValidator, validations_on_loop
+
+
+@pytest.fixture
+def validations(monkeypatch):
+    """Replace the LLM validation, recording the thread each validation runs on."""
+    threads = []
+
+    async def validation_check(name, value, validation):
+        threads.append(threading.current_thread())
+        return value != "bad", None
+
+    monkeypatch.setattr(environment, "validation_check", validation_check)
+    return threads
+
+
+def test_check_memoizes_the_verdicts(validations):
+    validator = FieldValidator()
+    assert validator.check("name", "bad", "not bad") == (False, None)
+    assert validator.check("name", " bad ", "not bad") == (False, None)
+    assert validator.check("name", "good", "not bad") == (True, None)
+    assert len(validations) == 2
+    assert validator.stats()["hits"] == 1
+    assert validator.stats()["misses"] == 2
+
+
+def test_check_in_worker_thread_runs_on_the_loop(validations):
+    validator = FieldValidator()
+
+    async def turn():
+        with validations_on_loop(asyncio.get_running_loop()):
+            return await asyncio.to_thread(validator.check, "name", "bad", "rule")
+
+    assert asyncio.run(turn()) == (False, None)
+    # The validation ran on the thread of the event loop, not on a new loop
+    assert validations == [threading.main_thread()]
+
+
+def test_check_in_the_loop_does_not_block(validations):
+    validator = FieldValidator()
+
+    async def turn():
+        with validations_on_loop(asyncio.get_running_loop()):
+            return validator.check("name", "bad", "rule")
+
+    assert asyncio.run(turn()) == (False, None)
+    assert len(validations) == 1
@@ -0,0 +1,79 @@
+import json
+
+import pytest
+
+from worksheets import codegen, gsheet_utils
+from worksheets.codegen import load_gsheet_module
+from worksheets.gsheet_utils import GSheetCache, load_gsheet
+
+
+@pytest.fixture
+def sheet(monkeypatch):
+    """A remote sheet, counting the calls that fetch its rows."""
+    sheet = {"rows": [["a"]], "fetches": 0}
+
+    def retrieve_gsheet(id, range):
+        sheet["fetches"] += 1
+        return sheet["rows"]
+
+    monkeypatch.setattr(gsheet_utils, "retrieve_gsheet", retrieve_gsheet)
+    monkeypatch.delenv("GENIE_OFFLINE", raising=False)
+    return sheet
+
+
+def test_cached_rows_are_served_without_remote_calls(sheet, tmp_path, monkeypatch):
+    cache = GSheetCache(str(tmp_path))
+    assert load_gsheet("sheet", "A1:B2", cache=cache) == [["a"]]
+    sheet["rows"] = [["b"]]
+    assert load_gsheet("sheet", "A1:B2", cache=cache) == [["a"]]
+    assert sheet["fetches"] == 1
+
+    assert load_gsheet("sheet", "A1:B2", refresh=True, cache=cache) == [["b"]]
+    assert sheet["fetches"] == 2
+
+    sheet["rows"] = [["c"]]
+    assert load_gsheet("sheet", "A1:B2", cache=cache, max_age=60) == [["b"]]
+    monkeypatch.setattr(gsheet_utils.time, "time", lambda: 1e12)
+    assert load_gsheet("sheet", "A1:B2", cache=cache, max_age=60) == [["c"]]
+    assert sheet["fetches"] == 3
+
+
+def test_offline_uses_the_cached_rows(sheet, tmp_path, monkeypatch):
+    cache = GSheetCache(str(tmp_path))
+    revision = cache.put("sheet", "A1:B2", [["a"]])
+    sheet["rows"] = [["b"]]
+
+    monkeypatch.setenv("GENIE_OFFLINE", "1")
+    assert load_gsheet("sheet", "A1:B2", refresh=True, cache=cache) == [["a"]]
+    with pytest.raises(ValueError):
+        load_gsheet("other", "A1:B2", cache=cache)
+    assert sheet["fetches"] == 0
+
+    monkeypatch.delenv("GENIE_OFFLINE")
+    assert load_gsheet("sheet", "A1:B2", refresh=True, cache=cache) == [["b"]]
+    assert load_gsheet("sheet", "A1:B2", revision=revision, cache=cache) == [["a"]]
+
+
+def test_the_compiled_worksheets_are_cached_by_revision(tmp_path, monkeypatch):
+    header = [""] * 15
+    form = ["", "Event", "", "", "worksheet"] + [""] * 10
+    field = ["", "", "", "input", "str", "name", "", "The name"] + [""] * 7
+    export = tmp_path / "sheet.json"
+    export.write_text(json.dumps([header, form, field]))
+    cache = GSheetCache(str(tmp_path / "cache"))
+
+    module = load_gsheet_module(str(export), cache=cache)
+    assert [ws.__name__ for ws in module.worksheets] == ["Event"]
+
+    def rows_to_genie(rows):
+        raise AssertionError("the rows are parsed again")
+
+    monkeypatch.setattr(codegen, "rows_to_genie", rows_to_genie)
+    again = load_gsheet_module(str(export), cache=cache)
+    assert again.Event is not module.Event
+    assert again.Event.name.description == "The name"
+
+    field[7] = "The name of the event"
+    export.write_text(json.dumps([header, form, field]))
+    with pytest.raises(AssertionError):
+        load_gsheet_module(str(export), cache=cache)
@@ -0,0 +1,42 @@
+import pytest
+
+from worksheets.environment import GenieContext, GenieRuntime, sanitize_dev_code
+
+
+@pytest.fixture
+def bot():
+    return GenieRuntime(name="test", prompt_dir=None, api=[])
+
+
+def variables(context: GenieContext) -> dict:
+    return {
+        name: value for name, value in context.context.items() if name != "__builtins__"
+    }
+
+
+def test_assignment_to_attribute_of_undefined_name(bot):
+    context = GenieContext()
+    bot.execute("y = 1\nundefined_obj.x = 5\nz = 2", context, sp=True)
+    assert variables(context) == {"y": 1, "z": 2}
+
+
+def test_read_of_attribute_of_undefined_name(bot):
+    context = GenieContext()
+    bot.execute("y = undefined_obj.x\nz = 2", context, sp=True)
+    assert variables(context) == {"y": None, "z": 2}
+
+
+def test_error_stops_the_execution(bot):
+    context = GenieContext()
+    bot.execute("y = 1\nz = 1 / 0\nw = 2", context, sp=True)
+    assert variables(context) == {"y": 1}
+
+
+def test_sanitize_dev_code():
+    variables = frozenset(["name", "level"])
+    assert (
+        sanitize_dev_code("say(f'Hi {name}') if level else obj.name", variables)
+        == "say(f'Hi {name.value}') if level.value else obj.name.value\n"
+    )
+    # Invalid code is left unchanged
+    assert sanitize_dev_code("say('Hi' + name", variables) == "say('Hi' + name\n"
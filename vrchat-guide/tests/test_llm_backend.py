@@ -0,0 +1,36 @@
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import HumanMessage
+
+from worksheets.llm.backend import LLMBackend, StandInServer
+
+
+def test_replayed_calls_have_the_recorded_parameters(tmp_path):
+    fixture = str(tmp_path / "fixture.jsonl")
+    messages = [HumanMessage(content="Hi")]
+
+    recorder = LLMBackend("record", fixture=fixture)
+    for temperature, output in [(0.0, "cold"), (1.0, "hot")]:
+        inner = FakeListChatModel(responses=[output])
+        llm = recorder.chat_model(
+            "gpt-4o", inner, {"temperature": temperature, "api_key": "secret"}
+        )
+        assert llm.invoke(messages).content == output
+
+    replayer = LLMBackend("replay", fixture=fixture)
+    for temperature, output in [(0.0, "cold"), (1.0, "hot")]:
+        llm = replayer.chat_model("gpt-4o", params={"temperature": temperature})
+        assert llm.invoke(messages).content == output
+    with pytest.raises(LookupError):
+        replayer.chat_model("gpt-4o", params={"temperature": 0.0}).invoke(
+            messages, stop=["\n"]
+        )
+
+    # The stand-in server gets the parameters in the request, with the defaults
+    server = StandInServer(fixture, default_output="missed").start()
+    request = {"model": "gpt-4o", "n": 1, "stream": False, "temperature": 0.0}
+    request_messages = [{"content": "Hi", "role": "user"}]
+    assert server.respond("gpt-4o", request_messages, request)[0] == "cold"
+    request["max_tokens"] = 10
+    assert server.respond("gpt-4o", request_messages, request)[0] == "missed"
+    server.stop()
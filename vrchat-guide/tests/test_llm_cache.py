@@ -0,0 +1,57 @@
+import asyncio
+import itertools
+
+from langchain_core.outputs import Generation
+
+from worksheets.llm import cache as cache_module
+from worksheets.llm.cache import LLMResponseCache, llm_cache_bypass
+
+LLM = '{"model_name": "gpt-4o", "temperature": 0.0}'
+
+
+def used_times(cache):
+    return dict(cache._db.execute("SELECT key, used FROM responses").fetchall())
+
+
+def test_times_of_use_are_written_in_batches(tmp_path, monkeypatch):
+    clock = itertools.count()
+    monkeypatch.setattr(cache_module.time, "time", lambda: float(next(clock)))
+    cache = LLMResponseCache(str(tmp_path / "cache.sqlite"), flush_every=3)
+    cache.update("prompt", LLM, [Generation(text="response")])
+    stored = used_times(cache)
+
+    for _ in range(2):
+        assert cache.lookup("prompt", LLM)[0].text == "response"
+    assert used_times(cache) == stored
+
+    cache.lookup("prompt", LLM)
+    assert used_times(cache) != stored
+    assert cache.stats()["hits"] == 3
+    cache.close()
+
+
+def test_size_is_in_bytes(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / "cache.sqlite"))
+    cache.update("ascii", LLM, [Generation(text="a" * 10)])
+    ascii_bytes = cache.stats()["stored_bytes"]
+    cache.clear()
+    # "é" is 2 bytes in utf-8, but 1 character
+    cache.update("accents", LLM, [Generation(text="é" * 10)])
+    assert cache.stats()["stored_bytes"] > ascii_bytes
+    cache.close()
+
+
+def test_async_lookup_sees_the_bypass(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / "cache.sqlite"))
+
+    async def turn():
+        await cache.aupdate("prompt", LLM, [Generation(text="response")])
+        hit = await cache.alookup("prompt", LLM)
+        with llm_cache_bypass():
+            bypassed = await cache.alookup("prompt", LLM)
+        return hit, bypassed
+
+    hit, bypassed = asyncio.run(turn())
+    assert hit[0].text == "response"
+    assert bypassed is None
+    cache.close()
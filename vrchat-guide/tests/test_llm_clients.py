@@ -0,0 +1,51 @@
+import asyncio
+
+from worksheets.llm.basic import LLMClients, llm_clients
+from worksheets.utils import run_sync
+
+PARAMS = {"base_url": "http://127.0.0.1:9/v1", "api_key": "test"}
+
+
+def test_clients_are_reused_in_a_loop():
+    clients = LLMClients()
+
+    async def get_twice():
+        return clients.get("gpt-4o", **PARAMS), clients.get("gpt-4o", **PARAMS)
+
+    first, second = asyncio.run(get_twice())
+    assert first is second
+    assert clients.stats()["created"] == 1
+
+
+def test_clients_of_closed_loops_are_closed():
+    clients = LLMClients()
+
+    async def get():
+        return clients.get("gpt-4o", **PARAMS)
+
+    dropped = asyncio.run(get())
+    assert not dropped.root_async_client.is_closed()
+
+    async def get_and_wait():
+        llm = clients.get("gpt-4o", **PARAMS)
+        # let the task closing the clients of the closed loop run
+        await asyncio.sleep(0)
+        return llm
+
+    current = asyncio.run(get_and_wait())
+    assert current is not dropped
+    assert dropped.root_async_client.is_closed()
+    assert dropped.root_client.is_closed()
+    assert clients.stats()["loops"] == 1
+    assert clients.stats()["closed"] == 1
+
+
+def test_run_sync_closes_the_clients_of_its_loop():
+    closed = llm_clients.stats()["closed"]
+
+    async def get():
+        return llm_clients.get("gpt-4o", **PARAMS)
+
+    llm = run_sync(get())
+    assert llm.root_async_client.is_closed()
+    assert llm_clients.stats()["closed"] == closed + 1
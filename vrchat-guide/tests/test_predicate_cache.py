@@ -0,0 +1,72 @@
+from worksheets.environment import (
+    GenieContext,
+    GenieField,
+    GenieInterpreter,
+    PredicateCache,
+    compile_code,
+)
+
+
+def test_reuses_the_value_of_unchanged_predicates():
+    cache = PredicateCache()
+    interpreter = GenieInterpreter()
+    global_context = GenieContext({"count": 1})
+    compiled = compile_code("count == 1", "eval")
+
+    assert cache.evaluate(compiled, interpreter, global_context, GenieContext())
+    assert cache.evaluate(compiled, interpreter, global_context, GenieContext())
+    assert cache.stats()["hits"] == 1
+
+    global_context.set("count", 2)
+    assert not cache.evaluate(compiled, interpreter, global_context, GenieContext())
+
+
+def test_predicates_with_calls_are_not_cached():
+    cache = PredicateCache()
+    interpreter = GenieInterpreter()
+    calls = []
+
+    def available():
+        calls.append(True)
+        return len(calls) == 1
+
+    global_context = GenieContext({"available": available})
+    compiled = compile_code("available()", "eval")
+
+    assert cache.evaluate(compiled, interpreter, global_context, GenieContext())
+    assert not cache.evaluate(compiled, interpreter, global_context, GenieContext())
+    assert cache.stats() == {
+        "hits": 0,
+        "misses": 0,
+        "untracked": 0,
+        "hit_rate": 0.0,
+        "predicates": 0,
+    }
+
+
+def test_in_place_modifications_of_a_plain_list_are_seen():
+    cache = PredicateCache()
+    interpreter = GenieInterpreter()
+    items = ["b"]
+    global_context = GenieContext({"items": items})
+    compiled = compile_code("'a' in items", "eval")
+
+    assert not cache.evaluate(compiled, interpreter, global_context, GenieContext())
+    items.append("a")
+    assert cache.evaluate(compiled, interpreter, global_context, GenieContext())
+    assert cache.stats()["predicates"] == 0
+    assert cache.stats()["untracked"] == 2
+
+
+def test_in_place_modifications_of_a_tracked_list_are_seen():
+    cache = PredicateCache()
+    interpreter = GenieInterpreter()
+    field = GenieField("List[str]", "items", value=["b"])
+    global_context = GenieContext({"items": field.value})
+    compiled = compile_code("'a' in items", "eval")
+
+    assert not cache.evaluate(compiled, interpreter, global_context, GenieContext())
+    assert not cache.evaluate(compiled, interpreter, global_context, GenieContext())
+    assert cache.stats()["hits"] == 1
+    field.value.append("a")
+    assert cache.evaluate(compiled, interpreter, global_context, GenieContext())
@@ -0,0 +1,71 @@
+import tiktoken
+
+from worksheets.environment import Action, GenieRuntime, active_runtime
+from worksheets.from_spreadsheet import create_class
+
+
+def make_class(name, genie_type, outputs=()):
+    fields = [
+        {
+            "slottype": str,
+            "name": "name",
+            "description": "",
+            "predicate": "",
+            "actions": Action(""),
+        }
+    ]
+    _, cls = create_class(name, fields, genie_type, "", Action(""), "", [])
+    cls.outputs = list(outputs)
+    return cls
+
+
+def test_runtimes_in_one_process_keep_their_own_bot():
+    event = make_class("Event", "worksheet")
+    bots = []
+    for output in ["First", "Second"]:
+        bot = GenieRuntime(name=output, prompt_dir=None, api=[])
+        bot.add_worksheet(event)
+        bot.add_db_model(make_class("Items", "db", [make_class(output, "type")]))
+        bots.append(bot)
+
+    for bot in bots:
+        bot.execute(
+            'answer = Answer("SELECT * FROM items", {}, ["Items"], "items")\n'
+            "event = Event()\n"
+            "event_bot = event.bot\n"
+            "field_bot = event.name.bot",
+            bot.context,
+        )
+    assert active_runtime() is None
+
+    for bot in bots:
+        context = bot.context.context
+        answer = context["answer"]
+        assert [output.__name__ for output in answer.potential_outputs] == [bot.name]
+        assert context["event_bot"] is bot
+        assert context["field_bot"] is bot
+
+
+def test_sessions_of_a_runtime_are_active_while_it_runs_code():
+    bot = GenieRuntime(name="test", prompt_dir=None, api=[])
+    bot.add_worksheet(make_class("Event", "worksheet"))
+    session = bot.new_session()
+    with bot.activate(session):
+        bot.execute("event = Event()", bot.context)
+        assert bot.eval("event.bot", bot.context) is bot
+    assert "event" in session.context.context
+    assert "event" not in bot.context.context
+
+
+def test_schema_stats_without_the_token_encoding(monkeypatch):
+    def encoding_for_model(model):
+        raise ConnectionError("offline")
+
+    monkeypatch.setattr(tiktoken, "encoding_for_model", encoding_for_model)
+    bot = GenieRuntime(name="test", prompt_dir=None, api=[])
+    bot.add_worksheet(make_class("Event", "worksheet"))
+    schema = bot.semantic_parser_schema()
+
+    stats = schema.stats()
+    assert stats == {"characters": len(f"{schema.worksheets}\n{schema.dbs}")}
+    assert schema.stats(tokens=False) == stats
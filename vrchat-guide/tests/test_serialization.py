@@ -0,0 +1,131 @@
+from typing import List
+
+import pytest
+
+from worksheets.annotation_utils import get_agent_action_schemas, get_context_schema
+from worksheets.environment import Action, GenieContext, GenieRuntime
+from worksheets.from_spreadsheet import create_class, create_enum_class
+from worksheets.modules.agent_policy import run_agent_policy
+from worksheets.modules.dialogue import CurrentDialogueTurn
+from worksheets.serialization import (
+    CODEC_JSON,
+    CODEC_MSGPACK,
+    dump_session,
+    load_session,
+    snapshot_codec,
+)
+
+CODECS = [
+    pytest.param(CODEC_JSON, "json", id="json"),
+    pytest.param(CODEC_MSGPACK, "msgpack", id="msgpack"),
+]
+
+
+def field(name, slottype=str):
+    return {
+        "slottype": slottype,
+        "name": name,
+        "description": "",
+        "predicate": "",
+        "actions": Action(""),
+    }
+
+
+LEVEL = create_enum_class("level", ["Beginner", "Expert"])
+
+
+def build_runtime():
+    bot = GenieRuntime(name="test", prompt_dir=None, api=[])
+    _, profile = create_class(
+        "Profile",
+        [field("username"), field("level", LEVEL)],
+        "worksheet",
+        "",
+        Action(""),
+        "",
+        [],
+    )
+    _, event = create_class(
+        "Event",
+        [field("event_name"), field("host", profile), field("tags", List[str])],
+        "worksheet",
+        "",
+        Action(""),
+        "",
+        [],
+    )
+    bot.add_worksheet(profile)
+    bot.add_worksheet(event)
+    return bot
+
+
+USER_TARGETS = [
+    'profile = Profile(username="ada", level=level.Expert)',
+    'event_1 = Event(event_name="party", host=profile)',
+    'event_1.tags = ["music", "games"]',
+    'profile.username = "grace"',
+]
+
+
+def run_turn(bot, user_target):
+    current_dlg_turn = CurrentDialogueTurn(user_target=user_target)
+    current_dlg_turn.context = GenieContext()
+    current_dlg_turn.global_context = GenieContext()
+    bot.context.reset_agent_acts()
+    run_agent_policy(current_dlg_turn, bot)
+    bot.dlg_history.append(current_dlg_turn)
+
+
+def describe(bot):
+    return (
+        get_context_schema(bot.context),
+        [
+            (
+                turn.user_target,
+                get_context_schema(turn.context),
+                get_context_schema(turn.global_context),
+                get_agent_action_schemas(turn.system_action),
+            )
+            for turn in bot.dlg_history
+        ],
+        [repr(action) for action in bot.order_of_actions],
+    )
+
+
+def describe_in(bot, session):
+    with bot.activate(session):
+        return describe(bot)
+
+
+@pytest.mark.parametrize("codec, codec_name", CODECS)
+def test_restored_session_continues_identically(codec, codec_name):
+    if codec == CODEC_MSGPACK:
+        pytest.importorskip("msgpack")
+    bot = build_runtime()
+    session = bot.new_session()
+    with bot.activate(session):
+        bot.context.set("level", LEVEL)
+        for user_target in USER_TARGETS[:-1]:
+            run_turn(bot, user_target)
+        snapshot = dump_session(bot, codec=codec)
+    assert snapshot_codec(snapshot) == codec_name
+
+    restored_bot = build_runtime()
+    restored = load_session(restored_bot, snapshot)
+    with restored_bot.activate(restored):
+        assert describe(restored_bot) == describe_in(bot, session)
+        assert len(restored_bot.dlg_history) == 3
+        assert restored_bot.order_of_actions
+
+        event = restored_bot.context.context["event_1"]
+        profile = restored_bot.context.context["profile"]
+        assert event.host.value is profile
+        assert profile.level.value is LEVEL.Expert
+        assert event.tags.value == ["music", "games"]
+
+        run_turn(restored_bot, USER_TARGETS[-1])
+        assert event.host.value.username.value == "grace"
+    with bot.activate(session):
+        run_turn(bot, USER_TARGETS[-1])
+
+    assert describe_in(restored_bot, restored) == describe_in(bot, session)
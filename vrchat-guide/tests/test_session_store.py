@@ -0,0 +1,55 @@
+import pytest
+
+from worksheets.environment import Action, GenieRuntime
+from worksheets.from_spreadsheet import create_class
+from worksheets.session_store import SessionStore, resident_size
+
+
+@pytest.fixture
+def bot():
+    bot = GenieRuntime(name="test", prompt_dir=None, api=[])
+    fields = [
+        {
+            "slottype": str,
+            "name": "event_name",
+            "description": "",
+            "predicate": "",
+            "actions": Action(""),
+        }
+    ]
+    _, ws = create_class("Event", fields, "worksheet", "", Action(""), "", [])
+    bot.add_worksheet(ws)
+    return bot
+
+
+def add_turn(bot, text):
+    bot.execute(f'event = Event(event_name="{text}")', bot.context, sp=True)
+    bot.dlg_history.append(text * 100)
+
+
+def test_size_grows_with_the_turns(bot, tmp_path):
+    store = SessionStore(bot, str(tmp_path / "sessions.db"), measure_every=4)
+    sizes = []
+    for turn in range(10):
+        with store.activate("a") as session:
+            add_turn(bot, f"turn {turn}")
+        sizes.append(store.stats()["resident_bytes"])
+    assert sizes[-1] > 4 * sizes[0]
+    # The estimate between two measures is close to the measured size
+    assert abs(sizes[-1] - resident_size(session)) < 0.2 * sizes[-1]
+    store.close()
+
+
+def test_evicted_sessions_are_restored(bot, tmp_path):
+    store = SessionStore(bot, str(tmp_path / "sessions.db"), max_bytes=1)
+    for session_id in ["a", "b", "c"]:
+        with store.activate(session_id):
+            add_turn(bot, session_id)
+
+    stats = store.stats()
+    assert stats["resident_sessions"] == 0
+    assert stats["stored_sessions"] == 3
+    with store.activate("b"):
+        assert bot.dlg_history == ["b" * 100]
+        assert bot.context.context["event"].event_name.value == "b"
+    store.close()